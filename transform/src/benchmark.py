@@ -0,0 +1,241 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+
+from .calculations import (
+    build_coupon_table,
+    calculate_coupon_multiplier,
+    calculate_credits,
+    calculate_credits_capacity,
+    calculate_credits_usage,
+    calculate_scenarios,
+    calculate_scenarios_for_company,
+    resolve_coupons,
+)
+from .main import etl_pipeline, load_inputs, merge_inputs
+from .synthetic import generate_dataset
+
+# --- Benchmark Harness ---
+#
+# Generates a synthetic data/ directory per scale (number of organizations, see synthetic.py)
+# and times the calculation functions and the end-to-end pipeline on it. Every benchmark
+# records its wall time (best of --repeat runs), rows processed, throughput and the
+# tracemalloc peak of one extra run. The row-wise reference functions are only run on the
+# first ROWWISE_SAMPLE rows, since they take minutes at large scales. Loading the inputs is
+# benchmarked as Python objects and as compact columns (compact.py), each with the memory
+# the loaded frames retain.
+#
+#   python -m src.benchmark --scales 1000 10000 100000 --output bench.json
+#   python -m src.benchmark --scales 10000 --baseline bench.json
+#
+# With --workers 1 2 4, etl_pipeline() is also run with each number of worker processes
+# and its speedup over the serial run is recorded.
+#
+# With --baseline, any benchmark whose throughput dropped by more than --threshold
+# against the same benchmark and scale in the baseline is reported as a regression
+# and the command exits with status 1.
+
+DEFAULT_SCALES = [1_000, 10_000, 100_000]
+ROWWISE_SAMPLE = 20_000
+DEFAULT_THRESHOLD = 0.2
+
+
+def _measure(func: Callable[[], object], rows: int, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    # Peak memory from a separate run, since tracing slows the timed runs down
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    func()
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    if not already_tracing:
+        tracemalloc.stop()
+
+    wall_s = min(timings)
+    return {
+        "rows": rows,
+        "wall_s": round(wall_s, 4),
+        "rows_per_s": round(rows / wall_s, 1) if wall_s > 0 else None,
+        "peak_mb": round(peak / 2**20, 2),
+    }
+
+
+def _retained_mb(func: Callable[[], object]) -> float:
+    # Memory still allocated by func's result once it returns
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    result = func()
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del result
+    return round(retained / 2**20, 2)
+
+
+def run_scale(n_orgs: int, repeat: int = 3, seed: int = 0, workers: tuple[int, ...] = (1,)) -> dict:
+    """
+    Benchmarks every function on a synthetic dataset with n_orgs organizations,
+    and etl_pipeline() once per number of worker processes in workers.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="migrate-bench-") as tmp:
+        data_path = Path(tmp)
+        generate_dataset(data_path, n_orgs, seed=seed)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            inputs = load_inputs(data_path, skip_unchanged=False)
+            merged_df = merge_inputs(inputs)
+        orgs_df = inputs["orgs"]
+        subs_df = inputs["subs"]
+        coupon_ids = subs_df["discounts"].map(list) + subs_df["subscription_discounts"].map(list)
+        coupons_map = {c["id"]: c for c in inputs["coupons"].to_dict("records")}
+        coupon_table = build_coupon_table(inputs["coupons"])
+
+        companies_sample = merged_df.head(ROWWISE_SAMPLE)
+        orgs_sample = orgs_df.head(ROWWISE_SAMPLE)
+        coupon_ids_sample = coupon_ids.head(ROWWISE_SAMPLE)
+
+        def credits_rowwise():
+            orgs_sample.apply(calculate_credits_usage, axis=1)
+            orgs_sample.apply(calculate_credits_capacity, axis=1)
+
+        def load(compact):
+            def run():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    return load_inputs(data_path, skip_unchanged=False, compact=compact)
+
+            return run
+
+        def pipeline(n_workers):
+            def run():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    etl_pipeline(data_path, skip_unchanged=False, workers=n_workers)
+
+            return run
+
+        benchmarks = {
+            "load_inputs_objects": (load(False), n_orgs),
+            "load_inputs_compact": (load(True), n_orgs),
+            "scenarios_rowwise": (
+                lambda: companies_sample.apply(calculate_scenarios_for_company, axis=1),
+                len(companies_sample),
+            ),
+            "scenarios": (lambda: calculate_scenarios(merged_df), len(merged_df)),
+            "credits_rowwise": (credits_rowwise, len(orgs_sample)),
+            "credits": (lambda: calculate_credits(orgs_df), len(orgs_df)),
+            "coupons_rowwise": (
+                lambda: [calculate_coupon_multiplier(ids, coupons_map) for ids in coupon_ids_sample],
+                len(coupon_ids_sample),
+            ),
+            "coupons": (lambda: resolve_coupons(coupon_ids, coupon_table), len(coupon_ids)),
+        }
+        # The pipeline writes its snapshot, but repeated runs are not incremental unless asked
+        for n_workers in sorted(set(workers) | {1}):
+            name = "etl_pipeline" if n_workers == 1 else f"etl_pipeline_workers_{n_workers}"
+            benchmarks[name] = (pipeline(n_workers), n_orgs)
+
+        for name, (func, rows) in benchmarks.items():
+            results[name] = _measure(func, rows, 1 if name.startswith("etl_pipeline") else repeat)
+            if name.startswith("load_inputs_"):
+                results[name]["retained_mb"] = _retained_mb(func)
+            if name.startswith("etl_pipeline_workers_"):
+                results[name]["speedup"] = round(
+                    results["etl_pipeline"]["wall_s"] / results[name]["wall_s"], 2
+                )
+            print(
+                f"  {n_orgs:>10} orgs  {name:<20} {results[name]['wall_s']:>9.4f}s"
+                f"  {results[name]['rows_per_s'] or 0:>14,.0f} rows/s  {results[name]['peak_mb']:>9.2f} MB"
+            )
+    return results
+
+
+def find_regressions(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list[str]:
+    """
+    Benchmarks whose throughput fell by more than threshold (a fraction) against the baseline.
+    """
+    regressions = []
+    for scale, benchmarks in results["scales"].items():
+        for name, result in benchmarks.items():
+            previous = baseline.get("scales", {}).get(scale, {}).get(name)
+            if not previous or not previous.get("rows_per_s") or not result["rows_per_s"]:
+                continue
+            change = result["rows_per_s"] / previous["rows_per_s"] - 1
+            if change < -threshold:
+                regressions.append(
+                    f"{name} at {scale} orgs: {previous['rows_per_s']:,.0f} -> "
+                    f"{result['rows_per_s']:,.0f} rows/s ({change:+.0%})"
+                )
+    return regressions
+
+
+def main():
+    """Main"""
+    parser = argparse.ArgumentParser(description="Benchmark the migration analysis at several scales.")
+    parser.add_argument(
+        "--scales",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SCALES,
+        help="numbers of organizations to generate synthetic data for",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[1],
+        help="worker process counts to run etl_pipeline() with (e.g. 1 2 4)",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark (best is kept)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the results as JSON to this file")
+    parser.add_argument("--baseline", type=Path, help="results JSON of an earlier run to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="throughput drop (fraction) reported as a regression (default: 0.2)",
+    )
+    args = parser.parse_args()
+
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "scales": {},
+    }
+    for n_orgs in args.scales:
+        print(f"Benchmarking {n_orgs} organizations...")
+        results["scales"][str(n_orgs)] = run_scale(
+            n_orgs, args.repeat, args.seed, tuple(args.workers)
+        )
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        regressions = find_regressions(results, json.loads(args.baseline.read_text()), args.threshold)
+        if regressions:
+            print("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+            raise SystemExit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+
+from .compact import arrow_dtype
+from .validation import file_hash
+
+# --- Columnar Input Cache ---
+#
+# Each validated, normalized input frame is stored as an uncompressed Arrow IPC (Feather)
+# file named after the source file, its content hash and a schema fingerprint, e.g.
+#   processed_organizations-<sha256[:16]>-<schema>.arrow
+# A later run with the same source bytes and the same model memory-maps the cached columns
+# instead of parsing and validating the JSON again. Changing either the file or the model
+# produces a new key. Entries of several schemas of one source (e.g. all companies and the
+# active ones) live side by side; writing an entry removes the entries of the same source
+# and schema for other contents of the file.
+
+CACHE_VERSION = 1
+CACHE_SUFFIX = ".arrow"
+
+
+def cache_schema(*parts) -> str:
+    """
+    Fingerprint of whatever defines the shape of a cached frame
+    (e.g. a models.py schema fingerprint, a column list or a filter name).
+    """
+    text = json.dumps([CACHE_VERSION, *parts], sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def cache_path(cache_dir: Path, file_path: Path, schema: str, digest: str | None = None) -> Path:
+    """
+    Location of the cache entry for a source file with the given schema. digest is the
+    file's file_hash, computed here if the caller does not have it yet.
+    """
+    digest = (digest or file_hash(file_path))[:16]
+    return cache_dir / f"{Path(file_path).stem}-{digest}-{schema}{CACHE_SUFFIX}"
+
+
+def _write_atomic(df: pd.DataFrame, path: Path):
+    tmp_path = path.with_name(path.name + ".tmp")
+    df.reset_index(drop=True).to_feather(tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+
+def load_cached(
+    file_path: Path,
+    schema: str,
+    loader: Callable[[], tuple[pd.DataFrame, list]],
+    cache_dir: Path | None,
+    rebuild: bool = False,
+    json_columns: tuple[str, ...] = (),
+    digest: str | None = None,
+) -> tuple[pd.DataFrame, list]:
+    """
+    Returns the cached frame for file_path if present, otherwise calls loader() and caches
+    its result. Like load_model, loader returns the frame and its validation rejects; frames
+    with rejects are not cached so that the rejects are reported again on the next run.
+    json_columns hold dicts of varying keys (e.g. Stripe metadata) and are stored as JSON text.
+    Pass cache_dir=None to bypass the cache, or rebuild=True to refresh it. Pass the file's
+    file_hash as digest if it is already known (e.g. for the validation manifest), so that
+    the file is not read twice, or a hash over every file the frame is built from.
+    """
+    if cache_dir is None:
+        return loader()
+
+    path = cache_path(cache_dir, file_path, schema, digest)
+    if path.exists() and not rebuild:
+        from pyarrow import feather
+
+        df = feather.read_table(path, memory_map=True).to_pandas(types_mapper=arrow_dtype)
+        for column in json_columns:
+            df[column] = df[column].map(json.loads)
+        return df, []
+
+    df, rejects = loader()
+    if rejects:
+        return df, rejects
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # Only the same schema for older contents of the file: other schemas are other frames
+    for stale in cache_dir.glob(f"{Path(file_path).stem}-{'?' * 16}-{schema}{CACHE_SUFFIX}"):
+        if stale != path:
+            stale.unlink()
+
+    stored = df.copy(deep=False)
+    for column in json_columns:
+        stored[column] = stored[column].map(json.dumps)
+    _write_atomic(stored, path)
+    return df, rejects
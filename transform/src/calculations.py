@@ -1,57 +1,21 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
 import pandas as pd
 
+from .compact import list_values
+from .price_book import load_price_book, normalize_monthly, plans_dict
+
 # --- 1. Constants and Pricing Plans ---
 
 GUARDRAIL_ORG_COUNT = False
 
-# Using dictionaries for plans. Prices are in cents, matching the source data.
-BRAND_PLANS = {
-    "starter": {
-        "price": 89,
-        "credits": 3560,
-        "price_per_credit": 89 / 3560,
-        "min_amount": 1,
-        "max_org_count": 1,
-    },
-    "pro": {
-        "price": 199,
-        "credits": 14925,
-        "price_per_credit": 199 / 14925,
-        "min_amount": 1,
-        "max_org_count": 3,
-    },
-    "enterprise": {
-        "price": 499,
-        "credits": 49900,
-        "price_per_credit": 499 / 49900,
-        "min_amount": 1,
-        "max_org_count": 5,
-    },
-}
-
-AGENCY_PLANS = {
-    "intro": {
-        "price": 89,
-        "credits": 2250,
-        "price_per_credit": 89 / 2250,
-        "min_amount": 1,
-        "max_org_count": 10,
-    },
-    "growth": {
-        "price": 199,
-        "credits": 12935,
-        "price_per_credit": 199 / 12935,
-        "min_amount": 1,
-        "max_org_count": 30,
-    },
-    "scale": {
-        "price": 499,
-        "credits": 37425,
-        "price_per_credit": 499 / 37425,
-        "min_amount": 1,
-        "max_org_count": 50,
-    },
-}
+# The plans come from the price book (price_book.json, see price_book.py): monthly prices in
+# euros (the unit of current_mrr, not cents), for the default currency and monthly billing.
+PRICE_BOOK = load_price_book()
+BRAND_PLANS = plans_dict(PRICE_BOOK, "brand_plans")
+AGENCY_PLANS = plans_dict(PRICE_BOOK, "agency_plans")
 
 MODEL_ID_PRICE_MAP = {
     "gpt-4o": 1,
@@ -70,6 +34,14 @@ MODEL_ID_PRICE_MAP = {
     "gpt-3-5-turbo": 1,
 }
 
+RUNS_PER_MONTH = 30
+
+# Whether long-term amount_off coupons are deducted from MRR (converted to a monthly amount).
+APPLY_AMOUNT_OFF = True
+
+# Length of a Stripe billing interval in months, used to spread amount_off coupons per month.
+INTERVAL_MONTHS = PRICE_BOOK["interval_months"]
+
 # --- 2. Core Calculation Logic ---
 
 
@@ -129,23 +101,444 @@ def calculate_scenarios_for_company(company_data: pd.Series) -> pd.Series:
     return pd.Series(result)
 
 
+def compile_plans(plans: dict) -> dict:
+    """
+    Compiles a plans dictionary (e.g. BRAND_PLANS) into NumPy arrays, one entry per plan,
+    so that plan selection can be evaluated for many companies at once.
+    """
+    return {
+        "plan_name": np.array([f"{name} ({p['credits']})" for name, p in plans.items()], dtype=object),
+        "price": np.array([p["price"] for p in plans.values()], dtype=float),
+        "credits": np.array([p["credits"] for p in plans.values()], dtype=float),
+        "price_per_credit": np.array(
+            [p.get("price_per_credit", p["price"] / p["credits"]) for p in plans.values()], dtype=float
+        ),
+        "min_amount": np.array([p["min_amount"] for p in plans.values()], dtype=float),
+        "max_org_count": np.array([p["max_org_count"] for p in plans.values()], dtype=float),
+    }
+
+
+def plan_costs(
+    credits_capacity: np.ndarray,
+    orgs_count: np.ndarray,
+    plan_table: dict,
+    guardrail_org_count,
+) -> dict:
+    """
+    Every plan option of every company against a compiled plan table: whether the org count
+    guardrail allows the plan, the extra credits bought on top of it and its monthly cost.
+    Arrays have a trailing plan axis; see select_plans for the shapes.
+    """
+    plan_dims = plan_table["price"].ndim
+    capacity = np.asarray(credits_capacity, dtype=float).reshape(-1, *([1] * plan_dims))
+    orgs = np.asarray(orgs_count, dtype=float).reshape(-1, *([1] * plan_dims))
+    guardrail = np.asarray(guardrail_org_count, dtype=bool)[..., None]
+
+    # Filter plans based on the number of organizations
+    allowed = ~guardrail | (plan_table["max_org_count"] >= orgs)
+
+    # If no plan can support the org count, fall back to the one with the highest org count capacity.
+    plan_index = np.arange(plan_table["price"].shape[-1])
+    largest_plan = np.argmax(plan_table["max_org_count"], axis=-1)[..., None] == plan_index
+    allowed = allowed | (~allowed.any(axis=-1, keepdims=True) & largest_plan)
+
+    extra_credits = np.maximum(0, capacity - plan_table["credits"])
+    min_amount = plan_table["min_amount"]
+    extra_credits = np.where(
+        (extra_credits > 0) & (extra_credits < min_amount), min_amount, extra_credits
+    )
+
+    return {
+        "allowed": allowed,
+        "extra_credits": extra_credits,
+        "cost": plan_table["price"] + extra_credits * plan_table["price_per_credit"],
+    }
+
+
+def select_plans(
+    credits_capacity: np.ndarray,
+    orgs_count: np.ndarray,
+    plan_table: dict,
+    guardrail_org_count,
+) -> dict:
+    """
+    Picks the least-cost plan for every company against a compiled plan table.
+    Mirrors calculate_scenarios_for_company, but evaluates companies x plans in one pass.
+
+    The plan arrays are either 1-D (plans) or 2-D (price books x plans); in the latter case
+    guardrail_org_count may be an array with one flag per price book and every result gains
+    a price book axis after the company axis.
+    Returns arrays of the chosen plan index, cost, extra credits and surplus credits.
+    """
+    options = plan_costs(credits_capacity, orgs_count, plan_table, guardrail_org_count)
+    capacity = np.asarray(credits_capacity, dtype=float).reshape(-1, *([1] * plan_table["price"].ndim))
+    extra_credits = options["extra_credits"]
+    cost = np.where(options["allowed"], options["cost"], np.inf)
+
+    best = np.argmin(cost, axis=-1)[..., None]
+    best_extra = np.take_along_axis(extra_credits, best, axis=-1)[..., 0]
+    best_credits = np.take_along_axis(
+        np.broadcast_to(plan_table["credits"], cost.shape), best, axis=-1
+    )[..., 0]
+
+    return {
+        "plan_index": best[..., 0],
+        "cost": np.take_along_axis(cost, best, axis=-1)[..., 0],
+        "extra_credits": best_extra,
+        "surplus_credits": best_credits + best_extra - capacity[..., 0],
+    }
+
+
+def plan_table_fingerprint(plan_table: dict, guardrail_org_count) -> str:
+    """
+    Hash of everything in a compiled plan table (or stack of tables) that plan selection
+    depends on: the numeric plan arrays and the guardrail flag(s).
+    """
+    digest = hashlib.sha256()
+    for field in ("price", "credits", "price_per_credit", "min_amount", "max_org_count"):
+        values = np.ascontiguousarray(plan_table[field], dtype=float)
+        digest.update(f"{field}{values.shape}".encode())
+        digest.update(values.tobytes())
+    digest.update(np.asarray(guardrail_org_count, dtype=bool).tobytes())
+    return digest.hexdigest()[:16]
+
+
+class ScenarioMemo:
+    """
+    Memoized select_plans. A company's plan only depends on its credits_capacity and
+    orgs_count (and the price book), and many companies share both, so every distinct pair
+    is evaluated once per price book and the result is broadcast back to its companies.
+    Results are kept for the max_books most recently used price book fingerprints;
+    rows, distinct and evaluated count the lookups since the last reset_stats().
+    """
+
+    def __init__(self, max_books: int = 16):
+        self.max_books = max_books
+        self.books = OrderedDict()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.rows = 0
+        self.distinct = 0
+        self.evaluated = 0
+
+    def stats(self) -> dict:
+        return {
+            "memo_rows": self.rows,
+            "memo_distinct": self.distinct,
+            "memo_evaluated": self.evaluated,
+            "memo_hit_rate": round(1 - self.evaluated / self.rows, 4) if self.rows else None,
+        }
+
+    def lookup(
+        self,
+        credits_capacity: np.ndarray,
+        orgs_count: np.ndarray,
+        plan_table: dict,
+        guardrail_org_count,
+        chunk_size: int | None = None,
+    ) -> tuple[dict, np.ndarray]:
+        """
+        Returns the memoized select_plans results and, for every company, its position in
+        them: results[field][positions] equals select_plans(...)[field]. Missing pairs are
+        evaluated in chunks of chunk_size.
+        """
+        keys = pd.MultiIndex.from_arrays(
+            [np.asarray(credits_capacity, dtype=float), np.asarray(orgs_count, dtype=float)]
+        )
+        codes, unique = pd.factorize(keys)
+
+        fingerprint = plan_table_fingerprint(plan_table, guardrail_org_count)
+        book = self.books.get(fingerprint)
+        if book is None:
+            book = self.books[fingerprint] = {"keys": unique[:0], "results": None}
+            if len(self.books) > self.max_books:
+                self.books.popitem(last=False)
+        self.books.move_to_end(fingerprint)
+
+        positions = book["keys"].get_indexer(unique)
+        missing = np.flatnonzero(positions == -1)
+        if len(missing):
+            new_keys = unique[missing]
+            capacity = new_keys.get_level_values(0).to_numpy()
+            orgs = new_keys.get_level_values(1).to_numpy()
+            step = chunk_size or max(len(missing), 1)
+            chunks = [
+                select_plans(
+                    capacity[start : start + step],
+                    orgs[start : start + step],
+                    plan_table,
+                    guardrail_org_count,
+                )
+                for start in range(0, len(missing), step)
+            ]
+            if book["results"] is not None:
+                chunks.insert(0, book["results"])
+            book["results"] = {
+                field: np.concatenate([chunk[field] for chunk in chunks]) for field in chunks[0]
+            }
+            positions[missing] = len(book["keys"]) + np.arange(len(missing))
+            book["keys"] = book["keys"].append(new_keys)
+
+        self.rows += len(codes)
+        self.distinct += len(unique)
+        self.evaluated += len(missing)
+        return book["results"], positions[codes]
+
+    def select(
+        self,
+        credits_capacity: np.ndarray,
+        orgs_count: np.ndarray,
+        plan_table: dict,
+        guardrail_org_count,
+    ) -> dict:
+        """
+        Drop-in equivalent of select_plans, evaluated once per distinct input pair.
+        """
+        results, positions = self.lookup(
+            credits_capacity, orgs_count, plan_table, guardrail_org_count
+        )
+        return {field: values[positions] for field, values in results.items()}
+
+
+def calculate_scenarios(
+    companies_df: pd.DataFrame, memo: ScenarioMemo | None = None
+) -> pd.DataFrame:
+    """
+    Vectorized equivalent of applying calculate_scenarios_for_company to every row.
+    Returns a DataFrame with the same columns, aligned on the index of companies_df.
+    Plans are selected through memo (a new ScenarioMemo if None), so that companies
+    with the same scenario inputs are evaluated once.
+    """
+    if memo is None:
+        memo = ScenarioMemo()
+    is_brand = (companies_df["type"] == "IN_HOUSE").to_numpy()
+    credits_capacity = companies_df["credits_capacity"].to_numpy(dtype=float)
+    orgs_count = companies_df["orgs_count"].to_numpy(dtype=float)
+    current_mrr = companies_df["current_mrr"].to_numpy(dtype=float)
+
+    plan_name = np.empty(len(companies_df), dtype=object)
+    cost = np.zeros(len(companies_df))
+    extra_credits = np.zeros(len(companies_df))
+    surplus_credits = np.zeros(len(companies_df))
+
+    for mask, plans in ((is_brand, BRAND_PLANS), (~is_brand, AGENCY_PLANS)):
+        if not mask.any():
+            continue
+        plan_table = compile_plans(plans)
+        selected = memo.select(
+            credits_capacity[mask], orgs_count[mask], plan_table, GUARDRAIL_ORG_COUNT
+        )
+        plan_name[mask] = plan_table["plan_name"][selected["plan_index"]]
+        cost[mask] = selected["cost"]
+        extra_credits[mask] = selected["extra_credits"]
+        surplus_credits[mask] = selected["surplus_credits"]
+
+    return pd.DataFrame(
+        {
+            "plan_name": plan_name,
+            "mrr": np.trunc(cost).astype(int),
+            "mrr_change": np.trunc(cost - current_mrr).astype(int),
+            "arr_change": np.trunc((cost - current_mrr) * 12).astype(int),
+            "extra_credits_purchased": np.trunc(extra_credits).astype(int),
+            "surplus_credits": np.trunc(surplus_credits).astype(int),
+        },
+        index=companies_df.index,
+    )
+
+
 def calculate_credits_usage(row: pd.Series) -> int:
     """
     Calculates the required credits for a given row (organization) based on model usage and run frequency.
     """
-    runs_per_month = 30
-
     model_prices = [MODEL_ID_PRICE_MAP.get(mid, 0) for mid in row["model_ids"]]
-    return int(sum(model_prices) * row["prompts_count"] * runs_per_month)
+    return int(sum(model_prices) * row["prompts_count"] * RUNS_PER_MONTH)
 
 def calculate_credits_capacity(row: pd.Series) -> int:
     """
     Calculates the required credits for a given row (organization) based on prompt capacity and run frequency.
     """
-    runs_per_month = 30
-
     model_prices = [MODEL_ID_PRICE_MAP.get(mid, 0) for mid in row["model_ids"]]
-    return int(sum(model_prices) * row["prompt_limit"] * runs_per_month)
+    return int(sum(model_prices) * row["prompt_limit"] * RUNS_PER_MONTH)
+
+def build_model_price_index(model_ids: pd.Series) -> dict:
+    """
+    Explodes the per-organization model_ids lists once into CSR-style arrays:
+    offsets[i]:offsets[i + 1] are the positions of organization i's models in model_codes,
+    and model_codes index into model_ids. Prices come from MODEL_ID_PRICE_MAP; model IDs
+    missing from the map are priced at 0 and counted in unknown_model_count.
+    """
+    lengths, flat_ids = list_values(model_ids)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    model_codes, unique_ids = pd.factorize(flat_ids)
+
+    unique_prices = pd.Series(unique_ids).map(MODEL_ID_PRICE_MAP).to_numpy(dtype=float)
+    unknown = np.isnan(unique_prices)
+    unique_prices[unknown] = 0
+
+    org_index = np.repeat(np.arange(len(lengths)), lengths)
+    return {
+        "offsets": offsets,
+        "model_codes": model_codes,
+        "model_ids": np.asarray(unique_ids, dtype=object),
+        "model_price_sum": np.bincount(
+            org_index, weights=unique_prices[model_codes], minlength=len(lengths)
+        ),
+        "unknown_model_count": np.bincount(
+            org_index, weights=unknown[model_codes], minlength=len(lengths)
+        ).astype(int),
+        "unknown_model_ids": sorted(unique_ids[unknown]),
+    }
+
+
+def calculate_credits(orgs_df: pd.DataFrame, model_index: dict | None = None) -> pd.DataFrame:
+    """
+    Vectorized equivalent of calculate_credits_usage and calculate_credits_capacity.
+    Returns credits_usage, credits_capacity and unknown_model_count per organization,
+    aligned on the index of orgs_df.
+    """
+    if model_index is None:
+        model_index = build_model_price_index(orgs_df["model_ids"])
+    model_price_sum = model_index["model_price_sum"]
+
+    credits_usage = model_price_sum * orgs_df["prompts_count"].to_numpy() * RUNS_PER_MONTH
+    credits_capacity = model_price_sum * orgs_df["prompt_limit"].to_numpy() * RUNS_PER_MONTH
+
+    return pd.DataFrame(
+        {
+            "credits_usage": np.trunc(credits_usage).astype(int),
+            "credits_capacity": np.trunc(credits_capacity).astype(int),
+            "unknown_model_count": model_index["unknown_model_count"],
+        },
+        index=orgs_df.index,
+    )
+
+
+def build_coupon_table(coupons) -> pd.DataFrame:
+    """
+    Builds a typed coupon table indexed by coupon id from the stripe_coupons.json records
+    (a list of dicts or a DataFrame).
+    A coupon is long-term if it is forever or repeating for 12+ months; only long-term
+    coupons are accounted for in the MRR.
+    """
+    table = pd.DataFrame(
+        coupons, columns=["id", "percent_off", "amount_off", "duration", "duration_in_months"]
+    )
+    table = table.drop_duplicates("id", keep="last").set_index("id")
+
+    table["percent_off"] = pd.to_numeric(table["percent_off"]).fillna(0).astype(float)
+    table["amount_off"] = pd.to_numeric(table["amount_off"]).fillna(0).astype(float)
+    table["duration_in_months"] = pd.to_numeric(table["duration_in_months"]).astype(float)
+    table["long_term"] = (table["duration"] == "forever") | (
+        (table["duration"] == "repeating") & (table["duration_in_months"] >= 12)
+    )
+    table["duration"] = table["duration"].astype("category")
+    return table
+
+
+def resolve_coupons(coupon_ids: pd.Series, coupon_table: pd.DataFrame) -> pd.DataFrame:
+    """
+    Vectorized equivalent of calling calculate_coupon_multiplier on every list in coupon_ids.
+    Returns multiplier, amount_off (summed over long-term coupons, in cents per billing
+    interval), long_term_count and total_count, aligned on the index of coupon_ids.
+    """
+    lengths, flat_ids = list_values(coupon_ids)
+    exploded = pd.DataFrame(
+        {"row": np.repeat(np.arange(len(lengths)), lengths), "coupon_id": flat_ids}
+    )
+    matched = exploded.join(coupon_table, on="coupon_id", how="inner")
+    matched["percent_off"] = matched["percent_off"].where(matched["long_term"], 0)
+    matched["amount_off"] = matched["amount_off"].where(matched["long_term"], 0)
+
+    resolved = (
+        matched.groupby("row")
+        .agg(
+            percent_off=("percent_off", "sum"),
+            amount_off=("amount_off", "sum"),
+            long_term_count=("long_term", "sum"),
+            total_count=("coupon_id", "size"),
+        )
+        .reindex(np.arange(len(lengths)), fill_value=0)
+    )
+
+    # Percent discounts stack additively (e.g., 10% + 20% = 30% off)
+    return pd.DataFrame(
+        {
+            "multiplier": (1.0 - resolved["percent_off"].to_numpy() / 100.0).clip(min=0.0),
+            "amount_off": resolved["amount_off"].to_numpy(dtype=float),
+            "long_term_count": resolved["long_term_count"].to_numpy(dtype=int),
+            "total_count": resolved["total_count"].to_numpy(dtype=int),
+        },
+        index=coupon_ids.index,
+    )
+
+
+def monthly_amount_off(amount_off: pd.Series, interval: pd.Series, interval_count: pd.Series) -> pd.Series:
+    """
+    Spreads amount_off coupons (in cents per billing interval) over a month.
+    Returns zeros when APPLY_AMOUNT_OFF is disabled.
+    """
+    if not APPLY_AMOUNT_OFF:
+        return pd.Series(0.0, index=amount_off.index)
+    return pd.Series(
+        normalize_monthly(amount_off, interval, interval_count, PRICE_BOOK), index=amount_off.index
+    )
+
+
+def _parse_product_metadata(metadata) -> tuple[str, int, str | None]:
+    # (product type, prompt limit, parse error); only WORKSPACE products have a prompt limit
+    if not isinstance(metadata, dict):
+        return "", 0, None
+
+    product_type = metadata.get("type", "")
+    if product_type != "WORKSPACE":
+        return product_type, 0, None
+
+    prompt_limit_str = metadata.get("promptLimit", "0")
+    try:
+        return product_type, int(prompt_limit_str), None
+    except (ValueError, TypeError) as e:
+        return product_type, 0, f"promptLimit {prompt_limit_str!r}: {e}"
+
+
+def build_plan_index(prices_df: pd.DataFrame, products_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per Stripe price (the plan_id of subscription items) with its product_id,
+    the product's metadata type and its prompt limit as an int (0 unless the product is
+    a WORKSPACE). Product metadata is parsed once per product; a promptLimit that is not
+    an integer counts as 0 and is described in prompt_limit_error.
+    The index holds only plain columns, so it can be stored as an Arrow file.
+    """
+    products = products_df.drop_duplicates("id")
+    parsed = pd.DataFrame(
+        [_parse_product_metadata(metadata) for metadata in products["metadata"]],
+        columns=["product_type", "prompt_limit", "prompt_limit_error"],
+        index=pd.Index(products["id"]),
+    )
+
+    plans = prices_df[["id", "product"]].drop_duplicates("id")
+    positions = parsed.index.get_indexer(plans["product"])
+    found = positions >= 0
+    return pd.DataFrame(
+        {
+            "id": plans["id"].to_numpy(),
+            "product_id": plans["product"].to_numpy(),
+            "product_type": np.where(found, parsed["product_type"].to_numpy()[positions], ""),
+            "prompt_limit": np.where(found, parsed["prompt_limit"].to_numpy()[positions], 0),
+            "prompt_limit_error": np.where(
+                found, parsed["prompt_limit_error"].to_numpy()[positions], None
+            ),
+        }
+    )
+
+
+def plan_prompt_limits(plan_ids: pd.Series, plan_index: pd.DataFrame) -> np.ndarray:
+    """
+    Prompt limit of every plan id, 0 for plans missing from the index.
+    """
+    positions = pd.Index(plan_index["id"]).get_indexer(plan_ids)
+    return np.where(positions >= 0, plan_index["prompt_limit"].to_numpy()[positions], 0)
+
 
 def calculate_coupon_multiplier(coupon_ids: list, coupons_map: dict) -> tuple[float, int, int]:
     """
@@ -0,0 +1,152 @@
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .models import MigrationOutput
+
+# --- Cohorts ---
+#
+# A cohort is a named predicate over the MigrationOutput columns, written as a pandas
+# expression (DataFrame.eval), e.g. "mrr_change < 0 and company_type == 'IN_HOUSE'".
+# Cohorts may overlap; every company is tested against every rule, and "all" holds every
+# company. The summary is computed in one pass over the output table: the membership of
+# all companies in all cohorts is one boolean matrix, sums come from one matrix product
+# with the value columns, and arr_change is sorted and binned once for the percentiles
+# and the histogram of every cohort. The summary is written to data/migrate_cohorts.json.
+#
+#   python -m src.cohorts [--output data/migrate.csv] [--cohorts cohorts.json]
+#
+# summarizes an existing output file; etl_pipeline writes the summary after every run.
+# cohorts.json maps cohort names to expressions and replaces DEFAULT_COHORTS.
+
+DEFAULT_COHORTS = {
+    "in_house": "company_type == 'IN_HOUSE'",
+    "agency": "company_type != 'IN_HOUSE'",
+    # Pay more today than the new plan costs, or less
+    "overpayers": "mrr_change < 0",
+    "underpayers": "mrr_change > 0",
+    # Configured capacity is at least twice the usage, in credits and in Stripe prompts
+    "double_overprovisioned": "credits_capacity >= 2 * credits_usage and prompt_capacity >= 2 * prompt_usage",
+    # Buy extra credits although the plan's own credits already cover their usage
+    "mrr_at_risk": "extra_credits_purchased > 0 and credits_usage <= credits_capacity + surplus_credits - extra_credits_purchased",
+    "fully_discounted": "discount >= 100",
+}
+SUM_COLUMNS = ["current_mrr", "current_arr", "mrr", "mrr_change", "arr_change", "extra_credits_purchased"]
+PERCENTILES = [5, 25, 50, 75, 95]
+HISTOGRAM_BINS = 20
+
+
+def load_cohorts(path: Path) -> dict[str, str]:
+    """
+    Reads cohort rules from a JSON object of {name: expression}.
+    """
+    cohorts = json.loads(Path(path).read_text())
+    if not isinstance(cohorts, dict) or not all(isinstance(rule, str) for rule in cohorts.values()):
+        raise ValueError(f"{path} must contain a JSON object of cohort names to expressions")
+    return cohorts
+
+
+def cohort_membership(output_df: pd.DataFrame, cohorts: dict[str, str]) -> pd.DataFrame:
+    """
+    Boolean frame with one column per cohort (plus "all"): whether each company belongs to it.
+    """
+    columns = list(MigrationOutput.model_fields)
+    table = output_df.reset_index(drop=True)[columns]
+    membership = {"all": np.ones(len(table), dtype=bool)}
+    for name, rule in cohorts.items():
+        try:
+            matches = table.eval(rule, engine="python")
+        except Exception as e:
+            raise ValueError(f"Invalid rule for cohort {name!r}: {rule!r} ({e})") from e
+        if not isinstance(matches, pd.Series) or matches.dtype != bool:
+            raise ValueError(f"Rule for cohort {name!r} is not a condition: {rule!r}")
+        membership[name] = matches.to_numpy()
+    return pd.DataFrame(membership, index=output_df.index)
+
+
+def _percentiles(sorted_values: np.ndarray) -> dict:
+    if len(sorted_values) == 0:
+        return {f"p{q}": None for q in PERCENTILES}
+    # Linear interpolation between closest ranks, like np.percentile
+    positions = np.asarray(PERCENTILES) / 100 * (len(sorted_values) - 1)
+    return {
+        f"p{q}": float(value)
+        for q, value in zip(PERCENTILES, np.interp(positions, np.arange(len(sorted_values)), sorted_values))
+    }
+
+
+def summarize_cohorts(output_df: pd.DataFrame, cohorts: dict[str, str] = DEFAULT_COHORTS) -> dict:
+    """
+    Counts, sums of SUM_COLUMNS, and arr_change percentiles and histogram per cohort.
+    """
+    membership = cohort_membership(output_df, cohorts)
+    member = membership.to_numpy()
+    counts = member.sum(axis=0)
+
+    values = output_df[SUM_COLUMNS].to_numpy(dtype=np.int64)
+    sums = member.T.astype(np.int64) @ values
+
+    arr_change = output_df["arr_change"].to_numpy(dtype=float)
+    order = np.argsort(arr_change, kind="stable")
+    sorted_arr_change = arr_change[order]
+    sorted_member = member[order]
+    edges = np.histogram_bin_edges(arr_change, bins=HISTOGRAM_BINS)
+    bins = np.clip(np.searchsorted(edges, arr_change, side="right") - 1, 0, HISTOGRAM_BINS - 1)
+
+    summary = {}
+    for j, name in enumerate(membership.columns):
+        count = int(counts[j])
+        summary[name] = {
+            "rule": cohorts.get(name),
+            "companies": count,
+            "share": round(count / len(output_df), 4) if len(output_df) else None,
+            **{f"{column}_sum": int(total) for column, total in zip(SUM_COLUMNS, sums[j])},
+            "arr_change_mean": round(sums[j][SUM_COLUMNS.index("arr_change")] / count, 2) if count else None,
+            "arr_change_percentiles": _percentiles(sorted_arr_change[sorted_member[:, j]]),
+            "arr_change_histogram": np.bincount(bins[member[:, j]], minlength=HISTOGRAM_BINS).tolist(),
+        }
+    return {
+        "companies": len(output_df),
+        "arr_change_bin_edges": [float(edge) for edge in edges],
+        "cohorts": summary,
+    }
+
+
+def write_cohort_summary(summary: dict, path: Path):
+    """
+    Writes the cohort summary as JSON.
+    """
+    path.write_text(json.dumps(summary, indent=2))
+
+
+def main():
+    """Main"""
+    data_path = Path(__file__).parent.parent.parent / "data"
+    parser = argparse.ArgumentParser(description="Summarize migrate.csv by cohort.")
+    parser.add_argument(
+        "--output", type=Path, default=data_path / "migrate.csv", help="output table to summarize (CSV or Parquet)"
+    )
+    parser.add_argument("--cohorts", type=Path, help="JSON file of cohort names to expressions")
+    parser.add_argument(
+        "--summary", type=Path, help="where to write the summary (default: migrate_cohorts.json next to --output)"
+    )
+    args = parser.parse_args()
+
+    if args.output.suffix == ".parquet":
+        output_df = pd.read_parquet(args.output)
+    else:
+        output_df = pd.read_csv(args.output, keep_default_na=False, na_values=[""])
+    cohorts = load_cohorts(args.cohorts) if args.cohorts else DEFAULT_COHORTS
+    summary = summarize_cohorts(output_df, cohorts)
+    summary_path = args.summary or args.output.with_name("migrate_cohorts.json")
+    write_cohort_summary(summary, summary_path)
+    for name, cohort in summary["cohorts"].items():
+        print(f"  {name:<24} {cohort['companies']:>8} companies  arr_change {cohort['arr_change_sum']:>14,}")
+    print(f"Cohort summary written to {summary_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import itertools
+import types
+import typing
+from typing import Type
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+# --- Compact Input Frames ---
+#
+# Validated records arrive as one Python object per value: every id, type and interval is a
+# str object and every model_ids / discounts / subscription_discounts value is a list of
+# str objects. compact_frame stores the same values in typed, contiguous columns, following
+# the model's field annotations:
+#   - repeated strings (foreign keys, enums, intervals) as pandas categoricals (codes into
+#     one array of distinct values), mostly unique strings (ids, names) as Arrow strings
+#   - List[str] fields as Arrow list arrays: one flat, dictionary-encoded value array
+#     plus offsets, see list_values
+#   - int fields as int32 and float fields as float32 when every value fits exactly, so
+#     downstream results are unchanged
+# The vectorized stages work on either representation. Arrow-backed columns survive Feather
+# files (the columnar cache and parallel partitions) when read with arrow_dtype.
+
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+
+def _list_column(values: pd.Series) -> pd.Series:
+    import pyarrow as pa
+
+    lengths, flat = list_values(values)
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int32)
+    array = pa.ListArray.from_arrays(
+        pa.array(offsets), pa.array(flat, type=pa.string()).dictionary_encode()
+    )
+    return pd.Series(pd.arrays.ArrowExtensionArray(array), index=values.index, name=values.name)
+
+
+def _string_column(values: pd.Series) -> pd.Series:
+    if values.nunique() <= CATEGORY_MAX_UNIQUE_RATIO * len(values):
+        return values.astype("category")
+    return values.astype(pd.StringDtype("pyarrow"))
+
+
+def _narrow(values: pd.Series, dtype) -> pd.Series:
+    # Downcasts only if every value round-trips exactly
+    if values.dtype == dtype:
+        return values
+    narrowed = values.astype(dtype)
+    if np.array_equal(narrowed.to_numpy(dtype=values.dtype), values.to_numpy(), equal_nan=True):
+        return narrowed
+    return values
+
+
+def compact_column(values: pd.Series, annotation) -> pd.Series:
+    """
+    Stores one column of a model-shaped frame compactly, according to its field annotation.
+    """
+    args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+    origin = typing.get_origin(annotation)
+    if origin in (typing.Union, types.UnionType) and len(args) == 1:
+        return compact_column(values, args[0])
+
+    if origin is list and args == [str]:
+        return _list_column(values)
+    if annotation is str or origin is typing.Literal:
+        return _string_column(values)
+    if annotation is int and values.dtype.kind == "i":
+        info = np.iinfo(np.int32)
+        if len(values) == 0 or (values.min() >= info.min and values.max() <= info.max):
+            return values.astype(np.int32)
+        return values
+    if annotation is float and values.dtype.kind == "f":
+        return _narrow(values, np.float32)
+    return values
+
+
+def compact_frame(df: pd.DataFrame, model: Type[BaseModel]) -> pd.DataFrame:
+    """
+    Compact copy of a frame with one column per model field (see load_model).
+    """
+    fields = model.model_fields
+    return pd.DataFrame(
+        {
+            name: compact_column(df[name], fields[name].annotation) if name in fields else df[name]
+            for name in df.columns
+        },
+        index=df.index,
+    )
+
+
+def list_values(values: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Length of every list in values and all their elements as one flat object array,
+    for a column of Python lists (or arrays) as well as for an Arrow list column.
+    """
+    if isinstance(values.dtype, pd.ArrowDtype):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        lists = values.array._pa_array
+        lengths = pc.list_value_length(lists).fill_null(0).to_numpy().astype(np.int64)
+        flat = pc.list_flatten(lists)
+        if pa.types.is_dictionary(flat.type):
+            flat = flat.cast(flat.type.value_type)
+        return lengths, flat.to_numpy(zero_copy_only=False).astype(object)
+
+    lengths = values.map(len).to_numpy(dtype=np.int64)
+    flat = np.fromiter(
+        itertools.chain.from_iterable(values), dtype=object, count=int(lengths.sum())
+    )
+    return lengths, flat
+
+
+def arrow_dtype(arrow_type):
+    """
+    types_mapper for pyarrow's to_pandas: restores the Arrow-backed columns of compact frames
+    (dictionary-encoded lists and large strings), leaving every other type to the default.
+    """
+    import pyarrow as pa
+
+    if pa.types.is_list(arrow_type) and pa.types.is_dictionary(arrow_type.value_type):
+        return pd.ArrowDtype(arrow_type)
+    if pa.types.is_large_string(arrow_type):
+        # Arrow strings are written as large_string; object columns of str as string
+        return pd.StringDtype("pyarrow")
+    return None
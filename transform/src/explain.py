@@ -0,0 +1,449 @@
+import argparse
+import contextlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+# --- Explain ---
+#
+# Answers "why does this company get this plan" for one company without running the
+# pipeline. Building the explain index loads the inputs through the columnar cache and runs
+# the pipeline's stages once over all companies (calculate_credits, resolve_coupons,
+# aggregate_customers, merge_inputs, plan_costs and build_output), then stores every
+# company's intermediates (organizations, subscription items and their coupons, customer,
+# plan options and output row) as one JSON explanation in a SQLite index, keyed by company
+# id, domain and Stripe customer id. explain then only looks the explanation up: with a
+# current index it runs on the standard library alone, without importing pandas or the
+# pipeline.
+#
+#   python -m src.main explain <company id | domain | stripe customer id> [--json] [--no-cache]
+#   python -m src.main explain --build-index
+#
+# The index is data/.explain_index.sqlite. It is (re)built when it is missing, or when any
+# input file, price_book.json or module of the pipeline (which holds the calculation
+# constants) changed size or modification time since it was built.
+
+DATA_PATH = Path(__file__).parent.parent.parent / "data"
+PRICE_BOOK_FILE = Path(__file__).parent.parent / "price_book.json"
+INDEX_FILE_NAME = ".explain_index.sqlite"
+INDEX_VERSION = 3
+SOURCE_FILES = (
+    "processed_companies.json",
+    "processed_organizations.json",
+    "stripe_subscription_items.json",
+    "stripe_coupons.json",
+    "stripe_prices.json",
+    "stripe_products.json",
+)
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE lookup (key TEXT, company_id TEXT);
+CREATE TABLE companies (id TEXT PRIMARY KEY, explanation TEXT);
+CREATE INDEX lookup_key ON lookup (key);
+"""
+
+
+def source_stats(data_path: Path) -> dict:
+    """
+    Size and modification time of every input file, the price book and the pipeline's
+    modules, to detect a stale index.
+    """
+    paths = [data_path / name for name in SOURCE_FILES] + [PRICE_BOOK_FILE]
+    paths += sorted(Path(__file__).parent.glob("*.py"))
+    stats = {}
+    for path in paths:
+        stat = path.stat() if path.exists() else None
+        stats[path.name] = [stat.st_size, stat.st_mtime_ns] if stat else None
+    return stats
+
+
+def _records(df) -> list[dict]:
+    # One JSON-compatible dict per row, with None for missing values and lists for list columns
+    import numpy as np
+    import pandas as pd
+
+    from .compact import list_values
+
+    values = {}
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, pd.ArrowDtype) or (len(series) and isinstance(series.iloc[0], list)):
+            lengths, flat = list_values(series)
+            flat = flat.tolist()
+            ends = np.cumsum(lengths).tolist()
+            values[column] = [flat[end - length : end] for length, end in zip(lengths.tolist(), ends)]
+        else:
+            values[column] = series.astype(object).where(series.notna(), None).tolist()
+    columns = list(df.columns)
+    return [dict(zip(columns, row)) for row in zip(*(values[c] for c in columns))]
+
+
+def _with_monthly_amount_off(discounts, subs):
+    from .calculations import monthly_amount_off
+
+    return discounts.assign(
+        amount_off_monthly=monthly_amount_off(discounts["amount_off"], subs["interval"], subs["interval_count"])
+    )
+
+
+def explain_inputs(inputs: dict) -> dict[str, dict]:
+    """
+    The explanation of every company, keyed by company id: the intermediates of its result,
+    computed by the pipeline's stages over all companies at once, and its output row.
+    """
+    import pandas as pd
+
+    from .calculations import (
+        AGENCY_PLANS,
+        BRAND_PLANS,
+        GUARDRAIL_ORG_COUNT,
+        PRICE_BOOK,
+        build_coupon_table,
+        build_model_price_index,
+        calculate_credits,
+        compile_plans,
+        plan_costs,
+        plan_prompt_limits,
+        resolve_coupons,
+    )
+    from .main import build_output, merge_inputs
+    from .stages import aggregate_customers
+
+    # Organizations: credits from the models' prices, prompts and runs per month
+    orgs = inputs["orgs"]
+    model_index = build_model_price_index(orgs["model_ids"])
+    orgs = pd.concat([orgs, calculate_credits(orgs, model_index)], axis=1).assign(
+        model_price_sum=model_index["model_price_sum"]
+    )
+    unknown = set(model_index["unknown_model_ids"])
+    company_orgs = {}
+    for org in _records(orgs):
+        org["unknown_model_ids"] = [m for m in org["model_ids"] if m in unknown]
+        company_orgs.setdefault(org["company_id"], []).append(org)
+
+    # Subscription items: item-level coupons per item, subscription-level coupons from the
+    # first item of each customer
+    subs = inputs["subs"]
+    coupon_table = build_coupon_table(inputs["coupons"])
+    coupons = {coupon["id"]: coupon for coupon in _records(coupon_table.reset_index())}
+    items = subs.assign(
+        base_mrr_cents=subs["mrr_cents"] * subs["quantity"],
+        prompt_limit=plan_prompt_limits(subs["plan_id"], inputs["plans"]),
+    )
+    item_discounts = _with_monthly_amount_off(resolve_coupons(subs["discounts"], coupon_table), subs)
+    customer_items = {}
+    for item, discounts in zip(_records(items), _records(item_discounts)):
+        item.update(discounts, coupons=[coupons[c] for c in item["discounts"] if c in coupons])
+        customer_items.setdefault(item["customer_id"], []).append(item)
+
+    first_items = subs[~subs["customer_id"].duplicated().to_numpy()]
+    sub_discounts = _with_monthly_amount_off(
+        resolve_coupons(first_items["subscription_discounts"], coupon_table), first_items
+    )
+    subscription_discounts = {
+        item["customer_id"]: {
+            **discounts,
+            "coupons": [coupons[c] for c in item["subscription_discounts"] if c in coupons],
+        }
+        for item, discounts in zip(
+            _records(first_items[["customer_id", "subscription_discounts"]]), _records(sub_discounts)
+        )
+    }
+    customers = {
+        customer["customer_id"]: customer
+        for customer in _records(aggregate_customers(subs, coupon_table, inputs["plans"]))
+    }
+
+    # Companies with organizations and a Stripe customer (the pipeline's inner joins)
+    merged = merge_inputs(inputs)
+    output = build_output(merged)
+    results = dict(zip(output.index.astype(object), _records(output)))
+    merged_rows = {
+        row.pop("id"): row
+        for row in _records(merged[["id", "credits_usage", "credits_capacity", "orgs_count", "orgs_count_hf"]])
+    }
+
+    # Every plan option select_plans weighs for each company, in price book order
+    options = {}
+    in_house = (merged["type"] == "IN_HOUSE").to_numpy()
+    for segment, plans in ((in_house, BRAND_PLANS), (~in_house, AGENCY_PLANS)):
+        plan_table = compile_plans(plans)
+        credits_capacity = merged["credits_capacity"].to_numpy(dtype=float)[segment]
+        costs = plan_costs(credits_capacity, merged["orgs_count"].to_numpy()[segment], plan_table, GUARDRAIL_ORG_COUNT)
+        surplus_credits = plan_table["credits"] + costs["extra_credits"] - credits_capacity[:, None]
+        plan_columns = (plan_table["plan_name"].tolist(), plan_table["price"].tolist())
+        for company_id, *company_columns in zip(
+            merged["id"].astype(object).to_numpy()[segment].tolist(),
+            costs["allowed"].tolist(),
+            costs["extra_credits"].tolist(),
+            costs["cost"].tolist(),
+            surplus_credits.tolist(),
+        ):
+            options[company_id] = [
+                {
+                    "plan_name": plan_name,
+                    "allowed": allowed,
+                    "price": price,
+                    "extra_credits": extra_credits,
+                    "cost": cost,
+                    "surplus_credits": surplus,
+                }
+                for plan_name, price, allowed, extra_credits, cost, surplus in zip(*plan_columns, *company_columns)
+            ]
+
+    explanations = {}
+    for company in _records(inputs["companies"]):
+        company_id, customer_id = company["id"], company["stripe_customer_id"]
+        explanations[company_id] = {
+            "company": company,
+            "price_book_version": PRICE_BOOK["version"],
+            "orgs": company_orgs.get(company_id, []),
+            "items": customer_items.get(customer_id, []),
+            "subscription_discounts": subscription_discounts.get(customer_id),
+            "customer": customers.get(customer_id),
+            "merged": merged_rows.get(company_id),
+            "options": options.get(company_id),
+            "result": results.get(company_id),
+        }
+    return explanations
+
+
+def build_index(data_path: Path = DATA_PATH, index_path: Path | None = None, cache_dir: Path | None = None) -> Path:
+    """
+    Loads and transforms the inputs and writes the explain index, replacing it atomically.
+    """
+    from .main import load_inputs
+
+    index_path = index_path or data_path / INDEX_FILE_NAME
+    stats = source_stats(data_path)
+    inputs = load_inputs(data_path, cache_dir=cache_dir)
+    explanations = explain_inputs(inputs)
+    print(f"Writing explain index to {index_path}...")
+
+    tmp_path = index_path.with_name(index_path.name + ".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        conn.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [
+                ("version", json.dumps(INDEX_VERSION)),
+                ("sources", json.dumps(stats)),
+                ("built_at", json.dumps(time.time())),
+            ],
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO companies VALUES (?, ?)",
+            ((company_id, json.dumps(explanation)) for company_id, explanation in explanations.items()),
+        )
+        keys = []
+        for company_id, explanation in explanations.items():
+            company = explanation["company"]
+            keys.append((company_id, company_id))
+            keys += [
+                (company[column].lower(), company_id)
+                for column in ("stripe_customer_id", "domain")
+                if company[column] is not None
+            ]
+        conn.executemany("INSERT INTO lookup VALUES (?, ?)", keys)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+def open_index(data_path: Path = DATA_PATH, rebuild: bool = False, cache_dir: Path | None = None) -> sqlite3.Connection:
+    """
+    Connection to an up-to-date explain index, building it first if needed.
+    """
+    index_path = data_path / INDEX_FILE_NAME
+    if not rebuild and index_path.exists():
+        conn = sqlite3.connect(index_path)
+        meta = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM meta")}
+        if meta.get("version") == INDEX_VERSION and meta["sources"] == source_stats(data_path):
+            return conn
+        conn.close()
+        print("Inputs or pipeline changed since the explain index was built, rebuilding it...", file=sys.stderr)
+    # Progress of the build goes to stderr, so that stdout holds only the explanation
+    with contextlib.redirect_stdout(sys.stderr):
+        build_index(data_path, index_path, cache_dir)
+    return sqlite3.connect(index_path)
+
+
+def find_companies(conn: sqlite3.Connection, key: str) -> list[str]:
+    """
+    Ids of the companies matching a company id, domain or Stripe customer id.
+    """
+    rows = conn.execute("SELECT DISTINCT company_id FROM lookup WHERE key IN (?, ?)", (key, key.lower()))
+    return [row[0] for row in rows]
+
+
+def explain_company(conn: sqlite3.Connection, company_id: str) -> dict:
+    """
+    Every intermediate of one company's result, as stored in the index.
+    """
+    (explanation,) = conn.execute("SELECT explanation FROM companies WHERE id = ?", (company_id,)).fetchone()
+    return json.loads(explanation)
+
+
+def _coupon_text(discounts: dict) -> str:
+    if not discounts["coupons"]:
+        return "none"
+    coupons = ", ".join(
+        f"{c['id']} ({c['percent_off']:g}% / {c['amount_off']:g} off, {c['duration']}"
+        f"{'' if c['long_term'] else ', not long-term'})"
+        for c in discounts["coupons"]
+    )
+    return (
+        f"{coupons} -> x{discounts['multiplier']:.4f}, {discounts['amount_off']:g} cents off "
+        f"({discounts['amount_off_monthly']:.2f} cents/month)"
+    )
+
+
+def format_explanation(explanation: dict) -> str:
+    """
+    The explanation as a plain-text report.
+    """
+    company = explanation["company"]
+    lines = [
+        f"{company['name']} ({company['id']}), {company['type']}, domain {company['domain']}, "
+        f"Stripe customer {company['stripe_customer_id']}",
+        f"Price book {explanation['price_book_version']}",
+        "",
+        f"Organizations ({len(explanation['orgs'])}):",
+    ]
+    for org in explanation["orgs"]:
+        unknown = f", unpriced models {', '.join(org['unknown_model_ids'])}" if org["unknown_model_ids"] else ""
+        lines.append(
+            f"  {org['id']}: {len(org['model_ids'])} models ({org['model_price_sum']:g} credits per prompt{unknown}), "
+            f"{org['prompts_count']} prompts / limit {org['prompt_limit']} -> "
+            f"usage {org['credits_usage']}, capacity {org['credits_capacity']} credits"
+            f"{', high frequency' if 0 < org['chat_interval_in_hours'] < 24 else ''}"
+        )
+
+    lines += ["", f"Subscription items ({len(explanation['items'])}):"]
+    for item in explanation["items"]:
+        lines.append(
+            f"  {item['plan_id']}: {item['mrr_cents']:g} x {item['quantity']} = {item['base_mrr_cents']:g} cents/month, "
+            f"{item['interval']} ({item['interval_count']}), prompt limit {item['prompt_limit']}"
+        )
+        lines.append(f"    item coupons: {_coupon_text(item)}")
+
+    customer = explanation["customer"]
+    if customer is not None:
+        lines += [
+            f"  subscription coupons: {_coupon_text(explanation['subscription_discounts'])}",
+            "",
+            f"Current MRR {customer['current_mrr']:.2f}, ARR {customer['current_arr']:.2f}, "
+            f"discount {customer['discount_pct']}%, discounts {customer['discounts_formatted']}, "
+            f"interval {customer['interval']}, prompt capacity {customer['prompt_capacity']}",
+        ]
+
+    if explanation["result"] is None:
+        lines += ["", "Not in the output: the company has no organizations or no subscription items."]
+        return "\n".join(lines)
+
+    merged = explanation["merged"]
+    lines += [
+        "",
+        f"Plan options for {merged['credits_capacity']} credits and {merged['orgs_count']} organizations:",
+    ]
+    result = explanation["result"]
+    for option in explanation["options"]:
+        marker = "*" if option["plan_name"] == result["plan_name"] else " "
+        status = "" if option["allowed"] else "  (excluded by org count)"
+        lines.append(
+            f" {marker} {option['plan_name']:<22} {option['price']:>8.2f} + {option['extra_credits']:>8g} extra credits"
+            f" = {option['cost']:>10.2f}/month, surplus {option['surplus_credits']:g}{status}"
+        )
+    lines += [
+        "",
+        f"Chosen: {result['plan_name']}, MRR {result['mrr']} ({result['mrr_change']:+d}), "
+        f"ARR change {result['arr_change']:+d}, {result['extra_credits_purchased']} extra credits, "
+        f"{result['surplus_credits']} surplus credits",
+    ]
+    return "\n".join(lines)
+
+
+def run_explain(
+    key: str | None,
+    data_path: Path = DATA_PATH,
+    cache_dir: Path | None = None,
+    as_json: bool = False,
+    build: bool = False,
+):
+    """
+    The explain command of main.py: prints the explanation of the company matching key,
+    (re)building the index first if build is set or it is out of date.
+    """
+    if build:
+        print(f"Explain index written to {build_index(data_path, cache_dir=cache_dir)}")
+        if not key:
+            return
+
+    conn = open_index(data_path, cache_dir=cache_dir)
+    try:
+        company_ids = find_companies(conn, key)
+        if not company_ids:
+            sys.exit(f"No company with id, domain or Stripe customer id {key!r}")
+        if len(company_ids) > 1:
+            sys.exit(f"{key!r} matches several companies, use one of their ids: {', '.join(company_ids)}")
+        explanation = explain_company(conn, company_ids[0])
+    finally:
+        conn.close()
+    print(json.dumps(explanation, indent=2) if as_json else format_explanation(explanation))
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """
+    The arguments of the explain command, for main.py's explain subcommand and main().
+    """
+    parser.add_argument("company", nargs="?", help="company id, domain or Stripe customer id")
+    parser.add_argument("--data-path", type=Path, default=DATA_PATH)
+    parser.add_argument("--json", action="store_true", help="print the explanation as JSON")
+    parser.add_argument("--build-index", action="store_true", help="(re)build the explain index")
+    # No defaults, so that the same options of main.py given before the subcommand still apply
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=argparse.SUPPRESS,
+        help="columnar cache to load the inputs from when (re)building the index (default: data/.cache)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        default=argparse.SUPPRESS,
+        help="build the index from the JSON inputs, without reading or writing the cache",
+    )
+
+
+def run_command(args: argparse.Namespace, parser: argparse.ArgumentParser):
+    """
+    Runs the explain command for arguments parsed with add_arguments.
+    """
+    if not args.company and not args.build_index:
+        parser.error("a company id, domain or Stripe customer id is required")
+    cache_dir = getattr(args, "cache_dir", DATA_PATH / ".cache")
+    run_explain(
+        args.company,
+        args.data_path,
+        cache_dir=None if getattr(args, "no_cache", False) else cache_dir,
+        as_json=args.json,
+        build=args.build_index,
+    )
+
+
+def main(argv: list[str] | None = None):
+    """Main"""
+    parser = argparse.ArgumentParser(
+        prog="python -m src.main explain",
+        description="Explain one company's migration scenario from the explain index.",
+    )
+    add_arguments(parser)
+    run_command(parser.parse_args(argv), parser)
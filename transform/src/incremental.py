@@ -0,0 +1,229 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from . import calculations
+from .cache import cache_schema
+
+# --- Incremental Recomputation ---
+#
+# Every run stores a snapshot of per-entity input hashes (companies by id, organizations
+# by id, subscription items by customer id) together with the output table. An incremental
+# run hashes the new inputs, diffs them against the snapshot and recomputes only the
+# companies whose company row, organizations or Stripe customer changed. Their rows are
+# patched into the stored output, which is then reordered exactly like a full run.
+#
+# Coupons, the plan index (prices and products) and the pricing constants in calculations.py affect every
+# company, so any change to them falls back to a full recomputation.
+
+SNAPSHOT_DIR_NAME = ".snapshot"
+CHANGELOG_COLUMNS = [
+    "company_id",
+    "company_name",
+    "change",
+    "old_plan_name",
+    "plan_name",
+    "old_arr_change",
+    "arr_change",
+]
+
+
+def _hashable(column: pd.Series) -> pd.Series:
+    # Lists (or arrays read back from the cache) and dicts cannot be hashed by pandas directly
+    sample = column.dropna()
+    if sample.empty:
+        return column
+    if isinstance(sample.iloc[0], dict):
+        return column.map(lambda value: json.dumps(value, sort_keys=True))
+    if isinstance(sample.iloc[0], (list, tuple, np.ndarray)):
+        return column.map(lambda values: "\x1f".join(map(str, values)))
+    return column
+
+
+def hash_rows(df: pd.DataFrame) -> np.ndarray:
+    """
+    One uint64 hash per row over all columns of df.
+    """
+    hashable = pd.DataFrame({column: _hashable(df[column]) for column in df.columns})
+    return pd.util.hash_pandas_object(hashable, index=False).to_numpy()
+
+
+def frame_hash(df: pd.DataFrame) -> str:
+    """
+    Order-sensitive hash of a whole frame.
+    """
+    return cache_schema(list(df.columns), hash_rows(df).tolist())
+
+
+def constants_hash() -> str:
+    """
+    Hash of the pricing constants that every company's result depends on.
+    """
+    return cache_schema(
+        calculations.BRAND_PLANS,
+        calculations.AGENCY_PLANS,
+        calculations.MODEL_ID_PRICE_MAP,
+        calculations.GUARDRAIL_ORG_COUNT,
+        calculations.APPLY_AMOUNT_OFF,
+        calculations.INTERVAL_MONTHS,
+        calculations.RUNS_PER_MONTH,
+    )
+
+
+def input_hashes(inputs: dict[str, pd.DataFrame]) -> dict:
+    """
+    Per-entity hashes of the loaded inputs, plus one hash over everything global.
+    """
+    companies_df, orgs_df, subs_df = inputs["companies"], inputs["orgs"], inputs["subs"]
+
+    # Combine item hashes per customer; the item order matters (first/idxmax per customer)
+    item_hashes = hash_rows(subs_df)
+    position = subs_df.groupby("customer_id", observed=True).cumcount().to_numpy(dtype=np.uint64)
+    item_hashes = pd.util.hash_array(item_hashes ^ (position * np.uint64(0x9E3779B97F4A7C15)))
+    codes, customer_ids = pd.factorize(subs_df["customer_id"])
+    order = np.argsort(codes, kind="stable")
+    starts = np.flatnonzero(np.diff(codes[order], prepend=-1))
+    customer_hashes = pd.Series(
+        np.bitwise_xor.reduceat(item_hashes[order], starts) if len(order) else item_hashes,
+        index=np.asarray(customer_ids),
+    )
+
+    return {
+        "companies": pd.Series(hash_rows(companies_df), index=companies_df["id"].to_numpy()),
+        "orgs": pd.DataFrame(
+            {"company_id": orgs_df["company_id"].to_numpy(), "hash": hash_rows(orgs_df)},
+            index=orgs_df["id"].to_numpy(),
+        ),
+        "customers": customer_hashes,
+        "globals": cache_schema(
+            constants_hash(),
+            frame_hash(inputs["coupons"]),
+            frame_hash(inputs["plans"]),
+        ),
+    }
+
+
+def _changed(old: pd.Series, new: pd.Series) -> pd.Index:
+    # Keys present on one side only, plus common keys whose hash differs
+    common = old.index.intersection(new.index)
+    differs = old.reindex(common).to_numpy() != new.reindex(common).to_numpy()
+    return old.index.symmetric_difference(new.index).union(common[differs])
+
+
+def affected_companies(snapshot: dict, hashes: dict, companies_df: pd.DataFrame) -> pd.Index | None:
+    """
+    Ids of the companies whose output may differ from the snapshot (new, removed or changed),
+    or None if a global input changed and everything must be recomputed.
+    """
+    if snapshot["globals"] != hashes["globals"]:
+        return None
+
+    affected = _changed(snapshot["companies"], hashes["companies"])
+
+    changed_orgs = _changed(snapshot["orgs"]["hash"], hashes["orgs"]["hash"])
+    affected = affected.union(
+        pd.Index(snapshot["orgs"]["company_id"].reindex(changed_orgs).dropna())
+    ).union(pd.Index(hashes["orgs"]["company_id"].reindex(changed_orgs).dropna()))
+
+    changed_customers = _changed(snapshot["customers"], hashes["customers"])
+    affected = affected.union(
+        pd.Index(companies_df.loc[companies_df["stripe_customer_id"].isin(changed_customers), "id"])
+    )
+    return affected
+
+
+def subset_inputs(inputs: dict[str, pd.DataFrame], company_ids: pd.Index) -> dict[str, pd.DataFrame]:
+    """
+    Restricts the per-company inputs to the given companies and their Stripe customers.
+    """
+    companies_df = inputs["companies"][inputs["companies"]["id"].isin(company_ids)]
+    customer_ids = companies_df["stripe_customer_id"].unique()
+    return {
+        **inputs,
+        "companies": companies_df,
+        "orgs": inputs["orgs"][inputs["orgs"]["company_id"].isin(company_ids)],
+        "subs": inputs["subs"][inputs["subs"]["customer_id"].isin(customer_ids)],
+    }
+
+
+def patch_output(
+    old_output: pd.DataFrame,
+    new_rows: pd.DataFrame,
+    affected: pd.Index,
+    companies_df: pd.DataFrame,
+) -> pd.DataFrame:
+    """
+    Replaces the affected companies' rows in old_output with new_rows and restores
+    the row order of a full run (the order of companies_df).
+    """
+    kept = old_output[~old_output.index.isin(affected)]
+    patched = pd.concat([kept, new_rows]) if len(new_rows) else kept
+    order = pd.Index(companies_df["id"]).get_indexer(patched.index)
+    return patched.iloc[np.argsort(order, kind="stable")]
+
+
+def build_changelog(old_output: pd.DataFrame, new_output: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rows that were added or removed, or whose plan_name or arr_change moved.
+    """
+    old = old_output[["company_name", "plan_name", "arr_change"]]
+    new = new_output[["company_name", "plan_name", "arr_change"]]
+    joined = old.join(new, how="outer", lsuffix="_old", rsuffix="")
+
+    added = joined["plan_name_old"].isna() & joined["plan_name"].notna()
+    removed = joined["plan_name"].isna() & joined["plan_name_old"].notna()
+    changed = ~added & ~removed & (
+        (joined["plan_name_old"] != joined["plan_name"])
+        | (joined["arr_change_old"] != joined["arr_change"])
+    )
+
+    changelog = joined[added | removed | changed].copy()
+    changelog["change"] = np.select(
+        [added[changelog.index], removed[changelog.index]], ["added", "removed"], "changed"
+    )
+    changelog["company_name"] = changelog["company_name"].fillna(changelog["company_name_old"])
+    changelog = changelog.rename(
+        columns={"plan_name_old": "old_plan_name", "arr_change_old": "old_arr_change"}
+    ).astype({"old_arr_change": "Int64", "arr_change": "Int64"})
+    changelog.index.name = "company_id"
+    return changelog.reset_index()[CHANGELOG_COLUMNS]
+
+
+# --- Snapshot Storage ---
+
+
+def _write_frame(df: pd.DataFrame, path: Path):
+    tmp_path = path.with_name(path.name + ".tmp")
+    df.to_feather(tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+
+def save_snapshot(snapshot_dir: Path, hashes: dict, output: pd.DataFrame):
+    """
+    Stores the input hashes and the output table of this run.
+    """
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    _write_frame(hashes["companies"].rename("hash").rename_axis("id").reset_index(), snapshot_dir / "companies.arrow")
+    _write_frame(hashes["orgs"].rename_axis("id").reset_index(), snapshot_dir / "orgs.arrow")
+    _write_frame(hashes["customers"].rename("hash").rename_axis("customer_id").reset_index(), snapshot_dir / "customers.arrow")
+    _write_frame(output.reset_index(), snapshot_dir / "output.arrow")
+    (snapshot_dir / "globals.json").write_text(json.dumps({"globals": hashes["globals"]}))
+
+
+def load_snapshot(snapshot_dir: Path) -> dict | None:
+    """
+    Loads the previous run's snapshot, or None if there is none.
+    """
+    if not (snapshot_dir / "globals.json").exists():
+        return None
+    orgs = pd.read_feather(snapshot_dir / "orgs.arrow").set_index("id")
+    return {
+        "companies": pd.read_feather(snapshot_dir / "companies.arrow").set_index("id")["hash"],
+        "orgs": orgs,
+        "customers": pd.read_feather(snapshot_dir / "customers.arrow").set_index("customer_id")["hash"],
+        "output": pd.read_feather(snapshot_dir / "output.arrow").set_index("company_id"),
+        "globals": json.loads((snapshot_dir / "globals.json").read_text())["globals"],
+    }
@@ -0,0 +1,103 @@
+import cProfile
+import json
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+# --- Run Instrumentation ---
+#
+# A RunReport collects one record per named pipeline stage: wall time, CPU time, peak RSS
+# (and how much the stage raised it), rows in and out and, optionally, the tracemalloc
+# delta and peak of the stage. With a profile directory, every stage is also run under
+# cProfile and its stats are dumped to <profile_dir>/<index>_<stage>.prof.
+# Stages are not meant to be nested.
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class RunReport:
+    """
+    Per-stage timing and memory metrics for one pipeline run.
+    """
+
+    def __init__(self, trace_memory: bool = False, profile_dir: Path | None = None):
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.started_at = datetime.now(timezone.utc)
+        self.stages = []
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int | None = None):
+        """
+        Measures the enclosed block as one stage. Yields the stage record,
+        on which the caller sets rows_out (and any other counters).
+        """
+        record = {"name": name, "rows_in": rows_in, "rows_out": None}
+
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+        profiler = cProfile.Profile() if self.profile_dir is not None else None
+
+        rss_before = _peak_rss_mb()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record["wall_s"] = round(time.perf_counter() - wall_start, 4)
+            record["cpu_s"] = round(time.process_time() - cpu_start, 4)
+            record["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+            record["peak_rss_delta_mb"] = round(record["peak_rss_mb"] - rss_before, 1)
+            if self.trace_memory:
+                traced, traced_peak = tracemalloc.get_traced_memory()
+                record["tracemalloc_delta_mb"] = round((traced - traced_before) / 2**20, 2)
+                record["tracemalloc_peak_mb"] = round((traced_peak - traced_before) / 2**20, 2)
+            if profiler is not None:
+                self.profile_dir.mkdir(parents=True, exist_ok=True)
+                profiler.dump_stats(self.profile_dir / f"{len(self.stages):02d}_{name}.prof")
+            self.stages.append(record)
+
+    def to_dict(self) -> dict:
+        return {
+            "started_at": self.started_at.isoformat(),
+            "total_wall_s": round(time.perf_counter() - self._start, 4),
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+            "stages": self.stages,
+        }
+
+    def write(self, path: Path):
+        """
+        Writes the report as JSON.
+        """
+        path.write_text(json.dumps(self.to_dict(), indent=2))
+
+    def summary(self) -> str:
+        """
+        One line per stage, slowest first.
+        """
+        lines = []
+        for record in sorted(self.stages, key=lambda r: r["wall_s"], reverse=True):
+            # Load stages have no input row count
+            if record["rows_in"] is None:
+                rows = "" if record["rows_out"] is None else f"  rows {record['rows_out']}"
+            else:
+                rows = f"  rows {record['rows_in']} -> {record['rows_out']}"
+            lines.append(
+                f"  {record['name']:<24} {record['wall_s']:>8.3f}s wall {record['cpu_s']:>8.3f}s cpu{rows}"
+            )
+        return "\n".join(lines)
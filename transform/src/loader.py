@@ -0,0 +1,224 @@
+import json
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Type
+
+import pandas as pd
+from pydantic import BaseModel
+
+from .validation import (
+    file_hash,
+    is_unchanged,
+    record_validated,
+    validate_json,
+    validate_records,
+)
+
+# --- Streaming JSON Loading ---
+#
+# The data/ files are single top-level JSON arrays. Rather than parsing a whole file into
+# a DataFrame and round-tripping it through dicts, the loader decodes one element at a
+# time from a bounded text buffer, drops records that fail a filter, and appends the
+# surviving values column by column. Memory therefore scales with the kept records.
+# Validation against the models.py classes is done in batches (see validation.py).
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+DEFAULT_BATCH_SIZE = 10_000
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+def iter_json_array(file_path: Path, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator:
+    """
+    Yields the elements of a top-level JSON array one at a time,
+    reading the file in chunks of chunk_size characters.
+    """
+    with open(file_path, encoding="utf-8") as f:
+        buffer = f.read(chunk_size)
+        eof = not buffer
+        pos = 0
+
+        def skip(chars: str) -> int:
+            nonlocal buffer, pos, eof
+            while True:
+                while pos < len(buffer) and buffer[pos] in chars:
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return pos
+                buffer, pos = f.read(chunk_size), 0
+                eof = not buffer
+
+        skip(_WHITESPACE)
+        if buffer[pos : pos + 1] != "[":
+            raise ValueError(f"{file_path} does not contain a top-level JSON array")
+        pos += 1
+
+        while True:
+            skip(_WHITESPACE + ",")
+            if eof and pos >= len(buffer):
+                raise ValueError(f"{file_path} ended before the JSON array was closed")
+            if buffer[pos] == "]":
+                return
+
+            try:
+                element, end = _decoder.raw_decode(buffer, pos)
+                # A value that runs to the end of the buffer may be truncated (e.g. a number)
+                complete = end < len(buffer) or eof
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+
+            if complete:
+                pos = end
+                yield element
+                continue
+
+            more = f.read(chunk_size)
+            eof = not more
+            buffer, pos = buffer[pos:] + more, 0
+
+
+def load_columns(
+    file_path: Path,
+    columns: list[str],
+    predicate: Optional[Callable[[dict], bool]] = None,
+    keys: Optional[dict[str, str]] = None,
+    defaults: Optional[dict] = None,
+) -> pd.DataFrame:
+    """
+    Streams a JSON array file into a DataFrame with the given columns, without validation.
+    Records failing predicate are skipped. Each column is read from the JSON key
+    keys[column] (defaulting to the column name); missing keys take defaults[column] or None.
+    """
+    keys = keys or {}
+    defaults = defaults or {}
+    sources = [(keys.get(column, column), defaults.get(column)) for column in columns]
+    data = {column: [] for column in columns}
+
+    for record in iter_json_array(file_path):
+        if predicate is not None and not predicate(record):
+            continue
+        for column, (key, default) in zip(columns, sources):
+            data[column].append(record.get(key, default))
+
+    return pd.DataFrame(data, columns=columns)
+
+
+def _models_to_frame(records: list[BaseModel], columns: list[str]) -> pd.DataFrame:
+    return pd.DataFrame(
+        {column: [getattr(record, column) for record in records] for column in columns},
+        columns=columns,
+    )
+
+
+def _coerce_dtypes(df: pd.DataFrame, model: Type[BaseModel]) -> pd.DataFrame:
+    # Unvalidated JSON numbers keep their literal type; align float fields with validated output
+    for name, field in model.model_fields.items():
+        if field.annotation is float:
+            df[name] = df[name].astype(float)
+    return df
+
+
+def iter_model_batches(
+    file_path: Path,
+    model: Type[BaseModel],
+    predicate: Optional[Callable[[dict], bool]] = None,
+    mode: str = "strict",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    validate: bool = True,
+) -> Iterator[tuple[pd.DataFrame, list[dict]]]:
+    """
+    Streams a JSON array file as DataFrames of at most batch_size records, one column per
+    model field, each with the rejects of its batch (lenient mode only). Records failing
+    predicate are skipped. Without validate the fields are read as they are, for files
+    known to be valid (see is_unchanged). Yields at least one, possibly empty, frame.
+    """
+    fields = model.model_fields
+    columns = list(fields)
+    sources = [
+        (field.alias or name, None if field.is_required() else field.default) for name, field in fields.items()
+    ]
+    batch, row_ids = [], []
+
+    def convert() -> tuple[pd.DataFrame, list[dict]]:
+        if validate:
+            records, rejects = validate_records(batch, model, mode, row_ids)
+            return _models_to_frame(records, columns), rejects
+        data = {column: [record.get(key, default) for record in batch] for column, (key, default) in zip(columns, sources)}
+        return _coerce_dtypes(pd.DataFrame(data, columns=columns), model), []
+
+    yielded = False
+    for row, record in enumerate(iter_json_array(file_path)):
+        if predicate is not None and not predicate(record):
+            continue
+        batch.append(record)
+        row_ids.append(row)
+        if len(batch) >= batch_size:
+            yield convert()
+            yielded = True
+            batch, row_ids = [], []
+    if batch or not yielded:
+        yield convert()
+
+
+def load_model(
+    file_path: Path,
+    model: Type[BaseModel],
+    predicate: Optional[Callable[[dict], bool]] = None,
+    mode: str = "strict",
+    manifest: Optional[dict] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    digest: Optional[str] = None,
+) -> tuple[pd.DataFrame, list[dict]]:
+    """
+    Loads and validates a JSON array file into a DataFrame with one column per model field.
+
+    Without a predicate the raw bytes are validated in one TypeAdapter pass. With a predicate
+    the file is streamed and surviving records are validated in batches of batch_size.
+    If a manifest is given and shows the file validated cleanly with the same content and
+    schema, validation is skipped and the columns are read directly. digest is the file's
+    file_hash if the caller already computed it.
+    Returns the DataFrame and the rejects (lenient mode only), tagged with the file name.
+    """
+    columns = list(model.model_fields)
+    if manifest is not None and digest is None:
+        digest = file_hash(file_path)
+
+    if manifest is not None and is_unchanged(manifest, file_path, model, digest):
+        fields = model.model_fields
+        df = load_columns(
+            file_path,
+            columns,
+            predicate=predicate,
+            keys={name: field.alias or name for name, field in fields.items()},
+            defaults={name: field.default for name, field in fields.items() if not field.is_required()},
+        )
+        return _coerce_dtypes(df, model), []
+
+    if predicate is None:
+        records, rejects = validate_json(Path(file_path).read_bytes(), model, mode)
+        df = _models_to_frame(records, columns)
+    else:
+        frames, rejects = [], []
+        for frame, batch_rejects in iter_model_batches(file_path, model, predicate, mode, batch_size):
+            frames.append(frame)
+            rejects.extend(batch_rejects)
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    for reject in rejects:
+        reject["file"] = Path(file_path).name
+    if manifest is not None and not rejects:
+        record_validated(manifest, file_path, model, digest)
+    return df, rejects
+
+
+def is_active_stripe_company(record: dict) -> bool:
+    """
+    Keeps companies with an active Stripe subscription and a customer id.
+    """
+    return bool(
+        record.get("stripeSubscriptionId")
+        and record.get("stripeCustomerId")
+        and record.get("stripeSubscriptionStatus") == "active"
+    )
@@ -1,410 +1,589 @@
-import pandas as pd
+import argparse
+import sys
 from pathlib import Path
 
+if __name__ == "__main__" and sys.argv[1:2] == ["explain"]:
+    # explain answers from its index with the standard library alone (see explain.py):
+    # dispatch it before pandas and the pipeline modules are imported
+    from .explain import main as explain_main
+
+    explain_main(sys.argv[2:])
+    sys.exit()
+
+import pandas as pd
+
 from .models import (
     Company,
     Organization,
     SubscriptionItem,
-    MigrationOutput,
+)
+from .loader import is_active_stripe_company, iter_model_batches, load_columns, load_model
+from .validation import (
+    REJECT_COLUMNS,
+    VALIDATION_MODES,
+    file_hash,
+    is_unchanged,
+    load_manifest,
+    record_validated,
+    save_manifest,
+    schema_fingerprint,
+)
+from .cache import cache_schema, load_cached
+from .compact import compact_frame
+from .incremental import (
+    SNAPSHOT_DIR_NAME,
+    affected_companies,
+    build_changelog,
+    input_hashes,
+    load_snapshot,
+    patch_output,
+    save_snapshot,
+    subset_inputs,
 )
 from .calculations import (
-    calculate_coupon_multiplier,
-    calculate_scenarios_for_company,
-    calculate_credits_capacity,
-    calculate_credits_usage,
+    PRICE_BOOK,
+    ScenarioMemo,
+    build_coupon_table,
+    build_plan_index,
+    calculate_scenarios,
+)
+from .stages import (
+    aggregate_customers,
+    aggregate_orgs,
+    aggregate_orgs_chunked,
+    compute_org_credits,
+    join_companies,
 )
+from .instrumentation import RunReport
+from . import explain
+from .cohorts import DEFAULT_COHORTS, load_cohorts, summarize_cohorts, write_cohort_summary
+from . import matching
+from .output import DEFAULT_CHUNK_SIZE, OUTPUT_FORMATS, iter_chunks, shape_output, write_output
+from .parallel import run_partitioned
 
 
 # --- 3. Main ETL and Execution Block ---
 
 
-def etl_pipeline():
+# Define paths relative to the script location
+DATA_PATH = Path(__file__).parent.parent.parent / "data"
+DEFAULT_ORGS_CHUNK_SIZE = 20_000
+
+
+def load_inputs(
+    data_path: Path = DATA_PATH,
+    validation_mode: str = "strict",
+    skip_unchanged: bool = True,
+    cache_dir: Path | None = None,
+    rebuild_cache: bool = False,
+    report: RunReport | None = None,
+    compact: bool = True,
+    orgs_chunk_size: int | None = None,
+) -> dict[str, pd.DataFrame]:
     """
-    Main function to run the ETL pipeline.
+    Loads and validates the source data into one DataFrame per input:
+    companies, orgs, subs, coupons and plans (the plan index of stripe_prices.json
+    and stripe_products.json, see build_plan_index).
+    In "lenient" validation mode invalid rows are dropped and written to
+    validation_rejects.csv instead of aborting the run. With skip_unchanged,
+    inputs that validated cleanly before with the same content are not revalidated.
+    If cache_dir is given, validated inputs are cached there as Arrow files keyed by
+    source file hash and schema, and read back memory-mapped on later runs.
+    With compact, companies, organizations and subscription items are stored as
+    typed columns instead of Python objects (see compact.py).
+    With orgs_chunk_size, organizations are never loaded as a whole: they are streamed,
+    validated and aggregated per company orgs_chunk_size at a time (see
+    aggregate_orgs_chunked), and "org_aggregates" takes the place of "orgs".
     """
-    # Define paths relative to the script location
-    base_path = Path(__file__).parent.parent.parent
-    data_path = base_path / "data"
-    output_path = data_path / "migrate.csv"
-
-    def load(file_path: Path):
-        """Helper to load, clean NaN values, and validate data."""
-        df_raw = pd.read_json(file_path)
-        # Replace NaN with None, which Pydantic understands as a valid optional value
-        records = df_raw.replace({float("nan"): None}).to_dict("records")
-        return records
-
-    # Load data using the robust helper
-    print("Loading source data...")
-    companies = load(data_path / "processed_companies.json")
-    orgs = load(data_path / "processed_organizations.json")
-    subs = load(data_path / "stripe_subscription_items.json")
-    coupons = load(data_path / "stripe_coupons.json")
-    prices = load(data_path / "stripe_prices.json")
-    products = load(data_path / "stripe_products.json")
-
-    # Filter
-    companiesSC = [
-        c
-        for c in companies
-        if c["stripeSubscriptionId"]
-        and c["stripeCustomerId"]
-        and c["stripeSubscriptionStatus"] == "active"
-    ]
-
-    # Validate
-    companies = [Company.model_validate(c) for c in companiesSC]
-    orgs = [Organization.model_validate(o) for o in orgs]
-    subs = [SubscriptionItem.model_validate(s) for s in subs]
-
-    # Create coupon lookup dictionary
-    coupons_map = {c["id"]: c for c in coupons}
 
-    print(
-        f"Loaded {len(companies)} companies, {len(orgs)} organizations, {len(subs)} subscription items, {len(coupons)} coupons, {len(prices)} prices, {len(products)} products."
-    )
+    report = report or RunReport()
 
-    # Convert to Pandas DataFrames
-    companies_df = pd.DataFrame([c.model_dump() for c in companies])
-    orgs_df = pd.DataFrame([o.model_dump() for o in orgs])
-    subs_df = pd.DataFrame([s.model_dump() for s in subs])
-    prices_df = pd.DataFrame(prices)
-    products_df = pd.DataFrame(products)
+    # Stream the source files, keeping only the columns and records we need
+    print("Loading source data...")
+    manifest = load_manifest(data_path) if skip_unchanged else None
+
+    def load_input(file_name: str, model=None, columns=None, predicate=None):
+        """Helper to load one input through the columnar cache, validating it against model if given."""
+        file_path = data_path / file_name
+        # Hashed once, for both the cache key and the validation manifest
+        digest = file_hash(file_path) if cache_dir is not None or manifest is not None else None
+        if model is not None:
+            schema = cache_schema(
+                schema_fingerprint(model), getattr(predicate, "__name__", None), compact
+            )
 
-    # --- Data Transformation ---
-    print("Transforming and merging data...")
+            def loader():
+                df, rejects = load_model(
+                    file_path,
+                    model,
+                    predicate=predicate,
+                    mode=validation_mode,
+                    manifest=manifest,
+                    digest=digest,
+                )
+                return (compact_frame(df, model) if compact else df), rejects
+
+        else:
+            schema = cache_schema(columns)
+            loader = lambda: (load_columns(file_path, columns), [])
+        with report.stage(f"load_{file_path.stem}") as stage:
+            df, file_rejects = load_cached(
+                file_path, schema, loader, cache_dir, rebuild_cache, digest=digest
+            )
+            stage["rows_out"] = len(df)
+            stage["rejects"] = len(file_rejects)
+        return df, file_rejects
 
-    # Calculate credits per organization
-    orgs_df["credits_usage"] = orgs_df.apply(calculate_credits_usage, axis=1)
-    orgs_df["credits_capacity"] = orgs_df.apply(calculate_credits_capacity, axis=1)
-
-    # Join subscription items with prices and products to get product metadata
-    subs_with_product = subs_df.merge(
-        prices_df[["id", "product"]],
-        left_on="plan_id",
-        right_on="id",
-        how="left",
-        suffixes=("", "_price"),
+    companies_df, company_rejects = load_input(
+        "processed_companies.json", Company, predicate=is_active_stripe_company
     )
-
-    subs_with_product = subs_with_product.merge(
-        products_df[["id", "metadata"]],
-        left_on="product",
-        right_on="id",
-        how="left",
-        suffixes=("", "_product"),
+    if orgs_chunk_size:
+        with report.stage("load_processed_organizations") as stage:
+            org_aggregates, org_count, org_rejects = stream_org_aggregates(
+                data_path / "processed_organizations.json", validation_mode, manifest, orgs_chunk_size
+            )
+            stage["rows_out"] = org_count
+            stage["rejects"] = len(org_rejects)
+    else:
+        orgs_df, org_rejects = load_input("processed_organizations.json", Organization)
+        org_count = len(orgs_df)
+    subs_df, sub_rejects = load_input("stripe_subscription_items.json", SubscriptionItem)
+    coupons_df, _ = load_input(
+        "stripe_coupons.json",
+        columns=["id", "percent_off", "amount_off", "duration", "duration_in_months"],
     )
 
-    # Extract metadata fields and filter for WORKSPACE type products
-    def extract_prompt_limit(row):
-        metadata = row.get("metadata", {})
-        if not isinstance(metadata, dict):
-            return 0
-
-        product_type = metadata.get("type", "")
-        if product_type != "WORKSPACE":
-            return 0
+    # Prices and product metadata are only needed as the plan index, which is cached
+    # under the prices file, keyed by the hashes of both files so that an entry for
+    # older products is replaced like one for older prices
+    prices_path = data_path / "stripe_prices.json"
+    products_path = data_path / "stripe_products.json"
+    with report.stage("load_plan_index") as stage:
+        plans_df, _ = load_cached(
+            prices_path,
+            cache_schema("plan_index"),
+            lambda: (
+                build_plan_index(
+                    load_columns(prices_path, ["id", "product"]),
+                    load_columns(products_path, ["id", "metadata"]),
+                ),
+                [],
+            ),
+            cache_dir,
+            rebuild_cache,
+            digest=cache_schema(file_hash(prices_path), file_hash(products_path)) if cache_dir is not None else None,
+        )
+        stage["rows_out"] = len(plans_df)
+    plan_errors = plans_df[plans_df["prompt_limit_error"].notna()].drop_duplicates("product_id")
+    if len(plan_errors):
+        print(
+            f"Warning: {len(plan_errors)} WORKSPACE products have an invalid prompt limit, counted as 0: "
+            + ", ".join(f"{row.product_id} ({row.prompt_limit_error})" for row in plan_errors.itertuples())
+        )
+    if manifest is not None:
+        save_manifest(data_path, manifest)
 
-        prompt_limit_str = metadata.get("promptLimit", "0")
-        try:
-            return int(prompt_limit_str)
-        except (ValueError, TypeError):
-            return 0
+    rejects = company_rejects + org_rejects + sub_rejects
+    rejects_path = data_path / "validation_rejects.csv"
+    if rejects:
+        pd.DataFrame(rejects, columns=REJECT_COLUMNS).to_csv(rejects_path, index=False)
+        print(f"Warning: dropped {len(rejects)} invalid rows, see {rejects_path}")
+    elif rejects_path.exists():
+        rejects_path.unlink()
 
-    subs_with_product["prompt_limit_per_item"] = subs_with_product.apply(
-        extract_prompt_limit, axis=1
-    )
-    subs_with_product["total_prompt_limit"] = (
-        subs_with_product["prompt_limit_per_item"] * subs_with_product["quantity"]
+    print(
+        f"Loaded {len(companies_df)} companies, {org_count} organizations, {len(subs_df)} subscription items, {len(coupons_df)} coupons, {len(plans_df)} plans."
     )
 
-    # Calculate prompt_capacity per customer from workspace subscription items
-    customer_prompt_capacity = (
-        subs_with_product.groupby("customer_id")
-        .agg(prompt_capacity=("total_prompt_limit", "sum"))
-        .reset_index()
-    )
+    return {
+        "companies": companies_df,
+        **({"org_aggregates": org_aggregates} if orgs_chunk_size else {"orgs": orgs_df}),
+        "subs": subs_df,
+        "coupons": coupons_df,
+        "plans": plans_df,
+    }
+
+
+def stream_org_aggregates(
+    file_path: Path,
+    validation_mode: str = "strict",
+    manifest: dict | None = None,
+    chunk_size: int = DEFAULT_ORGS_CHUNK_SIZE,
+) -> tuple[dict[str, pd.DataFrame], int, list[dict]]:
+    """
+    The aggregate_orgs aggregates of an organizations file, read chunk_size organizations
+    at a time. Chunks are validated unless the manifest shows the file validated cleanly
+    before. Returns the aggregates, the organization count and the rejects.
+    """
+    digest = file_hash(file_path) if manifest is not None else None
+    unchanged = manifest is not None and is_unchanged(manifest, file_path, Organization, digest)
+    rejects = []
 
-    # Aggregate credits and usage by company
-    company_credits = (
-        orgs_df.groupby("company_id")
-        .agg(
-            prompt_usage=("prompts_count", "sum"),
-            credits_capacity=("credits_capacity", "sum"),
-            credits_usage=("credits_usage", "sum"),
-        )
-        .reset_index()
-    )
+    def chunks():
+        for df, batch_rejects in iter_model_batches(
+            file_path, Organization, mode=validation_mode, batch_size=chunk_size, validate=not unchanged
+        ):
+            rejects.extend(batch_rejects)
+            yield df
 
-    # count orgs per company
-    orgs_count_df = orgs_df.groupby("company_id").size().reset_index(name="orgs_count")
-
-    # Count high-frequency orgs (more than once a day)
-    high_freq_orgs_df = (
-        orgs_df[
-            (orgs_df["chat_interval_in_hours"] < 24)
-            & (orgs_df["chat_interval_in_hours"] > 0)
-        ]
-        .groupby("company_id")
-        .size()
-        .reset_index(name="orgs_count_hf")
-    )
+    org_aggregates, org_count = aggregate_orgs_chunked(chunks())
+    for reject in rejects:
+        reject["file"] = file_path.name
+    if manifest is not None and not unchanged and not rejects:
+        record_validated(manifest, file_path, Organization, digest)
+    return org_aggregates, org_count, rejects
 
-    # Calculate current MRR per customer, taking quantity and discounts into account
-    # First, calculate the base MRR without discounts
-    subs_df["base_mrr_cents"] = subs_df["mrr_cents"] * subs_df["quantity"]
 
-    # Apply item-level discounts (these are specific to each item)
-    def apply_item_discount(row):
-        item_discounts = row["discounts"]
-        multiplier, long_term_count, total_count = calculate_coupon_multiplier(
-            item_discounts, coupons_map
-        )
-        return pd.Series(
-            {
-                "mrr_after_item_discounts": row["base_mrr_cents"] * multiplier,
-                "item_discount_long_term_count": long_term_count,
-                "item_discount_total_count": total_count,
-            }
-        )
+MERGE_BACKENDS = ("pandas", "polars")
 
-    item_discount_results = subs_df.apply(apply_item_discount, axis=1)
-    subs_df["mrr_after_item_discounts"] = item_discount_results[
-        "mrr_after_item_discounts"
-    ]
-    subs_df["item_discount_long_term_count"] = item_discount_results[
-        "item_discount_long_term_count"
-    ]
-    subs_df["item_discount_total_count"] = item_discount_results[
-        "item_discount_total_count"
-    ]
-
-    # For subscription-level discounts, we need to calculate the multiplier once per subscription
-    # and apply it to the total of all items (to avoid denormalization issues)
-
-    # First, get unique subscription discounts per customer
-    subscription_discounts_df = (
-        subs_df.groupby("customer_id")["subscription_discounts"]
-        .first()  # All items in same subscription have same subscription_discounts
-        .reset_index()
-    )
-
-    # Calculate subscription-level discount multiplier and count
-    def get_subscription_multiplier(row):
-        sub_discounts = row["subscription_discounts"]
-        multiplier, long_term_count, total_count = calculate_coupon_multiplier(
-            sub_discounts, coupons_map
-        )
-        return pd.Series(
-            {
-                "sub_discount_multiplier": multiplier,
-                "sub_discount_long_term_count": long_term_count,
-                "sub_discount_total_count": total_count,
-            }
-        )
 
-    sub_discount_results = subscription_discounts_df.apply(
-        get_subscription_multiplier, axis=1
-    )
-    subscription_discounts_df["sub_discount_multiplier"] = sub_discount_results[
-        "sub_discount_multiplier"
-    ]
-    subscription_discounts_df["sub_discount_long_term_count"] = sub_discount_results[
-        "sub_discount_long_term_count"
-    ]
-    subscription_discounts_df["sub_discount_total_count"] = sub_discount_results[
-        "sub_discount_total_count"
-    ]
-
-    # Merge subscription multiplier and count back to items
-    subs_df = pd.merge(
-        subs_df,
-        subscription_discounts_df[
-            [
-                "customer_id",
-                "sub_discount_multiplier",
-                "sub_discount_long_term_count",
-                "sub_discount_total_count",
-            ]
-        ],
-        on="customer_id",
-        how="left",
-    )
+def merge_inputs(
+    inputs: dict[str, pd.DataFrame],
+    report: RunReport | None = None,
+    backend: str = "pandas",
+) -> pd.DataFrame:
+    """
+    Computes credits, MRR, discounts and prompt capacity from the loaded inputs
+    and merges them into one row per company, ready for scenario calculation.
+    The "polars" backend runs the same computation as one lazy Polars query
+    (see polars_backend.py); "pandas" runs the stages in stages.py.
+    """
+    report = report or RunReport()
+    companies_df = inputs["companies"]
 
-    # Apply subscription-level discounts on top of item-level discounts
-    subs_df["discounted_mrr_cents"] = (
-        subs_df["mrr_after_item_discounts"] * subs_df["sub_discount_multiplier"]
-    )
+    if backend == "polars":
+        from .polars_backend import merge_inputs_lazy
 
-    # Aggregate by customer
-    customer_mrr = (
-        subs_df.groupby("customer_id")
-        .agg(
-            {
-                "base_mrr_cents": "sum",
-                "discounted_mrr_cents": "sum",
-                "item_discount_long_term_count": "sum",  # Sum item-level long-term discount counts
-                "item_discount_total_count": "sum",  # Sum item-level total discount counts
-                "sub_discount_long_term_count": "first",  # Subscription-level counts are the same for all items
-                "sub_discount_total_count": "first",
-            }
-        )
-        .reset_index()
-    )
+        print("Transforming and merging data (polars)...")
+        with report.stage("lazy_merge", rows_in=len(companies_df)) as stage:
+            merged_df = merge_inputs_lazy(inputs)
+            stage["rows_out"] = len(merged_df)
+        return merged_df
 
-    # Calculate total discount counts (item + subscription level)
-    customer_mrr["applied_discounts"] = (
-        customer_mrr["item_discount_long_term_count"]
-        + customer_mrr["sub_discount_long_term_count"]
-    ).astype(int)
+    subs_df = inputs["subs"]
 
-    customer_mrr["total_discounts"] = (
-        customer_mrr["item_discount_total_count"]
-        + customer_mrr["sub_discount_total_count"]
-    ).astype(int)
+    # Create typed coupon table
+    coupon_table = build_coupon_table(inputs["coupons"])
 
-    # Format as "applied (total)"
-    customer_mrr["discounts_formatted"] = customer_mrr.apply(
-        lambda row: f"{row['applied_discounts']} ({row['total_discounts']})", axis=1
-    )
+    # --- Data Transformation ---
+    print("Transforming and merging data...")
 
-    customer_mrr["current_mrr"] = customer_mrr["discounted_mrr_cents"] / 100
-    customer_mrr["current_arr"] = customer_mrr["current_mrr"] * 12
-
-    # Calculate discount percentage: (1 - discounted/base) * 100
-    customer_mrr["discount_pct"] = (
-        (
-            (
-                1
-                - (
-                    customer_mrr["discounted_mrr_cents"]
-                    / customer_mrr["base_mrr_cents"]
-                )
-            )
-            * 100
-        )
-        .fillna(0)
-        .round(0)
-        .astype(int)
+    if "org_aggregates" in inputs:
+        # Aggregated out of core while loading (see load_inputs)
+        org_aggregates = inputs["org_aggregates"]
+    else:
+        orgs_df = inputs["orgs"].copy()
+        with report.stage("org_credits", rows_in=len(orgs_df)) as stage:
+            orgs_df = compute_org_credits(orgs_df)
+            stage["rows_out"] = len(orgs_df)
+
+        with report.stage("org_aggregates", rows_in=len(orgs_df)) as stage:
+            org_aggregates = aggregate_orgs(orgs_df)
+            stage["rows_out"] = len(org_aggregates["company_credits"])
+
+    with report.stage("customer_aggregates", rows_in=len(subs_df)) as stage:
+        customers = aggregate_customers(subs_df, coupon_table, inputs["plans"])
+        stage["rows_out"] = len(customers)
+
+    with report.stage("join_companies", rows_in=len(companies_df)) as stage:
+        merged_df = join_companies(companies_df, org_aggregates, customers)
+        stage["rows_out"] = len(merged_df)
+
+    return merged_df
+
+
+def build_merged_df(
+    data_path: Path = DATA_PATH,
+    validation_mode: str = "strict",
+    skip_unchanged: bool = True,
+    cache_dir: Path | None = None,
+    rebuild_cache: bool = False,
+    compact: bool = True,
+) -> pd.DataFrame:
+    """
+    Loads, validates and merges the source data into one row per company,
+    ready for scenario calculation.
+    """
+    inputs = load_inputs(
+        data_path, validation_mode, skip_unchanged, cache_dir, rebuild_cache, compact=compact
     )
+    return merge_inputs(inputs)
 
-    # --- Interval Formatting ---
-    # We only care about the interval of the highest MRR item per customer
-    # This is a simplification, but for now it's a good heuristic
-    main_subscription = subs_df.loc[
-        subs_df.groupby("customer_id")["base_mrr_cents"].idxmax()
-    ]
 
-    def format_interval(row):
-        if row["interval_count"] != 1:
-            return f"{row['interval']} ({row['interval_count']})"
-        return row["interval"]
+def build_output(merged_df: pd.DataFrame, report: RunReport | None = None) -> pd.DataFrame:
+    """
+    Calculates the migration scenarios and shapes the MigrationOutput table,
+    indexed by company id.
+    """
+    report = report or RunReport()
 
-    main_subscription["interval"] = main_subscription.apply(format_interval, axis=1)
+    # --- Apply Calculation Logic ---
+    print(f"Calculating migration scenarios for each company (price book {PRICE_BOOK['version']})...")
+    with report.stage("scenarios", rows_in=len(merged_df)) as stage:
+        memo = ScenarioMemo()
+        scenarios_df = calculate_scenarios(merged_df, memo)
+        stage["rows_out"] = len(scenarios_df)
+        stage["price_book"] = PRICE_BOOK["version"]
+        stage.update(memo.stats())
+    if memo.rows:
+        print(
+            f"Evaluated {memo.evaluated} distinct scenario inputs for {memo.rows} companies"
+            f" (memo hit rate {memo.stats()['memo_hit_rate']:.1%})."
+        )
 
-    customer_interval = main_subscription[["customer_id", "interval"]]
+    # The MigrationOutput fields define the final column order and selection
+    return shape_output(merged_df, scenarios_df)
+
+
+def etl_pipeline(
+    data_path: Path = DATA_PATH,
+    validation_mode: str = "strict",
+    skip_unchanged: bool = True,
+    cache_dir: Path | None = None,
+    rebuild_cache: bool = False,
+    incremental: bool = False,
+    profile_dir: Path | None = None,
+    trace_memory: bool = False,
+    workers: int = 1,
+    backend: str = "pandas",
+    compact: bool = True,
+    output_format: str = "csv",
+    chunk_size: int | None = DEFAULT_CHUNK_SIZE,
+    cohorts: dict[str, str] | None = None,
+    orgs_chunk_size: int | None = None,
+    match_orphans: bool = False,
+):
+    """
+    Main function to run the ETL pipeline.
+    The output table is written to migrate.csv, or migrate.parquet with output_format
+    "parquet", in chunks of chunk_size rows and replaced atomically (see output.py).
+    Per-cohort aggregates (cohorts.py, DEFAULT_COHORTS unless cohorts is given) are
+    written to migrate_cohorts.json.
+    With match_orphans, Stripe customers whose subscription revenue is not in the output
+    are written to migrate_unmatched.csv with their ranked candidate companies in
+    migrate_matches.csv (see matching.py).
+    With incremental, only companies whose inputs changed since the last run's snapshot
+    are recomputed and patched into the previous output.
+    With workers > 1, the companies are split into partitions transformed in parallel
+    worker processes; the output is identical to a serial run.
+    With orgs_chunk_size, organizations are aggregated out of core, orgs_chunk_size at a
+    time, with the same output (see load_inputs). The per-organization input hashes are
+    then unknown, so the snapshot of the last run is kept rather than replaced; this mode
+    cannot be combined with incremental, workers > 1 or the polars backend.
+    backend selects the merge implementation (see merge_inputs).
+    compact keeps the inputs in typed columns rather than Python objects (see load_inputs).
+    Per-stage timings and memory are written to migrate_run_report.json next to migrate.csv;
+    with profile_dir, cProfile stats of every stage are dumped there too.
+    """
+    if orgs_chunk_size and (incremental or workers > 1 or backend != "pandas"):
+        raise ValueError("Out-of-core organization aggregation cannot be combined with incremental, workers or polars")
+    output_path = data_path / f"migrate.{output_format}"
+    report = RunReport(trace_memory=trace_memory, profile_dir=profile_dir)
 
-    # Merge all data into a single DataFrame
-    merged_df = pd.merge(
-        companies_df, company_credits, left_on="id", right_on="company_id", how="inner"
-    )
-    merged_df = pd.merge(
-        merged_df,
-        orgs_count_df,
-        on="company_id",
-        how="inner",
-    )
-    merged_df = pd.merge(
-        merged_df,
-        high_freq_orgs_df,
-        on="company_id",
-        how="left",  # Use left merge to keep all companies
-    )
-    merged_df = pd.merge(
-        merged_df,
-        customer_mrr[
-            [
-                "customer_id",
-                "current_mrr",
-                "current_arr",
-                "discount_pct",
-                "discounts_formatted",
-            ]
-        ],
-        left_on="stripe_customer_id",
-        right_on="customer_id",
-        how="inner",
+    inputs = load_inputs(
+        data_path, validation_mode, skip_unchanged, cache_dir, rebuild_cache, report, compact, orgs_chunk_size
     )
-    merged_df = pd.merge(
-        merged_df,
-        customer_interval,
-        on="customer_id",
-        how="inner",
-    )
-    merged_df = pd.merge(
-        merged_df,
-        customer_prompt_capacity,
-        on="customer_id",
-        how="left",  # Use left merge to keep all companies even if no workspace subscriptions
-    )
-
-    # Fill missing values for companies with no subs or orgs
-    merged_df["credits_capacity"] = merged_df["credits_capacity"].fillna(0)
-    merged_df["credits_usage"] = merged_df["credits_usage"].fillna(0)
-    merged_df["current_mrr"] = merged_df["current_mrr"].fillna(0)
-    merged_df["current_arr"] = merged_df["current_arr"].fillna(0)
-    merged_df["discount"] = merged_df["discount_pct"].fillna(0)
-    merged_df["discounts"] = merged_df["discounts_formatted"].fillna("0 (0)")
-    merged_df["prompt_usage"] = merged_df["prompt_usage"].fillna(0)
-    merged_df["prompt_capacity"] = merged_df["prompt_capacity"].fillna(0)
-    merged_df["orgs_count"] = merged_df["orgs_count"].fillna(0)
-    merged_df["orgs_count_hf"] = merged_df["orgs_count_hf"].fillna(0)
-
-    # Cast to int
-    merged_df["credits_capacity"] = merged_df["credits_capacity"].astype(int)
-    merged_df["credits_usage"] = merged_df["credits_usage"].astype(int)
-    merged_df["current_mrr"] = merged_df["current_mrr"].astype(int)
-    merged_df["current_arr"] = merged_df["current_arr"].astype(int)
-    merged_df["discount"] = merged_df["discount_pct"].astype(int)
-    # discounts is already a string, no conversion needed
-    merged_df["prompt_usage"] = merged_df["prompt_usage"].astype(int)
-    merged_df["prompt_capacity"] = merged_df["prompt_capacity"].astype(int)
-    merged_df["orgs_count"] = merged_df["orgs_count"].astype(int)
-    merged_df["orgs_count_hf"] = merged_df["orgs_count_hf"].astype(int)
 
-    # --- Apply Calculation Logic ---
-    print("Calculating migration scenarios for each company...")
-    scenarios_df = merged_df.apply(calculate_scenarios_for_company, axis=1)
-
-    # Combine initial data with calculated scenarios
-    final_df = pd.concat([merged_df, scenarios_df], axis=1)
-
-    # Select and rename columns to match our final desired output
-    final_df = final_df.rename(
-        columns={
-            "name": "company_name",
-            "domain": "company_domain",
-            "type": "company_type",
-        }
-    )
+    snapshot_dir = data_path / SNAPSHOT_DIR_NAME
+    with report.stage("snapshot_diff", rows_in=len(inputs["companies"])) as stage:
+        snapshot = load_snapshot(snapshot_dir)
+        hashes = input_hashes(inputs) if "orgs" in inputs else None
+
+        affected = None
+        if incremental and snapshot is not None:
+            affected = affected_companies(snapshot, hashes, inputs["companies"])
+            if affected is None:
+                print("Pricing constants, coupons, prices or products changed, recomputing all companies...")
+        stage["rows_out"] = len(inputs["companies"]) if affected is None else len(affected)
+
+    def transform(inputs):
+        if workers > 1 and len(inputs["companies"]) > 1:
+            return run_partitioned(inputs, workers, report, backend)
+        return build_output(merge_inputs(inputs, report, backend), report)
+
+    if affected is None:
+        final_df = transform(inputs)
+    else:
+        print(f"Incremental run: recomputing {len(affected)} of {len(inputs['companies'])} companies...")
+        changed_inputs = subset_inputs(inputs, affected)
+        new_rows = (
+            transform(changed_inputs)
+            if len(changed_inputs["companies"])
+            else snapshot["output"].iloc[:0]
+        )
+        final_df = patch_output(snapshot["output"], new_rows, affected, inputs["companies"])
+
+    with report.stage("snapshot_save", rows_in=len(final_df)) as stage:
+        if snapshot is not None:
+            changelog_path = data_path / "migrate_changelog.csv"
+            changelog_df = build_changelog(snapshot["output"], final_df)
+            changelog_df.to_csv(changelog_path, index=False)
+            print(f"{len(changelog_df)} companies changed plan or arr_change, see {changelog_path}")
+            stage["rows_out"] = len(changelog_df)
+        if hashes is not None:
+            save_snapshot(snapshot_dir, hashes, final_df)
 
     # Print sum of arr_change
     print(f"Sum of arr_change: {final_df['arr_change'].sum()}")
 
-    # Use the Pydantic model to define the final column order and selection
-    output_columns = list(MigrationOutput.model_fields.keys())
-    final_df = final_df[output_columns]
-
     # --- Save to CSV ---
     print(f"Saving final CSV to {output_path}...")
-    final_df.to_csv(output_path, index=False)
+    with report.stage("write_output", rows_in=len(final_df)) as stage:
+        stage["rows_out"] = write_output(iter_chunks(final_df, chunk_size), output_path, output_format)
+
+    cohorts_path = data_path / "migrate_cohorts.json"
+    with report.stage("cohorts", rows_in=len(final_df)) as stage:
+        summary = summarize_cohorts(final_df, cohorts or DEFAULT_COHORTS)
+        write_cohort_summary(summary, cohorts_path)
+        stage["rows_out"] = len(summary["cohorts"])
+    print(f"Cohort summary written to {cohorts_path}")
+
+    if match_orphans:
+        with report.stage("matching", rows_in=len(inputs["subs"])) as stage:
+            orphans = matching.match_orphans(data_path, inputs, final_df, cache_dir)
+            unmatched_summary = matching.write_matching(orphans, data_path)
+            stage["rows_out"] = len(orphans["unmatched"])
+        reasons = ", ".join(
+            f"{reason}: {row['customers']} ({row['mrr']} MRR)" for reason, row in unmatched_summary.items()
+        )
+        print(
+            f"{len(orphans['unmatched'])} Stripe customers with subscriptions are not in the output ({reasons}), "
+            f"see {data_path / 'migrate_unmatched.csv'} and {data_path / 'migrate_matches.csv'}"
+        )
+
+    report_path = data_path / "migrate_run_report.json"
+    report.write(report_path)
+    print(f"Stage timings (see {report_path}):\n{report.summary()}")
 
     print("Migration analysis complete.")
 
 
 def main():
     """Main"""
-    etl_pipeline()
+    parser = argparse.ArgumentParser(description="Stripe migration analysis ETL pipeline.")
+    parser.add_argument(
+        "--validation",
+        choices=VALIDATION_MODES,
+        default="strict",
+        help="strict aborts on the first invalid input; lenient drops invalid rows and reports them",
+    )
+    parser.add_argument(
+        "--revalidate",
+        action="store_true",
+        help="validate all inputs even if they are unchanged since the last clean validation",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=DATA_PATH / ".cache",
+        help="directory for the columnar cache of validated inputs (default: data/.cache)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="always parse and validate the JSON inputs, without reading or writing the cache",
+    )
+    parser.add_argument(
+        "--rebuild-cache",
+        action="store_true",
+        help="ignore existing cache entries and rebuild them from the JSON inputs",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="recompute only companies whose inputs changed since the last run",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        nargs="?",
+        const=DATA_PATH / "profile",
+        default=None,
+        help="dump cProfile stats per stage into this directory (default: data/profile)",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="record the tracemalloc delta and peak of every stage (slower)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="transform partitions of companies in this many worker processes (default: 1)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=MERGE_BACKENDS,
+        default="pandas",
+        help="merge implementation: the pandas stages or one lazy Polars query (requires polars)",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=OUTPUT_FORMATS,
+        default="csv",
+        help="write data/migrate.csv or data/migrate.parquet (typed schema, requires pyarrow)",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="rows converted and written per chunk of the output file (default: 100000)",
+    )
+    parser.add_argument(
+        "--cohorts",
+        type=Path,
+        help="JSON file of cohort names to expressions over the output columns (default: cohorts.py)",
+    )
+    parser.add_argument(
+        "--no-compact",
+        action="store_true",
+        help="keep ids, enums and list columns of the inputs as Python objects",
+    )
+    parser.add_argument(
+        "--out-of-core",
+        nargs="?",
+        type=int,
+        const=DEFAULT_ORGS_CHUNK_SIZE,
+        metavar="ORGS_CHUNK_SIZE",
+        help="stream and aggregate the organizations this many at a time instead of loading them "
+        f"all (default: {DEFAULT_ORGS_CHUNK_SIZE}); not with --incremental, --workers or --backend polars",
+    )
+    parser.add_argument(
+        "--match-orphans",
+        action="store_true",
+        help="also match the Stripe customers missing from the output to companies (see matching.py)",
+    )
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    explain_parser = commands.add_parser(
+        "explain",
+        help="explain one company's migration scenario (see explain.py)",
+        description="Explain one company's migration scenario from the explain index.",
+    )
+    explain.add_arguments(explain_parser)
+    args = parser.parse_args()
+
+    if args.command == "explain":
+        explain.run_command(args, explain_parser)
+        return
+
+    etl_pipeline(
+        validation_mode=args.validation,
+        skip_unchanged=not args.revalidate,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        rebuild_cache=args.rebuild_cache,
+        incremental=args.incremental,
+        profile_dir=args.profile,
+        trace_memory=args.trace_memory,
+        workers=args.workers,
+        backend=args.backend,
+        compact=not args.no_compact,
+        output_format=args.output_format,
+        chunk_size=args.chunk_size,
+        cohorts=load_cohorts(args.cohorts) if args.cohorts else None,
+        orgs_chunk_size=args.out_of_core,
+        match_orphans=args.match_orphans,
+    )
 
 
 if __name__ == "__main__":
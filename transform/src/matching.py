@@ -0,0 +1,414 @@
+import argparse
+import json
+import re
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .cache import cache_schema, load_cached
+from .calculations import build_coupon_table
+from .loader import is_active_stripe_company, load_columns
+from .stages import aggregate_customers
+
+# --- Orphan Customer Matching ---
+#
+# The pipeline inner-joins companies with their Stripe customer (stripe_customer_id) and
+# organizations, so subscription revenue of any other customer never reaches migrate.csv.
+# This stage finds those orphan customers, with the reason they were dropped:
+#   inactive_company  the customer's company record fails is_active_stripe_company (e.g. its
+#                     subscription status is not "active" or it has no subscription id)
+#   no_organizations  the company is active but has no organizations
+#   no_company        no company record has this stripe_customer_id
+# and their MRR and ARR as the pipeline computes them (aggregate_customers).
+#
+# Every orphan customer is then matched against all companies of processed_companies.json,
+# using the Stripe customer export stripe_customers.json (optional: id, name, email and
+# metadata with a domain or website) and three indexes over the companies:
+#   domain        the normalized company domain, looked up with the customer's domain
+#   email_domain  the same index, looked up with the domain of the customer's email
+#                 (free-mail domains are ignored)
+#   name          character n-grams of the normalized company name (lowercase, ASCII, without
+#                 legal forms such as GmbH or Ltd)
+# Name candidates are blocked on shared n-grams: n-grams of more than max_block_size companies
+# are not used to find candidates, and each customer keeps the max_candidates companies
+# sharing the most n-grams, so the work grows with the number of customers times the block
+# size rather than with customers x companies. Candidates are scored as the noisy-or of the
+# signals (SIGNAL_WEIGHTS, the name signal being the Jaccard similarity of the n-gram sets);
+# the best top_n with at least min_score are kept per customer. The customer's own company
+# record, if any, is always the first candidate.
+#
+# This stage writes migrate_unmatched.csv (one row per orphan customer with its best match)
+# and migrate_matches.csv (all ranked matches). It is not part of a default pipeline run:
+#
+#   python -m src.matching [--data-path data] [--top-n 3]
+#   python -m src.main --match-orphans
+
+CUSTOMERS_FILE = "stripe_customers.json"
+COMPANY_COLUMNS = [
+    "id",
+    "name",
+    "domain",
+    "type",
+    "stripe_customer_id",
+    "stripe_subscription_id",
+    "stripe_subscription_status",
+]
+COMPANY_KEYS = {
+    "stripe_customer_id": "stripeCustomerId",
+    "stripe_subscription_id": "stripeSubscriptionId",
+    "stripe_subscription_status": "stripeSubscriptionStatus",
+}
+LEGAL_FORMS = {
+    "ag", "bv", "co", "corp", "corporation", "gbr", "gmbh", "inc", "kg", "limited", "llc",
+    "llp", "ltd", "mbh", "nv", "oy", "plc", "sa", "sarl", "sas", "sl", "spa", "srl", "ug",
+}
+FREE_EMAIL_DOMAINS = {
+    "aol.com", "gmail.com", "gmx.de", "gmx.net", "googlemail.com", "hotmail.com", "icloud.com",
+    "live.com", "mail.com", "me.com", "outlook.com", "proton.me", "protonmail.com",
+    "t-online.de", "web.de", "yahoo.com",
+}
+SIGNAL_WEIGHTS = {"domain": 0.9, "email_domain": 0.8, "name": 0.8}
+NGRAM_SIZE = 3
+DEFAULT_MAX_BLOCK_SIZE = 200
+DEFAULT_MAX_CANDIDATES = 20
+DEFAULT_TOP_N = 3
+DEFAULT_MIN_SCORE = 0.3
+REASONS = ("inactive_company", "no_organizations", "no_company")
+
+
+def normalize_domain(value) -> str | None:
+    """
+    Lowercase host name of a domain, URL or email address, without "www.".
+    """
+    if not isinstance(value, str) or not value.strip():
+        return None
+    value = value.strip().lower().rsplit("@", 1)[-1]
+    value = re.sub(r"^[a-z][a-z0-9+.-]*://", "", value)
+    value = re.split(r"[/?#:]", value, maxsplit=1)[0].strip(".")
+    value = value.removeprefix("www.")
+    return value or None
+
+
+def email_domain(email) -> str | None:
+    """
+    Normalized domain of an email address, None for free-mail providers.
+    """
+    if not isinstance(email, str) or "@" not in email:
+        return None
+    domain = normalize_domain(email)
+    return None if domain in FREE_EMAIL_DOMAINS else domain
+
+
+def normalize_name(name) -> str:
+    """
+    Lowercase ASCII words of a company name, without legal forms.
+    """
+    if not isinstance(name, str):
+        return ""
+    text = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode().lower()
+    return " ".join(token for token in re.split(r"[^a-z0-9]+", text) if token and token not in LEGAL_FORMS)
+
+
+def name_ngrams(name) -> frozenset:
+    """
+    Character n-grams of the normalized name, padded with spaces at both ends.
+    """
+    normalized = normalize_name(name)
+    if not normalized:
+        return frozenset()
+    padded = f" {normalized} "
+    return frozenset(padded[i : i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1))
+
+
+def load_companies(data_path: Path, cache_dir: Path | None = None) -> pd.DataFrame:
+    """
+    All company records of processed_companies.json, active or not, cached next to the
+    active companies of load_inputs.
+    """
+    file_path = data_path / "processed_companies.json"
+    df, _ = load_cached(
+        file_path,
+        cache_schema(COMPANY_COLUMNS, COMPANY_KEYS),
+        lambda: (load_columns(file_path, COMPANY_COLUMNS, keys=COMPANY_KEYS), []),
+        cache_dir,
+    )
+    return df
+
+
+def load_customers(data_path: Path, cache_dir: Path | None = None) -> pd.DataFrame:
+    """
+    Stripe customers (id, name, email, domain) from stripe_customers.json, empty if the
+    export is not there. The domain comes from the metadata keys domain, website or url.
+    """
+    file_path = data_path / CUSTOMERS_FILE
+    if not file_path.exists():
+        return pd.DataFrame(columns=["id", "name", "email", "domain"])
+    df, _ = load_cached(
+        file_path,
+        cache_schema(["id", "name", "email", "metadata"]),
+        lambda: (load_columns(file_path, ["id", "name", "email", "metadata"]), []),
+        cache_dir,
+        json_columns=("metadata",),
+    )
+    domain = [
+        next((m[key] for key in ("domain", "website", "url") if m.get(key)), None) if isinstance(m, dict) else None
+        for m in df["metadata"]
+    ]
+    return df[["id", "name", "email"]].assign(domain=domain).drop_duplicates("id", keep="last")
+
+
+def orphan_customers(
+    inputs: dict[str, pd.DataFrame], output_df: pd.DataFrame, companies: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    One row per Stripe customer with subscription items whose revenue is not in output_df
+    (indexed by company id): its MRR and ARR, the reason and its company record, if any.
+    """
+    active = inputs["companies"]
+    in_output = active["id"].isin(output_df.index)
+    subs = inputs["subs"]
+    orphan_subs = subs[~subs["customer_id"].isin(active.loc[in_output, "stripe_customer_id"])]
+    if not len(orphan_subs):
+        return pd.DataFrame(
+            columns=["customer_id", "reason", "known_company_id", "company_status", "current_mrr", "current_arr"]
+        )
+
+    customers = aggregate_customers(
+        orphan_subs.reset_index(drop=True), build_coupon_table(inputs["coupons"]), inputs["plans"]
+    )
+    customer_ids = customers["customer_id"].astype(object)
+    known = companies.dropna(subset=["stripe_customer_id"]).drop_duplicates("stripe_customer_id")
+    known = known.set_index("stripe_customer_id").reindex(customer_ids)
+    is_active = np.array(
+        [
+            is_active_stripe_company(
+                {
+                    "stripeCustomerId": customer_id,
+                    "stripeSubscriptionId": subscription_id,
+                    "stripeSubscriptionStatus": status,
+                }
+            )
+            for customer_id, subscription_id, status in zip(
+                customer_ids, known["stripe_subscription_id"], known["stripe_subscription_status"]
+            )
+        ],
+        dtype=bool,
+    )
+    reason = np.where(
+        known["id"].isna().to_numpy(), "no_company", np.where(is_active, "no_organizations", "inactive_company")
+    )
+    return pd.DataFrame(
+        {
+            "customer_id": customer_ids.to_numpy(),
+            "reason": reason,
+            "known_company_id": known["id"].to_numpy(dtype=object),
+            "company_status": known["stripe_subscription_status"].to_numpy(dtype=object),
+            "current_mrr": customers["current_mrr"].to_numpy().astype(int),
+            "current_arr": customers["current_arr"].to_numpy().astype(int),
+        }
+    ).sort_values("current_mrr", ascending=False, kind="stable", ignore_index=True)
+
+
+def _map_unique(values, func) -> np.ndarray:
+    """
+    func applied to every distinct value once, as an object array aligned with values.
+    """
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=False)
+    mapped = np.empty(len(uniques), dtype=object)
+    mapped[:] = [func(value) for value in uniques]
+    return mapped[codes]
+
+
+def _postings(grams: np.ndarray, column: str) -> pd.DataFrame:
+    lengths = np.fromiter((len(g) for g in grams), dtype=np.int64, count=len(grams))
+    return pd.DataFrame(
+        {
+            "gram": np.fromiter((gram for g in grams for gram in g), dtype=object, count=int(lengths.sum())),
+            column: np.repeat(np.arange(len(grams)), lengths),
+        }
+    )
+
+
+def build_company_index(companies: pd.DataFrame, max_block_size: int = DEFAULT_MAX_BLOCK_SIZE) -> dict:
+    """
+    Domain and name n-gram indexes over the companies (by position in companies).
+    """
+    domains = _map_unique(companies["domain"], normalize_domain)
+    postings = _postings(_map_unique(companies["name"], name_ngrams), "company")
+    # Blocking: n-grams shared by too many companies do not narrow the candidates down
+    block_sizes = postings["gram"].map(postings["gram"].value_counts())
+    return {
+        "domains": pd.DataFrame({"domain": domains, "company": np.arange(len(companies))}).dropna(subset=["domain"]),
+        "postings": postings[block_sizes.to_numpy() <= max_block_size],
+    }
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def match_customers(
+    customers: pd.DataFrame,
+    companies: pd.DataFrame,
+    index: dict | None = None,
+    max_candidates: int = DEFAULT_MAX_CANDIDATES,
+    top_n: int = DEFAULT_TOP_N,
+    min_score: float = DEFAULT_MIN_SCORE,
+) -> pd.DataFrame:
+    """
+    Ranked company matches for customers (customer_id, name, email, domain and, optionally,
+    known_company_id). Returns customer_id, rank, company_id, score and the signals.
+    The company index is only built (if not given) when some customer has a name, email
+    or domain to match on.
+    """
+    customers = customers.reset_index(drop=True)
+    customer_domain = _map_unique(customers["domain"], normalize_domain)
+    customer_email_domain = _map_unique(customers["email"], email_domain)
+    customer_grams = _map_unique(customers["name"], name_ngrams)
+
+    # Candidate pairs: domain and email domain lookups, and shared rare name n-grams
+    candidates = []
+    if customers[["name", "email", "domain"]].notna().to_numpy().any():
+        index = index or build_company_index(companies)
+        for values in (customer_domain, customer_email_domain):
+            lookup = pd.DataFrame({"domain": values, "customer": np.arange(len(customers))})
+            candidates.append(lookup.dropna().merge(index["domains"], on="domain")[["customer", "company"]])
+        shared = (
+            _postings(customer_grams, "customer")
+            .merge(index["postings"], on="gram")
+            .groupby(["customer", "company"], sort=False)
+            .size()
+            .rename("shared")
+            .reset_index()
+            .sort_values(["customer", "shared"], ascending=[True, False], kind="stable")
+        )
+        candidates.append(shared.groupby("customer", sort=False).head(max_candidates)[["customer", "company"]])
+    if "known_company_id" in customers.columns:
+        positions = pd.Index(companies["id"]).get_indexer(customers["known_company_id"])
+        candidates.append(
+            pd.DataFrame({"customer": np.arange(len(customers)), "company": positions}).query("company >= 0")
+        )
+    pairs = pd.concat(
+        candidates or [pd.DataFrame({"customer": [], "company": []}, dtype=np.int64)], ignore_index=True
+    ).drop_duplicates(ignore_index=True)
+
+    customer = pairs["customer"].to_numpy()
+    company = pairs["company"].to_numpy()
+    company_domain = _map_unique(companies["domain"].to_numpy(dtype=object)[company], normalize_domain)
+    company_grams = _map_unique(companies["name"].to_numpy(dtype=object)[company], name_ngrams)
+    signals = {
+        "domain": (customer_domain[customer] == company_domain) & (company_domain != None),  # noqa: E711
+        "email_domain": (customer_email_domain[customer] == company_domain) & (company_domain != None),  # noqa: E711
+        "name": np.fromiter(
+            (_jaccard(customer_grams[i], grams) for i, grams in zip(customer, company_grams)),
+            dtype=float,
+            count=len(pairs),
+        ),
+    }
+    # Noisy-or: each signal independently explains the match with its weight
+    score = 1 - np.prod([1 - SIGNAL_WEIGHTS[name] * values for name, values in signals.items()], axis=0)
+    known = np.zeros(len(pairs), dtype=bool)
+    if "known_company_id" in customers.columns:
+        known = customers["known_company_id"].to_numpy(dtype=object)[customer] == companies["id"].to_numpy(dtype=object)[company]
+        score = np.where(known, 1.0, score)
+
+    matches = pd.DataFrame(
+        {
+            "customer_id": customers["customer_id"].to_numpy(dtype=object)[customer],
+            "company_id": companies["id"].to_numpy(dtype=object)[company],
+            "company_name": companies["name"].to_numpy(dtype=object)[company],
+            "company_domain": companies["domain"].to_numpy(dtype=object)[company],
+            "company_status": companies["stripe_subscription_status"].to_numpy(dtype=object)[company],
+            "score": score.round(4),
+            "known_company": known,
+            "domain_match": signals["domain"],
+            "email_domain_match": signals["email_domain"],
+            "name_similarity": signals["name"].round(4),
+            "_customer": customer,
+        }
+    )
+    matches = matches[(matches["score"] >= min_score) | matches["known_company"]]
+    matches = matches.sort_values(["_customer", "score"], ascending=[True, False], kind="stable")
+    matches = matches.groupby("_customer", sort=False).head(top_n)
+    matches.insert(1, "rank", matches.groupby("_customer", sort=False).cumcount() + 1)
+    return matches.drop(columns="_customer").reset_index(drop=True)
+
+
+def match_orphans(
+    data_path: Path,
+    inputs: dict[str, pd.DataFrame],
+    output_df: pd.DataFrame,
+    cache_dir: Path | None = None,
+    top_n: int = DEFAULT_TOP_N,
+) -> dict[str, pd.DataFrame]:
+    """
+    The orphan customers of a run (see orphan_customers) with their best match, and all
+    their ranked matches.
+    """
+    companies = load_companies(data_path, cache_dir)
+    orphans = orphan_customers(inputs, output_df, companies)
+    customers = orphans.merge(
+        load_customers(data_path, cache_dir).rename(columns={"id": "customer_id"}), on="customer_id", how="left"
+    )
+    for column in ("name", "email", "domain"):
+        if column not in customers.columns:
+            customers[column] = None
+    matches = match_customers(customers, companies, top_n=top_n)
+
+    best = matches[matches["rank"] == 1].set_index("customer_id")
+    unmatched = orphans.assign(
+        customer_name=customers["name"].to_numpy(dtype=object),
+        customer_email=customers["email"].to_numpy(dtype=object),
+        best_company_id=best["company_id"].reindex(orphans["customer_id"]).to_numpy(dtype=object),
+        best_company_name=best["company_name"].reindex(orphans["customer_id"]).to_numpy(dtype=object),
+        best_score=best["score"].reindex(orphans["customer_id"]).to_numpy(),
+    )
+    return {"unmatched": unmatched, "matches": matches}
+
+
+def unmatched_summary(unmatched: pd.DataFrame) -> dict:
+    """
+    Orphan customers, MRR and ARR per reason, and how many have a candidate company.
+    """
+    summary = {}
+    for reason in REASONS:
+        rows = unmatched[unmatched["reason"] == reason]
+        summary[reason] = {
+            "customers": len(rows),
+            "mrr": int(rows["current_mrr"].sum()),
+            "arr": int(rows["current_arr"].sum()),
+            "with_candidate": int(rows["best_company_id"].notna().sum()),
+        }
+    return summary
+
+
+def write_matching(matching: dict[str, pd.DataFrame], data_path: Path) -> dict:
+    """
+    Writes migrate_unmatched.csv and migrate_matches.csv and returns the summary.
+    """
+    matching["unmatched"].to_csv(data_path / "migrate_unmatched.csv", index=False)
+    matching["matches"].to_csv(data_path / "migrate_matches.csv", index=False)
+    return unmatched_summary(matching["unmatched"])
+
+
+def main():
+    """Main"""
+    from .main import DATA_PATH, build_output, load_inputs, merge_inputs
+
+    parser = argparse.ArgumentParser(description="Match Stripe customers missing from migrate.csv to companies.")
+    parser.add_argument("--data-path", type=Path, default=DATA_PATH)
+    parser.add_argument("--top-n", type=int, default=DEFAULT_TOP_N, help="matches kept per customer")
+    args = parser.parse_args()
+
+    cache_dir = args.data_path / ".cache"
+    inputs = load_inputs(args.data_path, cache_dir=cache_dir)
+    output_df = build_output(merge_inputs(inputs))
+    summary = write_matching(match_orphans(args.data_path, inputs, output_df, cache_dir, args.top_n), args.data_path)
+    print(json.dumps(summary, indent=2))
+    print(f"Orphan customers written to {args.data_path / 'migrate_unmatched.csv'} and {args.data_path / 'migrate_matches.csv'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import os
+import typing
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import pandas as pd
+
+from .models import MigrationOutput
+
+# --- Output Table ---
+#
+# The MigrationOutput model defines the output table: its fields are the columns, in order,
+# and their annotations give the Parquet schema. shape_output picks those columns from the
+# merged companies and their scenarios in one step, instead of concatenating, renaming and
+# reselecting whole frames. write_output streams the table in chunks of chunk_size rows to
+# a temporary file next to the target and renames it into place once complete, so a reader
+# of migrate.csv (or migrate.parquet) sees either the previous file or the new one in full.
+# Only one chunk at a time is converted to CSV text or an Arrow table.
+
+OUTPUT_FORMATS = ("csv", "parquet")
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Output fields that are named differently in the merged company frame
+SOURCE_COLUMNS = {
+    "company_name": "name",
+    "company_domain": "domain",
+    "company_type": "type",
+}
+
+
+def output_columns() -> list[str]:
+    return list(MigrationOutput.model_fields)
+
+
+def _arrow_type(annotation):
+    import pyarrow as pa
+
+    origin = typing.get_origin(annotation)
+    if origin is typing.Literal:
+        return pa.dictionary(pa.int8(), pa.string())
+    if origin is typing.Union:
+        return _arrow_type(next(arg for arg in typing.get_args(annotation) if arg is not type(None)))
+    return {int: pa.int64(), float: pa.float64(), str: pa.string(), bool: pa.bool_()}[annotation]
+
+
+def output_schema():
+    """
+    Arrow schema of the output table, from the MigrationOutput fields.
+    """
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            pa.field(
+                name,
+                _arrow_type(field.annotation),
+                nullable=type(None) in typing.get_args(field.annotation),
+            )
+            for name, field in MigrationOutput.model_fields.items()
+        ]
+    )
+
+
+def shape_output(merged_df: pd.DataFrame, scenarios_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The MigrationOutput table of merged companies and their scenarios, indexed by company id.
+    """
+    columns = {}
+    for name in output_columns():
+        source = SOURCE_COLUMNS.get(name, name)
+        values = scenarios_df[source] if source in scenarios_df.columns else merged_df[source]
+        columns[name] = values.array
+    return pd.DataFrame(columns, index=pd.Index(merged_df["id"], name="company_id"))
+
+
+def iter_chunks(df: pd.DataFrame, chunk_size: int | None = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Consecutive row slices of df with at most chunk_size rows each.
+    """
+    chunk_size = chunk_size or max(len(df), 1)
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start : start + chunk_size]
+
+
+def write_output(chunks: Iterable[pd.DataFrame], path: Path, output_format: str = "csv") -> int:
+    """
+    Streams output chunks to path as CSV (without the company id index, like to_csv) or
+    as Parquet with output_schema(), replacing path atomically. Returns the rows written.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {output_format!r}, expected one of {OUTPUT_FORMATS}")
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    rows = 0
+    try:
+        if output_format == "csv":
+            with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+                header = True
+                for chunk in chunks:
+                    chunk.to_csv(f, index=False, header=header)
+                    header = False
+                    rows += len(chunk)
+                if header:
+                    pd.DataFrame(columns=output_columns()).to_csv(f, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            schema = output_schema()
+            with pq.ParquetWriter(tmp_path, schema) as writer:
+                for chunk in chunks:
+                    writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                    rows += len(chunk)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return rows
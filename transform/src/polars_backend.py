@@ -0,0 +1,344 @@
+import argparse
+import contextlib
+import io
+from pathlib import Path
+
+import pandas as pd
+
+from . import calculations
+from .calculations import build_coupon_table
+from .compact import list_values
+
+# --- Polars Merge Backend ---
+#
+# The same computation as merge_inputs with the pandas stages (stages.py), expressed once as
+# a Polars LazyFrame graph: organization credits and aggregates, discounted MRR, billing
+# interval and prompt capacity per customer, and the joins into one row per company.
+# Nothing is materialized until the final collect(), so Polars prunes unused columns and
+# runs independent branches in parallel. Floats go through the same IEEE operations in the
+# same order as in pandas (see _kahan_sum and _with_hundred), so that both backends write
+# byte-identical output. The pandas backend remains the reference;
+# tests/test_polars_backend.py, or
+#   python -m src.polars_backend [data_dir]
+# check that both backends produce the same migrate.csv.
+#
+# polars is an optional dependency, imported only when this backend is used.
+
+
+def _plain_type(arrow_type):
+    # Compact columns (compact.py) as the plain types: strings, lists of strings, int64
+    import pyarrow as pa
+
+    if pa.types.is_dictionary(arrow_type):
+        return _plain_type(arrow_type.value_type)
+    if pa.types.is_list(arrow_type):
+        return pa.list_(_plain_type(arrow_type.value_type))
+    if pa.types.is_int32(arrow_type):
+        return pa.int64()
+    return arrow_type
+
+
+def _lazy(df: pd.DataFrame, columns: list[str]):
+    import polars as pl
+    import pyarrow as pa
+
+    # Through Arrow, so that list columns (lists, cached numpy arrays or Arrow lists) convert alike
+    table = pa.Table.from_pandas(df[columns], preserve_index=False)
+    schema = pa.schema([field.with_type(_plain_type(field.type)) for field in table.schema])
+    return pl.from_arrow(table.cast(schema)).lazy()
+
+
+def _float_values(mapping: dict) -> dict:
+    # replace_strict infers the literal type from the first value
+    return {key: float(value) for key, value in mapping.items()}
+
+
+def _kahan_sum(grouped, columns: list[str], max_length: int):
+    # pandas sums floats per group with Kahan summation, in row order. The same steps over
+    # the list columns of grouped (each group's values, in row order) give the same sums to
+    # the last bit, where Polars' own sum would not; max_length bounds the list lengths
+    import polars as pl
+
+    grouped = grouped.with_columns(
+        *(pl.lit(0.0).alias(f"{column}_sum") for column in columns),
+        *(pl.lit(0.0).alias(f"{column}_compensation") for column in columns),
+    )
+    for position in range(max_length):
+        steps = []
+        for column in columns:
+            value = pl.col(column).list.get(position, null_on_oob=True)
+            total, compensation = pl.col(f"{column}_sum"), pl.col(f"{column}_compensation")
+            y = value - compensation
+            t = total + y
+            present = value.is_not_null()
+            steps.append(pl.when(present).then(t).otherwise(total).alias(f"{column}_sum"))
+            steps.append(
+                pl.when(present)
+                .then((t - total - y).fill_nan(0.0))
+                .otherwise(compensation)
+                .alias(f"{column}_compensation")
+            )
+        grouped = grouped.with_columns(steps)
+    return grouped.with_columns(pl.col(f"{column}_sum").alias(column) for column in columns).drop(
+        *(f"{column}_{state}" for column in columns for state in ("sum", "compensation"))
+    )
+
+
+def _with_hundred(frame):
+    # Polars divides by a scalar through its reciprocal (x * 0.01), which can round
+    # differently from x / 100; dividing by this column of hundreds is a true division
+    import polars as pl
+
+    return frame.join(pl.LazyFrame({"hundred": [100.0]}), how="cross")
+
+
+def _max_length(lists: pd.Series) -> int:
+    return int(list_values(lists)[0].max(initial=0))
+
+
+def _resolve_coupons(items, list_column: str, coupons, max_coupons: int):
+    # Per row of items: long-term percent_off and amount_off sums, long-term and total counts
+    import polars as pl
+
+    resolved = (
+        items.select("row", list_column)
+        .explode(list_column)
+        .with_row_index("position")
+        .join(coupons, left_on=list_column, right_on="id", how="inner")
+        .group_by("row")
+        .agg(
+            percent_off=pl.when(pl.col("long_term"))
+            .then(pl.col("percent_off"))
+            .otherwise(0.0)
+            .sort_by("position"),
+            amount_off=pl.when(pl.col("long_term")).then(pl.col("amount_off")).otherwise(0.0).sort_by("position"),
+            long_term_count=pl.col("long_term").sum().cast(pl.Int64),
+            total_count=pl.len().cast(pl.Int64),
+        )
+    )
+    resolved = _kahan_sum(resolved, ["percent_off", "amount_off"], max_coupons)
+    return _with_hundred(items.join(resolved, on="row", how="left")).with_columns(
+        multiplier=(1.0 - pl.col("percent_off").fill_null(0.0) / pl.col("hundred")).clip(lower_bound=0.0),
+        amount_off=pl.col("amount_off").fill_null(0.0),
+        long_term_count=pl.col("long_term_count").fill_null(0),
+        total_count=pl.col("total_count").fill_null(0),
+    )
+
+
+def _monthly_amount_off(amount_off):
+    import polars as pl
+
+    if not calculations.APPLY_AMOUNT_OFF:
+        return pl.lit(0.0)
+    months = pl.col("interval").replace_strict(
+        _float_values(calculations.INTERVAL_MONTHS), default=1.0, return_dtype=pl.Float64
+    ) * pl.col("interval_count")
+    return amount_off / months
+
+
+def merge_inputs_lazy(inputs: dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Polars equivalent of merge_inputs: one row per company, ready for scenario calculation.
+    """
+    import polars as pl
+
+    coupon_table = build_coupon_table(inputs["coupons"]).reset_index()
+    coupons = pl.from_pandas(
+        coupon_table[["id", "percent_off", "amount_off", "long_term"]]
+    ).lazy()
+    plans = _lazy(inputs["plans"], ["id", "prompt_limit"])
+
+    companies = _lazy(
+        inputs["companies"], ["id", "name", "type", "domain", "stripe_customer_id"]
+    ).with_row_index("company_row")
+    orgs = _lazy(
+        inputs["orgs"],
+        ["company_id", "model_ids", "prompt_limit", "prompts_count", "chat_interval_in_hours"],
+    )
+    subs = _lazy(
+        inputs["subs"],
+        [
+            "customer_id",
+            "plan_id",
+            "mrr_cents",
+            "quantity",
+            "interval",
+            "interval_count",
+            "subscription_discounts",
+            "discounts",
+        ],
+    ).with_row_index("row")
+
+    # Only organizations and customers of the companies reach the output: filtering them
+    # first (in their row order) keeps every later step to those rows
+    company_ids = pl.Series(inputs["companies"]["id"].to_numpy(dtype=object), dtype=pl.String)
+    customer_ids = pl.Series(inputs["companies"]["stripe_customer_id"].to_numpy(dtype=object), dtype=pl.String)
+    orgs = orgs.filter(pl.col("company_id").is_in(company_ids.implode()))
+    subs = subs.filter(pl.col("customer_id").is_in(customer_ids.implode()))
+
+    # --- Organizations ---
+    model_price_sum = (
+        pl.col("model_ids")
+        .list.eval(
+            pl.element().replace_strict(
+                _float_values(calculations.MODEL_ID_PRICE_MAP), default=0.0, return_dtype=pl.Float64
+            )
+        )
+        .list.sum()
+    )
+    runs = calculations.RUNS_PER_MONTH
+    org_aggregates = (
+        orgs.with_columns(
+            credits_usage=(model_price_sum * pl.col("prompts_count") * runs).cast(pl.Int64),
+            credits_capacity=(model_price_sum * pl.col("prompt_limit") * runs).cast(pl.Int64),
+        )
+        .group_by("company_id")
+        .agg(
+            prompt_usage=pl.col("prompts_count").sum(),
+            credits_capacity=pl.col("credits_capacity").sum(),
+            credits_usage=pl.col("credits_usage").sum(),
+            orgs_count=pl.len(),
+            orgs_count_hf=(
+                (pl.col("chat_interval_in_hours") < 24) & (pl.col("chat_interval_in_hours") > 0)
+            ).sum(),
+        )
+    )
+
+    # --- Subscription items ---
+    items = _resolve_coupons(subs, "discounts", coupons, _max_length(inputs["subs"]["discounts"])).with_columns(
+        base_mrr_cents=pl.col("mrr_cents") * pl.col("quantity"),
+    )
+    items = items.with_columns(
+        mrr_after_item_discounts=(
+            pl.col("base_mrr_cents") * pl.col("multiplier") - _monthly_amount_off(pl.col("amount_off"))
+        ).clip(lower_bound=0.0),
+    )
+
+    # All items of a customer share the subscription-level discounts of its first item
+    subscriptions = (
+        subs.filter(pl.col("customer_id").is_first_distinct())
+        .select("customer_id", "subscription_discounts", "interval", "interval_count")
+        .with_row_index("row")
+    )
+    subscriptions = _resolve_coupons(
+        subscriptions, "subscription_discounts", coupons, _max_length(inputs["subs"]["subscription_discounts"])
+    ).select(
+        "customer_id",
+        sub_discount_multiplier=pl.col("multiplier"),
+        sub_discount_amount_off=_monthly_amount_off(pl.col("amount_off")),
+        sub_discount_long_term_count=pl.col("long_term_count"),
+        sub_discount_total_count=pl.col("total_count"),
+    )
+
+    # Items in row order within each customer, as pandas sums them
+    main_item = pl.col("base_mrr_cents").sort_by("row").arg_max()
+    customers = (
+        items.join(subscriptions, on="customer_id", how="left")
+        .with_columns(
+            discounted_mrr_cents=pl.col("mrr_after_item_discounts") * pl.col("sub_discount_multiplier")
+        )
+        .group_by("customer_id")
+        .agg(
+            base_mrr_cents=pl.col("base_mrr_cents").sort_by("row"),
+            discounted_mrr_cents=pl.col("discounted_mrr_cents").sort_by("row"),
+            applied_discounts=pl.col("long_term_count").sum() + pl.col("sub_discount_long_term_count").first(),
+            total_discounts=pl.col("total_count").sum() + pl.col("sub_discount_total_count").first(),
+            sub_discount_amount_off=pl.col("sub_discount_amount_off").first(),
+            # Billing interval of the highest-MRR item
+            interval=pl.col("interval").sort_by("row").get(main_item),
+            interval_count=pl.col("interval_count").sort_by("row").get(main_item),
+        )
+    )
+    max_items = int(inputs["subs"]["customer_id"].value_counts().to_numpy().max(initial=0))
+    customers = (
+        _with_hundred(_kahan_sum(customers, ["base_mrr_cents", "discounted_mrr_cents"], max_items))
+        .with_columns(
+            discounted_mrr_cents=(
+                pl.col("discounted_mrr_cents") - pl.col("sub_discount_amount_off")
+            ).clip(lower_bound=0.0),
+        )
+        .with_columns(current_mrr=pl.col("discounted_mrr_cents") / pl.col("hundred"))
+        .select(
+            "customer_id",
+            "current_mrr",
+            current_arr=pl.col("current_mrr") * 12,
+            discount=((1 - pl.col("discounted_mrr_cents") / pl.col("base_mrr_cents")) * 100)
+            .fill_nan(0)
+            .round(0)
+            .cast(pl.Int64),
+            discounts=pl.format(
+                "{} ({})", pl.col("applied_discounts"), pl.col("total_discounts")
+            ),
+            interval=pl.when(pl.col("interval_count") != 1)
+            .then(pl.format("{} ({})", pl.col("interval"), pl.col("interval_count")))
+            .otherwise(pl.col("interval")),
+        )
+    )
+
+    prompt_capacity = (
+        subs.join(plans, left_on="plan_id", right_on="id", how="left")
+        .group_by("customer_id")
+        .agg(prompt_capacity=(pl.col("prompt_limit").fill_null(0) * pl.col("quantity")).sum())
+    )
+
+    # --- One row per company, in companies order ---
+    merged = (
+        companies.join(org_aggregates, left_on="id", right_on="company_id", how="inner")
+        .join(customers, left_on="stripe_customer_id", right_on="customer_id", how="inner")
+        .join(prompt_capacity, left_on="stripe_customer_id", right_on="customer_id", how="left")
+        .sort("company_row")
+        .with_columns(
+            pl.col("current_mrr").cast(pl.Int64),
+            pl.col("current_arr").cast(pl.Int64),
+            pl.col("prompt_capacity").fill_null(0),
+            pl.col("orgs_count", "orgs_count_hf").cast(pl.Int64),
+        )
+        .drop("company_row")
+    )
+    return merged.collect().to_pandas()
+
+
+# --- Parity Check ---
+
+
+def check_parity(data_path: Path) -> bool:
+    """
+    Builds migrate.csv with the pandas and the Polars backend and reports whether the two
+    are identical.
+    """
+    from .main import build_output, load_inputs, merge_inputs
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        inputs = load_inputs(data_path, skip_unchanged=False)
+        outputs = {
+            backend: build_output(merge_inputs(inputs, backend=backend)).to_csv(index=False)
+            for backend in ("pandas", "polars")
+        }
+
+    if outputs["pandas"] != outputs["polars"]:
+        expected, actual = (
+            pd.read_csv(io.StringIO(outputs[backend]), dtype=str, keep_default_na=False)
+            for backend in ("pandas", "polars")
+        )
+        if expected.shape != actual.shape or list(expected.columns) != list(actual.columns):
+            print(f"Backends differ: {expected.shape} {list(expected.columns)} vs {actual.shape} {list(actual.columns)}")
+        else:
+            columns = [column for column in expected.columns if (expected[column] != actual[column]).any()]
+            print(f"Backends differ in {', '.join(columns)}")
+        return False
+    rows = outputs["pandas"].count("\n") - 1
+    print(f"pandas and polars backends write the same migrate.csv ({rows} rows).")
+    return True
+
+
+def main():
+    """Main"""
+    parser = argparse.ArgumentParser(description="Check the Polars backend against the pandas backend.")
+    parser.add_argument("data_path", type=Path, nargs="?", default=Path(__file__).parent.parent.parent / "data")
+    args = parser.parse_args()
+    if not check_parity(args.data_path):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
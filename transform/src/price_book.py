@@ -0,0 +1,199 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# --- Price Book ---
+#
+# The plans of every segment, in every currency and billing interval, live in one versioned
+# file (price_book.json):
+#   version            identifies the price book; reported with every run
+#   unit               "major" (euros, dollars) or "minor" (cents); prices are converted to
+#                      major units on load, which is the unit of current_mrr
+#   currencies         currency codes, e.g. ["eur", "usd"]
+#   billing_intervals  {interval: {months, billed_months}}: a plan billed every `months` months
+#                      costs its monthly list price times billed_months per `months`, e.g.
+#                      annual plans are billed 10 of 12 months
+#   interval_months    length of every Stripe recurring interval in months, used to normalize
+#                      amounts per billing interval (e.g. amount_off coupons) to monthly amounts
+#   segments           {segment: {plan: {price, credits, min_amount, max_org_count}}}, where
+#                      price is the monthly list price, one number or {currency: price}
+# load_price_book compiles the file into dense arrays of shape (segment, currency, interval,
+# plan) for price, credits, price_per_credit, min_amount and max_org_count, all monthly and
+# in major units, so the plans of any number of companies are looked up with one array
+# gather (see gather_plans). Segments with fewer plans are padded with NaN (plan_valid).
+# billing_factor holds billed_months / months of every billing interval, the factor on the
+# monthly list price per month (e.g. 10 / 12 for "year").
+# calculations.py derives BRAND_PLANS, AGENCY_PLANS and INTERVAL_MONTHS from the default
+# book, and the analysis notebooks import the same module.
+
+PRICE_BOOK_PATH = Path(__file__).parent.parent / "price_book.json"
+PLAN_FIELDS = ("price", "credits", "price_per_credit", "min_amount", "max_org_count")
+UNIT_FACTORS = {"major": 1, "minor": 100}
+DEFAULT_CURRENCY = "eur"
+DEFAULT_INTERVAL = "month"
+
+
+def compile_price_book(raw: dict) -> dict:
+    """
+    Compiles a price book dictionary (the file structure above) into dense arrays.
+    """
+    missing = {"version", "currencies", "billing_intervals", "segments"} - set(raw)
+    if missing:
+        raise ValueError(f"Price book is missing {', '.join(sorted(missing))}")
+    unit = raw.get("unit", "major")
+    if unit not in UNIT_FACTORS:
+        raise ValueError(f"Unknown price book unit {unit!r}, expected one of {tuple(UNIT_FACTORS)}")
+
+    segments = list(raw["segments"])
+    currencies = list(raw["currencies"])
+    intervals = list(raw["billing_intervals"])
+    n_plans = max((len(plans) for plans in raw["segments"].values()), default=0)
+    shape = (len(segments), len(currencies), len(intervals), n_plans)
+
+    # Monthly price of a plan billed on each interval, relative to its monthly list price
+    billed_months = np.array([raw["billing_intervals"][i]["billed_months"] for i in intervals], dtype=float)
+    months = np.array([raw["billing_intervals"][i]["months"] for i in intervals], dtype=float)
+
+    list_price = np.full(shape[:2] + shape[3:], np.nan)
+    fields = {field: np.full(shape, np.nan) for field in ("credits", "min_amount", "max_org_count")}
+    plan_keys = np.full((len(segments), n_plans), None, dtype=object)
+    plan_name = np.full((len(segments), n_plans), None, dtype=object)
+    for s, segment in enumerate(segments):
+        for p, (key, plan) in enumerate(raw["segments"][segment].items()):
+            plan_keys[s, p] = key
+            plan_name[s, p] = f"{key} ({plan['credits']})"
+            price = plan["price"]
+            for c, currency in enumerate(currencies):
+                amount = price[currency] if isinstance(price, dict) else price
+                list_price[s, c, p] = amount / UNIT_FACTORS[unit]
+            for field in fields:
+                fields[field][s, ..., p] = plan[field]
+
+    price = list_price[:, :, None, :] * billed_months[:, None] / months[:, None]
+    plan_valid = plan_keys != None  # noqa: E711
+    interval_months = raw.get("interval_months", {i: raw["billing_intervals"][i]["months"] for i in intervals})
+    return {
+        "version": str(raw["version"]),
+        "segments": segments,
+        "currencies": currencies,
+        "intervals": intervals,
+        "billing_factor": dict(zip(intervals, (billed_months / months).tolist())),
+        "plan_keys": plan_keys,
+        "plan_name": plan_name,
+        "plan_valid": plan_valid,
+        "price": price,
+        "price_per_credit": price / fields["credits"],
+        **fields,
+        "interval_months": {name: float(value) for name, value in interval_months.items()},
+    }
+
+
+def load_price_book(path: Path = PRICE_BOOK_PATH) -> dict:
+    """
+    Reads and compiles a JSON price book file.
+    """
+    return compile_price_book(json.loads(Path(path).read_text()))
+
+
+def codes(values, categories: list[str], name: str = "value") -> np.ndarray:
+    """
+    Position of every value in categories, raising ValueError for values not in it.
+    """
+    result = pd.Categorical(np.asarray(values, dtype=object), categories=categories).codes.astype(np.intp)
+    if (result < 0).any():
+        unknown = sorted({str(v) for v in np.asarray(values, dtype=object)[result < 0]})
+        raise ValueError(f"Unknown {name} {', '.join(unknown)}, expected one of {categories}")
+    return result
+
+
+def gather_plans(
+    book: dict,
+    segment,
+    currency=DEFAULT_CURRENCY,
+    interval=DEFAULT_INTERVAL,
+) -> dict:
+    """
+    The plans of every company in one gather: segment, currency and interval are names or
+    arrays of names (broadcast against each other). Returns every PLAN_FIELDS array with
+    shape (companies, plans), plus plan_key, plan_name and plan_valid.
+    """
+    s = codes(np.atleast_1d(segment), book["segments"], "segment")
+    c = codes(np.atleast_1d(currency), book["currencies"], "currency")
+    i = codes(np.atleast_1d(interval), book["intervals"], "billing interval")
+    s, c, i = np.broadcast_arrays(s, c, i)
+    gathered = {field: book[field][s, c, i] for field in PLAN_FIELDS}
+    gathered["plan_key"] = book["plan_keys"][s]
+    gathered["plan_name"] = book["plan_name"][s]
+    gathered["plan_valid"] = book["plan_valid"][s]
+    return gathered
+
+
+def plan_table(
+    book: dict,
+    segment: str,
+    currency: str = DEFAULT_CURRENCY,
+    interval: str = DEFAULT_INTERVAL,
+) -> dict:
+    """
+    The plans of one segment, currency and interval as a plan table (see
+    calculations.compile_plans): one 1-D array entry per plan.
+    """
+    gathered = gather_plans(book, segment, currency, interval)
+    valid = gathered.pop("plan_valid")[0]
+    del gathered["plan_key"]
+    return {field: values[0][valid] for field, values in gathered.items()}
+
+
+def plans_dict(
+    book: dict,
+    segment: str,
+    currency: str = DEFAULT_CURRENCY,
+    interval: str = DEFAULT_INTERVAL,
+) -> dict:
+    """
+    The plans of one segment, currency and interval as a plans dictionary
+    ({plan: {price, credits, price_per_credit, min_amount, max_org_count}}).
+    """
+    table = plan_table(book, segment, currency, interval)
+    s = book["segments"].index(segment)
+    keys = [key for key in book["plan_keys"][s] if key is not None]
+    return {
+        key: {
+            "price": float(table["price"][p]),
+            "credits": int(table["credits"][p]),
+            "price_per_credit": float(table["price_per_credit"][p]),
+            "min_amount": int(table["min_amount"][p]),
+            "max_org_count": int(table["max_org_count"][p]),
+        }
+        for p, key in enumerate(keys)
+    }
+
+
+def nested_plans(book: dict, segment: str) -> dict:
+    """
+    The plans of one segment as {currency: {interval: plans dictionary}}.
+    """
+    return {
+        currency: {interval: plans_dict(book, segment, currency, interval) for interval in book["intervals"]}
+        for currency in book["currencies"]
+    }
+
+
+def interval_months(book: dict, interval, interval_count) -> np.ndarray:
+    """
+    Length in months of every Stripe recurring interval (interval_count x interval), with one
+    gather from the book's interval_months. Unknown intervals count as one month.
+    """
+    names = list(book["interval_months"])
+    months = np.append(np.array(list(book["interval_months"].values()), dtype=float), 1.0)
+    positions = pd.Categorical(interval, categories=names).codes
+    return months[positions] * np.asarray(interval_count)
+
+
+def normalize_monthly(amount, interval, interval_count, book: dict) -> np.ndarray:
+    """
+    Amounts per billing interval (interval_count x interval) as monthly amounts.
+    """
+    return np.asarray(amount, dtype=float) / interval_months(book, interval, interval_count)
@@ -0,0 +1,337 @@
+import argparse
+import contextlib
+import io
+import json
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from .cache import cache_schema
+from .calculations import ScenarioMemo
+from .main import DATA_PATH, build_merged_df
+from .sweep import current_price_book, expand_price_book_grid, sweep_price_books
+
+# --- Scenario Service ---
+#
+# A local HTTP service for what-if questions on the price book. The inputs are loaded and
+# merged once and the merged company frame is kept in memory; every request evaluates a
+# price book against it with the vectorized sweep (sweep.py), next to the price book in
+# calculations.py. Results are cached by price-book hash with LRU eviction, and plan
+# selections by price book and scenario inputs (ScenarioMemo), so the current book and any
+# distinct input pair already seen are not evaluated again. Before each request the data/
+# files are checked, and a change reloads the inputs and clears the result cache.
+#
+#   python -m src.service --port 8050
+#   curl localhost:8050/scenario -d '{"brand_plans": {"pro": {"price": 219, "credits": 16000}}}'
+#
+# The request body is a price book, complete or partial: any value it sets overrides the
+# current one, and a plan's price_per_credit follows a new price or credits unless it is
+# set too. Endpoints:
+#   GET  /health       companies loaded, load time and cache statistics
+#   GET  /price-book   the current price book
+#   POST /scenario     totals for the current and the requested book, and the companies
+#                      whose ARR change moves (largest first, ?limit=N, default 100, 0 = all)
+
+DEFAULT_PORT = 8050
+DEFAULT_CACHE_SIZE = 128
+DEFAULT_COMPANY_LIMIT = 100
+INPUT_FILES = (
+    "processed_companies.json",
+    "processed_organizations.json",
+    "stripe_subscription_items.json",
+    "stripe_coupons.json",
+    "stripe_prices.json",
+    "stripe_products.json",
+)
+# Plan fields that must be positive numbers, and plan fields that must be positive integers
+POSITIVE_FIELDS = ("price", "credits", "price_per_credit")
+INTEGER_FIELDS = ("max_org_count",)
+
+
+def _flatten(book: dict, prefix: str = "") -> dict:
+    # {"brand_plans": {"pro": {"price": 1}}} -> {"brand_plans.pro.price": 1}
+    paths = {}
+    for key, value in book.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            paths.update(_flatten(value, f"{path}."))
+        else:
+            paths[path] = value
+    return paths
+
+
+def _type_name(value) -> str:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return "number"
+    return type(value).__name__
+
+
+def _same_type(value, current) -> bool:
+    if isinstance(current, bool):
+        return isinstance(value, bool)
+    if isinstance(current, (int, float)):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return isinstance(value, type(current))
+
+
+def resolve_price_book(overrides: dict) -> dict:
+    """
+    Applies a complete or partial price book on top of the current one.
+    Raises ValueError listing the paths that are not in the current book, whose value
+    has another type than the current one (e.g. a segment set to a number), or whose value
+    is out of range (non-positive prices or credits, non-integer org limits).
+    """
+    paths = _flatten(overrides)
+    current = _flatten(current_price_book())
+    unknown = sorted(path for path in paths if path not in current)
+    invalid = sorted(
+        f"{path} (expected {_type_name(current[path])}, got {_type_name(value)})"
+        for path, value in paths.items()
+        if path in current and not _same_type(value, current[path])
+    )
+    for path, value in paths.items():
+        if path not in current or not _same_type(value, current[path]):
+            continue
+        field = path.rsplit(".", 1)[-1]
+        if field in POSITIVE_FIELDS and value <= 0:
+            invalid.append(f"{path} (must be positive, got {value})")
+        elif field in INTEGER_FIELDS and (value != int(value) or value < 1):
+            invalid.append(f"{path} (must be a positive integer, got {value})")
+        elif field == "min_amount" and value < 0:
+            invalid.append(f"{path} (must not be negative, got {value})")
+    errors = []
+    if unknown:
+        errors.append(f"Unknown price book entries: {', '.join(unknown)}")
+    if invalid:
+        errors.append(f"Invalid price book values: {', '.join(sorted(invalid))}")
+    if errors:
+        raise ValueError("; ".join(errors))
+    return expand_price_book_grid({path: [value] for path, value in paths.items()})[0]
+
+
+def _data_version(data_path: Path) -> tuple:
+    stats = [(data_path / file_name).stat() for file_name in INPUT_FILES]
+    return tuple((stat.st_mtime_ns, stat.st_size) for stat in stats)
+
+
+class ScenarioService:
+    """
+    Merged company data held in memory, and an LRU cache of evaluated price books.
+    """
+
+    def __init__(
+        self,
+        data_path: Path = DATA_PATH,
+        cache_dir: Path | None = None,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ):
+        self.data_path = data_path
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.memo = ScenarioMemo()
+        self.lock = threading.Lock()
+        self.version = None
+        self.reload_if_changed()
+
+    def reload_if_changed(self) -> bool:
+        """
+        Loads and merges the inputs if the data/ files changed since the last load.
+        """
+        version = _data_version(self.data_path)
+        if version == self.version:
+            return False
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            merged_df = build_merged_df(self.data_path, cache_dir=self.cache_dir)
+        self.merged_df = merged_df
+        self.company_ids = merged_df["id"].to_numpy()
+        self.company_names = merged_df["name"].to_numpy()
+        self.loaded_at = datetime.now(timezone.utc).isoformat()
+        self.version = version
+        self.results.clear()
+        print(f"Loaded {len(merged_df)} companies from {self.data_path}")
+        return True
+
+    def _evaluate(self, book: dict) -> dict:
+        baseline = current_price_book()
+        sweep = sweep_price_books(self.merged_df, [baseline, book], memo=self.memo)
+        summary = sweep["summary"]
+        arr_change = sweep["arr_change"].to_numpy()
+
+        def totals(i: int) -> dict:
+            return {
+                "mrr": int(summary["mrr"].iloc[i]),
+                "arr_change": int(summary["arr_change"].iloc[i]),
+                "plan_counts": {
+                    plan: int(count) for plan, count in sweep["plan_counts"].iloc[i].items()
+                },
+            }
+
+        delta = arr_change[:, 1] - arr_change[:, 0]
+        changed = np.flatnonzero(delta)
+        changed = changed[np.argsort(-np.abs(delta[changed]), kind="stable")]
+        return {
+            "current_mrr": int(summary["current_mrr"].iloc[0]),
+            "current": totals(0),
+            "scenario": totals(1),
+            "arr_change_delta": int(summary["arr_change"].iloc[1] - summary["arr_change"].iloc[0]),
+            "companies_changed": len(changed),
+            "companies": [
+                {
+                    "company_id": self.company_ids[i],
+                    "company_name": self.company_names[i],
+                    "arr_change_current": int(arr_change[i, 0]),
+                    "arr_change": int(arr_change[i, 1]),
+                    "delta": int(delta[i]),
+                }
+                for i in changed
+            ],
+        }
+
+    def scenario(self, overrides: dict, limit: int = DEFAULT_COMPANY_LIMIT) -> dict:
+        """
+        Evaluates a complete or partial price book, from the cache when possible.
+        """
+        book = resolve_price_book(overrides)
+        key = cache_schema(book)
+
+        with self.lock:
+            self.reload_if_changed()
+            result = self.results.get(key)
+            if result is not None:
+                self.hits += 1
+                self.results.move_to_end(key)
+            else:
+                self.misses += 1
+                result = self._evaluate(book)
+                self.results[key] = result
+                if len(self.results) > self.cache_size:
+                    self.results.popitem(last=False)
+
+        return {
+            **result,
+            "price_book_hash": key,
+            "price_book": book,
+            "companies": result["companies"][:limit] if limit else result["companies"],
+        }
+
+    def health(self) -> dict:
+        with self.lock:
+            self.reload_if_changed()
+            return {
+                "status": "ok",
+                "companies": len(self.merged_df),
+                "loaded_at": self.loaded_at,
+                "cache": {
+                    "size": len(self.results),
+                    "max_size": self.cache_size,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                },
+                "scenario_memo": {"books": len(self.memo.books), **self.memo.stats()},
+            }
+
+
+def make_handler(service: ScenarioService):
+    """
+    Request handler class bound to a ScenarioService.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: dict):
+            payload = json.dumps(body, default=str).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == "/health":
+                try:
+                    health = service.health()
+                except Exception as e:
+                    self.log_error("%s", traceback.format_exc())
+                    self._send(500, {"error": f"{type(e).__name__}: {e}"})
+                    return
+                self._send(200, health)
+            elif path == "/price-book":
+                self._send(200, current_price_book())
+            else:
+                self._send(404, {"error": f"Unknown path {path}"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != "/scenario":
+                self._send(404, {"error": f"Unknown path {url.path}"})
+                return
+
+            start = time.perf_counter()
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                overrides = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(overrides, dict):
+                    raise ValueError("The request body must be a JSON object")
+                limit = int(parse_qs(url.query).get("limit", [DEFAULT_COMPANY_LIMIT])[0])
+                result = service.scenario(overrides, limit)
+            except ValueError as e:
+                self._send(400, {"error": str(e)})
+                return
+            except Exception as e:
+                # Anything else (e.g. an input file missing on reload) must still get a response
+                self.log_error("%s", traceback.format_exc())
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+                return
+            result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            self._send(200, result)
+
+    return Handler
+
+
+def main():
+    """Main"""
+    parser = argparse.ArgumentParser(description="Serve what-if price book scenarios over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--data-path", type=Path, default=DATA_PATH)
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+        help="number of evaluated price books to keep (default: 128)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="do not use the columnar input cache in data/.cache when loading",
+    )
+    args = parser.parse_args()
+
+    service = ScenarioService(
+        args.data_path,
+        cache_dir=None if args.no_cache else args.data_path / ".cache",
+        cache_size=args.cache_size,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"Serving scenarios on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .calculations import (
+    AGENCY_PLANS,
+    BRAND_PLANS,
+    GUARDRAIL_ORG_COUNT,
+    MODEL_ID_PRICE_MAP,
+    RUNS_PER_MONTH,
+    build_model_price_index,
+    compile_plans,
+    select_plans,
+)
+
+# --- Usage Growth Simulation ---
+#
+# Plan selection is deterministic on today's credits_capacity, the credits of every
+# organization's prompt_limit. The simulation asks which plans companies need for the
+# credits they actually use after usage changes: for every draw, every organization gets
+#   prompt_growth         a factor on prompts_count
+#   models_added          a number of models added to model_ids, each priced like a model of
+#                         MODEL_ID_PRICE_MAP drawn at random
+#   chat_interval_factor  a factor on chat_interval_in_hours; organizations running more than
+#                         once a day use 24 / chat_interval_in_hours times the daily runs
+# from configurable distributions. The organizations' used credits are summed per company
+# and plans are selected again (select_plans), for all companies x draws at once: companies
+# are processed in chunks of company_chunk_size, and each chunk's organizations in blocks of
+# at most block_cells organizations x draws. A distribution is {"distribution": name,
+# **params} with the parameters of numpy's Generator method of that name (e.g.
+# {"distribution": "lognormal", "mean": 0.05, "sigma": 0.25}), or {"distribution":
+# "constant", "value": 1}. With constant distributions (1, 0, 1) every draw selects the plans
+# for today's credits_usage.
+#
+# The baseline is the plan and MRR for today's usage (credits_usage, i.e. the draw with no
+# growth), so that the results measure growth rather than the gap between capacity and
+# usage. Reported per company: the baseline plan and MRR, the plan and MRR on
+# credits_capacity (capacity_plan_name and capacity_mrr, as in migrate.csv), the simulated
+# MRR (mean, p5, p95), the probability of a plan other than the baseline, the mean ARR
+# change, and mrr_at_risk: the baseline MRR minus the 5th percentile of the simulated MRR,
+# i.e. the MRR a company would no longer need in the worst 5% of draws. Overall: quantiles
+# of the total ARR change over draws and the probabilities of moving from the baseline plan
+# to every plan.
+#
+#   python -m src.simulation --draws 10000 [--distributions dist.json] [--seed 0]
+#
+# Draws are reproducible for the same seed and chunk sizes.
+
+DEFAULT_DISTRIBUTIONS = {
+    "prompt_growth": {"distribution": "lognormal", "mean": 0.05, "sigma": 0.25},
+    "models_added": {"distribution": "poisson", "lam": 0.2},
+    "chat_interval_factor": {"distribution": "constant", "value": 1.0},
+}
+DISTRIBUTIONS = ("constant", "lognormal", "normal", "uniform", "gamma", "triangular", "poisson", "binomial")
+QUANTILES = [5, 25, 50, 75, 95]
+DEFAULT_DRAWS = 1000
+DEFAULT_COMPANY_CHUNK_SIZE = 1000
+DEFAULT_BLOCK_CELLS = 2_000_000
+
+
+def resolve_distributions(distributions: dict) -> dict:
+    """
+    Applies (partial) distributions on top of DEFAULT_DISTRIBUTIONS.
+    """
+    unknown = set(distributions) - set(DEFAULT_DISTRIBUTIONS)
+    if unknown:
+        raise ValueError(f"Unknown distributions: {', '.join(sorted(unknown))}")
+    resolved = {**DEFAULT_DISTRIBUTIONS, **distributions}
+    for name, spec in resolved.items():
+        if spec.get("distribution") not in DISTRIBUTIONS:
+            raise ValueError(f"{name}: distribution must be one of {DISTRIBUTIONS}, got {spec.get('distribution')!r}")
+    return resolved
+
+
+def _draw(rng: np.random.Generator, spec: dict, shape: tuple) -> np.ndarray:
+    params = {key: value for key, value in spec.items() if key != "distribution"}
+    if spec["distribution"] == "constant":
+        return np.full(shape, float(params["value"]))
+    return getattr(rng, spec["distribution"])(**params, size=shape)
+
+
+def _added_model_prices(rng: np.random.Generator, models_added: np.ndarray) -> np.ndarray:
+    # Sum of the prices of models_added random models, drawn per price level of the map
+    levels, counts = np.unique(np.fromiter(MODEL_ID_PRICE_MAP.values(), dtype=float), return_counts=True)
+    added = np.clip(np.rint(models_added), 0, None).astype(np.int64)
+    prices = np.zeros(added.shape)
+    nonzero = added > 0
+    if nonzero.any():
+        prices[nonzero] = rng.multinomial(added[nonzero], counts / counts.sum()) @ levels
+    return prices
+
+
+def _runs_factor(interval: np.ndarray) -> np.ndarray:
+    # Runs per day relative to daily runs; intervals of 0 (not set) count as daily
+    interval = np.where(interval > 0, interval, 24.0)
+    return np.maximum(1.0, 24.0 / interval)
+
+
+def simulate_org_credits(
+    rng: np.random.Generator,
+    orgs: dict,
+    n_draws: int,
+    distributions: dict,
+) -> np.ndarray:
+    """
+    Simulated used credits of every organization (rows) in every draw (columns).
+    orgs holds arrays of model_price_sum, prompts_count and chat_interval_in_hours.
+    """
+    shape = (len(orgs["prompts_count"]), n_draws)
+    prompts = orgs["prompts_count"][:, None] * _draw(rng, distributions["prompt_growth"], shape)
+    model_price_sum = orgs["model_price_sum"][:, None] + _added_model_prices(
+        rng, _draw(rng, distributions["models_added"], shape)
+    )
+    interval = orgs["chat_interval_in_hours"][:, None]
+    runs_factor = _runs_factor(interval * _draw(rng, distributions["chat_interval_factor"], shape)) / _runs_factor(
+        interval
+    )
+    return np.trunc(model_price_sum * prompts * RUNS_PER_MONTH * runs_factor)
+
+
+def simulate(
+    merged_df: pd.DataFrame,
+    orgs_df: pd.DataFrame,
+    n_draws: int = DEFAULT_DRAWS,
+    distributions: dict | None = None,
+    seed: int = 0,
+    company_chunk_size: int = DEFAULT_COMPANY_CHUNK_SIZE,
+    block_cells: int = DEFAULT_BLOCK_CELLS,
+) -> dict:
+    """
+    Runs n_draws usage draws for every company of merged_df, whose organizations are the
+    rows of orgs_df. Returns the per-company frame (aligned on merged_df), the quantiles of
+    the total ARR change and the plan transition probabilities.
+    """
+    distributions = resolve_distributions(distributions or {})
+    rng = np.random.default_rng(seed)
+
+    # Organizations grouped by company, in the order of merged_df
+    company_ids = pd.Index(merged_df["id"])
+    org_company = company_ids.get_indexer(orgs_df["company_id"])
+    keep = np.flatnonzero(org_company >= 0)
+    order = keep[np.argsort(org_company[keep], kind="stable")]
+    org_company = org_company[order]
+    org_offsets = np.searchsorted(org_company, np.arange(len(merged_df) + 1))
+    model_price_sum = build_model_price_index(orgs_df["model_ids"])["model_price_sum"]
+    orgs = {
+        "model_price_sum": model_price_sum[order],
+        "prompts_count": orgs_df["prompts_count"].to_numpy(dtype=float)[order],
+        "chat_interval_in_hours": orgs_df["chat_interval_in_hours"].to_numpy(dtype=float)[order],
+    }
+
+    is_brand = (merged_df["type"] == "IN_HOUSE").to_numpy()
+    segments = {"brand_plans": compile_plans(BRAND_PLANS), "agency_plans": compile_plans(AGENCY_PLANS)}
+    segment_of = np.where(is_brand, "brand_plans", "agency_plans")
+    orgs_count = merged_df["orgs_count"].to_numpy(dtype=float)
+    current_mrr = merged_df["current_mrr"].to_numpy(dtype=float)
+
+    def plans_for(credits: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        plan_index = np.zeros(len(merged_df), dtype=np.int64)
+        cost = np.zeros(len(merged_df))
+        for segment, plan_table in segments.items():
+            mask = segment_of == segment
+            selected = select_plans(credits[mask], orgs_count[mask], plan_table, GUARDRAIL_ORG_COUNT)
+            plan_index[mask] = selected["plan_index"]
+            cost[mask] = selected["cost"]
+        return plan_index, np.trunc(cost)
+
+    # The baseline: plans for today's usage, the draw without growth; plans on
+    # credits_capacity (as in migrate.csv) are reported alongside
+    baseline_plan, baseline_mrr = plans_for(merged_df["credits_usage"].to_numpy(dtype=float))
+    capacity_plan, capacity_mrr = plans_for(merged_df["credits_capacity"].to_numpy(dtype=float))
+
+    n_plans = max(len(plan_table["price"]) for plan_table in segments.values())
+    transitions = {segment: np.zeros((n_plans, n_plans), dtype=np.int64) for segment in segments}
+    total_arr_change = np.zeros(n_draws, dtype=np.int64)
+    per_company = {
+        field: np.zeros(len(merged_df))
+        for field in ("mrr_mean", "mrr_p5", "mrr_p95", "plan_change_probability", "arr_change_mean")
+    }
+
+    for start in range(0, len(merged_df), company_chunk_size):
+        companies = np.arange(start, min(start + company_chunk_size, len(merged_df)))
+        org_start, org_end = org_offsets[companies[0]], org_offsets[companies[-1] + 1]
+        chunk_orgs = {field: values[org_start:org_end] for field, values in orgs.items()}
+        # reduceat needs every company to have organizations; merge_inputs guarantees it
+        starts = org_offsets[companies] - org_start
+        draws_per_block = max(1, min(n_draws, block_cells // max(org_end - org_start, 1)))
+
+        cost = np.empty((len(companies), n_draws))
+        plan = np.empty((len(companies), n_draws), dtype=np.int8)
+        for draw_start in range(0, n_draws, draws_per_block):
+            draws = slice(draw_start, min(draw_start + draws_per_block, n_draws))
+            n_block = draws.stop - draws.start
+            credits = np.add.reduceat(simulate_org_credits(rng, chunk_orgs, n_block, distributions), starts, axis=0)
+            for segment, plan_table in segments.items():
+                rows = np.flatnonzero(segment_of[companies] == segment)
+                if not len(rows):
+                    continue
+                selected = select_plans(
+                    credits[rows].ravel(),
+                    np.repeat(orgs_count[companies[rows]], n_block),
+                    plan_table,
+                    GUARDRAIL_ORG_COUNT,
+                )
+                cost[rows, draws] = selected["cost"].reshape(len(rows), n_block)
+                plan[rows, draws] = selected["plan_index"].reshape(len(rows), n_block)
+
+        mrr = np.trunc(cost)
+        arr_change = np.trunc((cost - current_mrr[companies, None]) * 12)
+        total_arr_change += arr_change.sum(axis=0).astype(np.int64)
+        p5, p95 = np.percentile(mrr, [5, 95], axis=1)
+        per_company["mrr_mean"][companies] = mrr.mean(axis=1)
+        per_company["mrr_p5"][companies] = p5
+        per_company["mrr_p95"][companies] = p95
+        per_company["plan_change_probability"][companies] = (plan != baseline_plan[companies, None]).mean(axis=1)
+        per_company["arr_change_mean"][companies] = arr_change.mean(axis=1)
+        for segment in segments:
+            rows = segment_of[companies] == segment
+            pairs = baseline_plan[companies][rows, None] * n_plans + plan[rows]
+            transitions[segment] += np.bincount(pairs.ravel(), minlength=n_plans * n_plans).reshape(n_plans, n_plans)
+
+    def plan_names(plan_index: np.ndarray) -> np.ndarray:
+        return np.array(
+            [segments[segment]["plan_name"][p] for segment, p in zip(segment_of, plan_index)], dtype=object
+        )
+
+    companies_df = pd.DataFrame(
+        {
+            "company_id": merged_df["id"].to_numpy(dtype=object),
+            "company_name": merged_df["name"].to_numpy(dtype=object),
+            "company_type": merged_df["type"].to_numpy(dtype=object),
+            "plan_name": plan_names(baseline_plan),
+            "mrr": baseline_mrr.astype(int),
+            "capacity_plan_name": plan_names(capacity_plan),
+            "capacity_mrr": capacity_mrr.astype(int),
+            **{field: values.round(2) for field, values in per_company.items()},
+            "mrr_at_risk": np.maximum(0, baseline_mrr - per_company["mrr_p5"]).round(2),
+        },
+        index=merged_df.index,
+    )
+
+    transition_rows = []
+    for segment, counts in transitions.items():
+        names = segments[segment]["plan_name"]
+        for i, from_plan in enumerate(names):
+            total = counts[i].sum()
+            if total:
+                transition_rows += [
+                    {"from_plan": from_plan, "to_plan": to_plan, "probability": round(counts[i, j] / total, 4)}
+                    for j, to_plan in enumerate(names)
+                ]
+
+    return {
+        "draws": n_draws,
+        "distributions": distributions,
+        "companies": companies_df,
+        "arr_change_quantiles": {
+            f"p{q}": float(value) for q, value in zip(QUANTILES, np.percentile(total_arr_change, QUANTILES))
+        },
+        "arr_change_mean": float(total_arr_change.mean()),
+        "plan_transitions": pd.DataFrame(transition_rows, columns=["from_plan", "to_plan", "probability"]),
+    }
+
+
+def main():
+    """Main"""
+    from .main import DATA_PATH, load_inputs, merge_inputs
+
+    parser = argparse.ArgumentParser(description="Simulate usage growth and its effect on plans and MRR.")
+    parser.add_argument("--draws", type=int, default=DEFAULT_DRAWS)
+    parser.add_argument(
+        "--distributions", type=Path, help="JSON file of distributions (default: DEFAULT_DISTRIBUTIONS)"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--company-chunk-size", type=int, default=DEFAULT_COMPANY_CHUNK_SIZE)
+    parser.add_argument("--data-path", type=Path, default=DATA_PATH)
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="per-company results CSV (default: migrate_simulation.csv in the data path); "
+        "the summary is written next to it as JSON",
+    )
+    args = parser.parse_args()
+
+    inputs = load_inputs(args.data_path, cache_dir=args.data_path / ".cache")
+    merged_df = merge_inputs(inputs)
+    distributions = json.loads(args.distributions.read_text()) if args.distributions else {}
+
+    print(f"Simulating {args.draws} draws for {len(merged_df)} companies...")
+    result = simulate(
+        merged_df,
+        inputs["orgs"],
+        args.draws,
+        distributions,
+        seed=args.seed,
+        company_chunk_size=args.company_chunk_size,
+    )
+
+    output_path = args.output or args.data_path / "migrate_simulation.csv"
+    result["companies"].to_csv(output_path, index=False)
+    summary_path = output_path.with_suffix(".json")
+    summary = {key: value for key, value in result.items() if key not in ("companies", "plan_transitions")}
+    summary["plan_transitions"] = result["plan_transitions"].to_dict(orient="records")
+    summary_path.write_text(json.dumps(summary, indent=2))
+
+    print(f"Total ARR change over draws: {result['arr_change_quantiles']}")
+    print(f"MRR at risk (5th percentile): {result['companies']['mrr_at_risk'].sum():,.0f}")
+    for from_plan, rows in result["plan_transitions"].groupby("from_plan", sort=False):
+        moves = ", ".join(f"{row.to_plan} {row.probability:.1%}" for row in rows.itertuples() if row.probability)
+        print(f"  {from_plan:<20} -> {moves}")
+    print(f"Simulation written to {output_path} and {summary_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .calculations import GUARDRAIL_ORG_COUNT, PRICE_BOOK, compile_plans
+from .sweep import current_price_book
+
+# --- Custom Plan Solver ---
+#
+# Generalizes plan selection (select_plans) to configurable constraint sets. For every
+# company and every plan of its segment, the solver sizes the credit top-up needed on top
+# of the plan and prices it; the company gets the cheapest allowed option. A constraint set
+# is a dictionary with any of the DEFAULT_CONSTRAINTS keys:
+#   headroom                fraction of credits required on top of credits_capacity (0.1 = 10%)
+#   round_up_to             round the required credits up to a multiple of this (0 = no rounding)
+#   granularity             top-ups are bought in multiples of this many credits
+#   min_top_up              smallest top-up; None uses each plan's min_amount
+#   waive_min_for_overpayers  no minimum top-up when the company already pays more than the
+#                           plan with the exact top-up costs
+#   billing                 a billing interval of the price book, e.g. "month", or "year" for
+#                           annual prices (billed_months of every 12 months of the monthly price)
+#   guardrail_org_count     only allow plans whose max_org_count covers the company's orgs
+#   custom_plan             also offer a free-flow plan: exactly the required credits at the
+#                           lowest price per credit of the allowed plans, but never less than
+#                           the cheapest allowed plan
+# With DEFAULT_CONSTRAINTS the result equals calculate_scenarios. Every constraint set is
+# evaluated as one (companies x plans) broadcast, in chunks of chunk_size companies.
+#
+#   python -m src.solver --constraints constraint_sets.json [--output solutions.csv]
+#
+# where constraint_sets.json maps set names to constraint sets.
+
+DEFAULT_CHUNK_SIZE = 100_000
+DEFAULT_CONSTRAINTS = {
+    "headroom": 0.0,
+    "round_up_to": 0,
+    "granularity": 1,
+    "min_top_up": None,
+    "waive_min_for_overpayers": False,
+    "billing": "month",
+    "guardrail_org_count": GUARDRAIL_ORG_COUNT,
+    "custom_plan": False,
+}
+EXAMPLE_CONSTRAINT_SETS = {
+    "current": {},
+    "headroom_5": {"headroom": 0.05},
+    "headroom_10": {"headroom": 0.1},
+    "round_up_1000": {"round_up_to": 1000},
+    "annual": {"billing": "year"},
+    "custom_plan": {"custom_plan": True},
+    "min_1000_waived_for_overpayers": {"min_top_up": 1000, "waive_min_for_overpayers": True},
+}
+
+
+def resolve_constraints(constraints: dict) -> dict:
+    """
+    Applies a (partial) constraint set on top of DEFAULT_CONSTRAINTS.
+    """
+    unknown = set(constraints) - set(DEFAULT_CONSTRAINTS)
+    if unknown:
+        raise ValueError(f"Unknown constraints: {', '.join(sorted(unknown))}")
+    resolved = {**DEFAULT_CONSTRAINTS, **constraints}
+    if resolved["billing"] not in PRICE_BOOK["intervals"]:
+        raise ValueError(f"billing must be one of {PRICE_BOOK['intervals']}, got {resolved['billing']!r}")
+    if resolved["granularity"] < 1:
+        raise ValueError("granularity must be at least 1")
+    return resolved
+
+
+def _round_up(values: np.ndarray, multiple: float) -> np.ndarray:
+    return np.ceil(values / multiple) * multiple if multiple and multiple > 1 else values
+
+
+def solve_plans(
+    credits_capacity: np.ndarray,
+    orgs_count: np.ndarray,
+    current_mrr: np.ndarray,
+    plan_table: dict,
+    constraints: dict,
+) -> dict:
+    """
+    Cheapest allowed plan plus top-up for every company under one resolved constraint set.
+    Returns arrays of the chosen plan index (len(plans) for the custom plan), monthly cost,
+    required credits, top-up credits and surplus credits.
+    """
+    capacity = np.asarray(credits_capacity, dtype=float)[:, None]
+    orgs = np.asarray(orgs_count, dtype=float)[:, None]
+    current = np.asarray(current_mrr, dtype=float)[:, None]
+    price_factor = PRICE_BOOK["billing_factor"][constraints["billing"]]
+
+    required = capacity
+    if constraints["headroom"]:
+        required = capacity * (1 + constraints["headroom"])
+    required = _round_up(required, constraints["round_up_to"])
+
+    # Filter plans based on the number of organizations, falling back to the largest plan
+    allowed = ~np.asarray(constraints["guardrail_org_count"], dtype=bool) | (
+        plan_table["max_org_count"] >= orgs
+    )
+    largest_plan = np.arange(len(plan_table["price"])) == np.argmax(plan_table["max_org_count"])
+    allowed = allowed | (~allowed.any(axis=-1, keepdims=True) & largest_plan)
+
+    shortfall = np.maximum(0, required - plan_table["credits"])
+    min_top_up = (
+        plan_table["min_amount"] if constraints["min_top_up"] is None else constraints["min_top_up"]
+    )
+    below_min = (shortfall > 0) & (shortfall < min_top_up)
+    if constraints["waive_min_for_overpayers"]:
+        exact_cost = (plan_table["price"] + shortfall * plan_table["price_per_credit"]) * price_factor
+        below_min &= current < exact_cost
+    top_up = _round_up(np.where(below_min, min_top_up, shortfall), constraints["granularity"])
+
+    cost = (plan_table["price"] + top_up * plan_table["price_per_credit"]) * price_factor
+    cost = np.where(allowed, cost, np.inf)
+    credits = np.broadcast_to(plan_table["credits"], cost.shape)
+
+    if constraints["custom_plan"]:
+        lowest_rate = np.where(allowed, plan_table["price_per_credit"], np.inf).min(axis=-1, keepdims=True)
+        cheapest_plan = np.where(allowed, plan_table["price"], np.inf).min(axis=-1, keepdims=True)
+        custom_cost = np.maximum(cheapest_plan, required * lowest_rate) * price_factor
+        cost = np.concatenate([cost, custom_cost], axis=-1)
+        top_up = np.concatenate([top_up, np.zeros_like(custom_cost)], axis=-1)
+        credits = np.concatenate([credits, np.broadcast_to(required, custom_cost.shape)], axis=-1)
+
+    best = np.argmin(cost, axis=-1)[:, None]
+    best_top_up = np.take_along_axis(top_up, best, axis=-1)[:, 0]
+    best_credits = np.take_along_axis(credits, best, axis=-1)[:, 0]
+    return {
+        "plan_index": best[:, 0],
+        "cost": np.take_along_axis(cost, best, axis=-1)[:, 0],
+        "required_credits": np.broadcast_to(required, capacity.shape)[:, 0],
+        "top_up_credits": best_top_up,
+        "surplus_credits": best_credits + best_top_up - capacity[:, 0],
+    }
+
+
+def solve(
+    merged_df: pd.DataFrame,
+    constraint_sets: dict[str, dict],
+    price_book: dict | None = None,
+    chunk_size: int | None = DEFAULT_CHUNK_SIZE,
+) -> dict[str, pd.DataFrame]:
+    """
+    Solves every constraint set for every company of merged_df against price_book (the
+    current one by default). Returns one DataFrame per constraint set, aligned on the index
+    of merged_df, with the calculate_scenarios columns plus required_credits.
+    """
+    price_book = price_book or current_price_book()
+    resolved = {name: resolve_constraints(constraints) for name, constraints in constraint_sets.items()}
+
+    is_brand = (merged_df["type"] == "IN_HOUSE").to_numpy()
+    credits_capacity = merged_df["credits_capacity"].to_numpy(dtype=float)
+    orgs_count = merged_df["orgs_count"].to_numpy(dtype=float)
+    current_mrr = merged_df["current_mrr"].to_numpy(dtype=float)
+    chunk_size = chunk_size or max(len(merged_df), 1)
+
+    segments = []
+    for segment, mask in (("brand_plans", is_brand), ("agency_plans", ~is_brand)):
+        plan_table = compile_plans(price_book[segment])
+        segments.append((np.flatnonzero(mask), plan_table))
+
+    solutions = {}
+    for name, constraints in resolved.items():
+        plan_name = np.empty(len(merged_df), dtype=object)
+        custom = np.zeros(len(merged_df), dtype=bool)
+        fields = {
+            field: np.zeros(len(merged_df))
+            for field in ("cost", "required_credits", "top_up_credits", "surplus_credits")
+        }
+        for rows, plan_table in segments:
+            n_plans = len(plan_table["plan_name"])
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start : start + chunk_size]
+                solved = solve_plans(
+                    credits_capacity[chunk], orgs_count[chunk], current_mrr[chunk], plan_table, constraints
+                )
+                custom[chunk] = solved["plan_index"] == n_plans
+                plan_name[chunk] = plan_table["plan_name"][np.minimum(solved["plan_index"], n_plans - 1)]
+                for field in fields:
+                    fields[field][chunk] = solved[field]
+
+        # The custom plan is named after the credits it includes, like the fixed plans
+        plan_name[custom] = [
+            f"custom ({credits})" for credits in np.ceil(fields["required_credits"][custom]).astype(int)
+        ]
+        cost = fields["cost"]
+        solutions[name] = pd.DataFrame(
+            {
+                "plan_name": plan_name,
+                "mrr": np.trunc(cost).astype(int),
+                "mrr_change": np.trunc(cost - current_mrr).astype(int),
+                "arr_change": np.trunc((cost - current_mrr) * 12).astype(int),
+                "required_credits": np.ceil(fields["required_credits"]).astype(int),
+                "extra_credits_purchased": np.trunc(fields["top_up_credits"]).astype(int),
+                "surplus_credits": np.trunc(fields["surplus_credits"]).astype(int),
+            },
+            index=merged_df.index,
+        )
+    return solutions
+
+
+def summarize_solutions(solutions: dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    One row per constraint set: total new MRR, ARR change, custom plans and top-ups.
+    """
+    return pd.DataFrame(
+        {
+            name: {
+                "mrr": int(solution["mrr"].sum()),
+                "arr_change": int(solution["arr_change"].sum()),
+                "custom_plans": int(solution["plan_name"].str.startswith("custom").sum()),
+                "companies_topping_up": int((solution["extra_credits_purchased"] > 0).sum()),
+                "extra_credits_purchased": int(solution["extra_credits_purchased"].sum()),
+            }
+            for name, solution in solutions.items()
+        }
+    ).T.rename_axis("constraint_set")
+
+
+def main():
+    """Main"""
+    from .main import DATA_PATH, build_merged_df
+
+    parser = argparse.ArgumentParser(description="Solve custom plans under several constraint sets.")
+    parser.add_argument(
+        "--constraints",
+        type=Path,
+        help="JSON file of constraint set names to constraint sets (default: EXAMPLE_CONSTRAINT_SETS)",
+    )
+    parser.add_argument("--data-path", type=Path, default=DATA_PATH)
+    parser.add_argument("--output", type=Path, help="write every company's solution per set to this CSV")
+    args = parser.parse_args()
+
+    constraint_sets = json.loads(args.constraints.read_text()) if args.constraints else EXAMPLE_CONSTRAINT_SETS
+    merged_df = build_merged_df(args.data_path, cache_dir=args.data_path / ".cache")
+    solutions = solve(merged_df, constraint_sets)
+    print(summarize_solutions(solutions).to_string())
+
+    if args.output:
+        long_df = pd.concat(
+            [
+                solution.assign(company_id=merged_df["id"].to_numpy(), constraint_set=name)
+                for name, solution in solutions.items()
+            ],
+            ignore_index=True,
+        )
+        long_df[["constraint_set", "company_id", *solutions[next(iter(solutions))].columns]].to_csv(
+            args.output, index=False
+        )
+        print(f"Solutions written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
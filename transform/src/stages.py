@@ -0,0 +1,317 @@
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from .calculations import (
+    build_model_price_index,
+    calculate_credits,
+    monthly_amount_off,
+    plan_prompt_limits,
+    resolve_coupons,
+)
+
+# --- Transformation Stages ---
+#
+# Each function below is one named stage of the ETL pipeline (see merge_inputs in main.py),
+# taking and returning DataFrames so that it can be timed and profiled on its own.
+
+
+def compute_org_credits(orgs_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds credits_usage, credits_capacity and unknown_model_count to every organization.
+    """
+    # Calculate credits per organization
+    model_index = build_model_price_index(orgs_df["model_ids"])
+    orgs_df[["credits_usage", "credits_capacity", "unknown_model_count"]] = calculate_credits(
+        orgs_df, model_index
+    )
+    _warn_unknown_models((orgs_df["unknown_model_count"] > 0).sum(), model_index["unknown_model_ids"])
+
+    return orgs_df
+
+
+def _warn_unknown_models(org_count: int, model_ids: list[str]):
+    if model_ids:
+        print(
+            f"Warning: {org_count} organizations use model ids "
+            f"without a price, counted as 0 credits: {', '.join(model_ids)}"
+        )
+
+
+def aggregate_orgs(orgs_df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """
+    Per-company credits and usage, organization counts and high-frequency organization counts.
+    """
+    # Aggregate credits and usage by company
+    company_credits = (
+        orgs_df.groupby("company_id", observed=True)
+        .agg(
+            prompt_usage=("prompts_count", "sum"),
+            credits_capacity=("credits_capacity", "sum"),
+            credits_usage=("credits_usage", "sum"),
+        )
+        .reset_index()
+    )
+
+    # count orgs per company
+    orgs_count_df = orgs_df.groupby("company_id", observed=True).size().reset_index(name="orgs_count")
+
+    # Count high-frequency orgs (more than once a day)
+    high_freq_orgs_df = (
+        orgs_df[
+            (orgs_df["chat_interval_in_hours"] < 24)
+            & (orgs_df["chat_interval_in_hours"] > 0)
+        ]
+        .groupby("company_id", observed=True)
+        .size()
+        .reset_index(name="orgs_count_hf")
+    )
+
+    return {
+        "company_credits": company_credits,
+        "orgs_count": orgs_count_df,
+        "high_freq_orgs": high_freq_orgs_df,
+    }
+
+
+def partial_org_aggregates(orgs_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per-company sums over one chunk of organizations with credits (see compute_org_credits),
+    indexed by company_id: prompt_usage, credits_capacity, credits_usage, orgs_count and
+    orgs_count_hf. Every column is an integer sum, so the partials of any split of the
+    organizations combine (combine_org_aggregates) to exactly the aggregate_orgs values.
+    """
+    chat_interval = orgs_df["chat_interval_in_hours"].to_numpy()
+    return (
+        pd.DataFrame(
+            {
+                "company_id": orgs_df["company_id"].to_numpy(dtype=object),
+                "prompt_usage": orgs_df["prompts_count"].to_numpy(dtype=np.int64),
+                "credits_capacity": orgs_df["credits_capacity"].to_numpy(dtype=np.int64),
+                "credits_usage": orgs_df["credits_usage"].to_numpy(dtype=np.int64),
+                "orgs_count": np.ones(len(orgs_df), dtype=np.int64),
+                "orgs_count_hf": ((chat_interval < 24) & (chat_interval > 0)).astype(np.int64),
+            }
+        )
+        .groupby("company_id", sort=False)
+        .sum()
+    )
+
+
+def combine_org_aggregates(partials: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Adds up partial_org_aggregates frames per company.
+    """
+    return pd.concat(partials).groupby(level="company_id", sort=False).sum()
+
+
+def split_org_aggregates(totals: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """
+    Combined partial aggregates in the aggregate_orgs format.
+    """
+    totals = totals.rename_axis("company_id")
+    return {
+        "company_credits": totals[["prompt_usage", "credits_capacity", "credits_usage"]].reset_index(),
+        "orgs_count": totals[["orgs_count"]].reset_index(),
+        "high_freq_orgs": totals.loc[totals["orgs_count_hf"] > 0, ["orgs_count_hf"]].reset_index(),
+    }
+
+
+def aggregate_orgs_chunked(chunks: Iterable[pd.DataFrame]) -> tuple[dict[str, pd.DataFrame], int]:
+    """
+    aggregate_orgs over organizations arriving in chunks (e.g. from iter_model_batches):
+    credits and partial aggregates are computed per chunk and folded into running
+    per-company totals, so memory is bounded by the chunk size and the number of companies
+    rather than the number of organizations. Returns the aggregates and the organization count.
+    """
+    totals = partial_org_aggregates(
+        pd.DataFrame(
+            {
+                "company_id": [],
+                "prompts_count": [],
+                "credits_capacity": [],
+                "credits_usage": [],
+                "chat_interval_in_hours": [],
+            }
+        )
+    )
+    org_count = unknown_org_count = 0
+    unknown_model_ids = set()
+    for chunk in chunks:
+        model_index = build_model_price_index(chunk["model_ids"])
+        chunk[["credits_usage", "credits_capacity", "unknown_model_count"]] = calculate_credits(chunk, model_index)
+        totals = combine_org_aggregates([totals, partial_org_aggregates(chunk)])
+        org_count += len(chunk)
+        unknown_org_count += (chunk["unknown_model_count"] > 0).sum()
+        unknown_model_ids.update(model_index["unknown_model_ids"])
+    _warn_unknown_models(unknown_org_count, sorted(unknown_model_ids))
+
+    return split_org_aggregates(totals), org_count
+
+
+def aggregate_customers(
+    subs_df: pd.DataFrame,
+    coupon_table: pd.DataFrame,
+    plan_index: pd.DataFrame,
+) -> pd.DataFrame:
+    """
+    One row per Stripe customer: current MRR/ARR and discounts after item- and
+    subscription-level coupons, the billing interval of the highest-MRR item and the
+    prompt capacity of its WORKSPACE products. customer_id is factorized once and all
+    per-customer values come from a single grouped pass over the subscription items.
+    """
+    codes, customer_ids = pd.factorize(subs_df["customer_id"])
+
+    # Calculate current MRR per item, taking quantity and item-level discounts into account
+    base_mrr_cents = subs_df["mrr_cents"].to_numpy() * subs_df["quantity"].to_numpy()
+    item_discounts = resolve_coupons(subs_df["discounts"], coupon_table)
+    mrr_after_item_discounts = (
+        base_mrr_cents * item_discounts["multiplier"].to_numpy()
+        - monthly_amount_off(
+            item_discounts["amount_off"], subs_df["interval"], subs_df["interval_count"]
+        ).to_numpy()
+    ).clip(min=0)
+
+    # Subscription-level discounts are resolved once per customer, from its first item
+    # (all items in the same subscription have the same subscription_discounts)
+    first_item = np.unique(codes, return_index=True)[1]
+    first_items = subs_df.iloc[first_item]
+    sub_discounts = resolve_coupons(first_items["subscription_discounts"], coupon_table)
+    sub_discount_amount_off = monthly_amount_off(
+        sub_discounts["amount_off"], first_items["interval"], first_items["interval_count"]
+    ).to_numpy()
+
+    # Prompt capacity from the WORKSPACE products of the items' prices
+    prompt_limit_per_item = plan_prompt_limits(subs_df["plan_id"], plan_index)
+
+    # Apply subscription-level discounts on top of item-level discounts, then aggregate
+    items = pd.DataFrame(
+        {
+            "code": codes,
+            "base_mrr_cents": base_mrr_cents,
+            "discounted_mrr_cents": mrr_after_item_discounts
+            * sub_discounts["multiplier"].to_numpy()[codes],
+            "item_discount_long_term_count": item_discounts["long_term_count"].to_numpy(),
+            "item_discount_total_count": item_discounts["total_count"].to_numpy(),
+            "total_prompt_limit": prompt_limit_per_item * subs_df["quantity"].to_numpy(),
+        }
+    )
+    customers = items.groupby("code").agg(
+        base_mrr_cents=("base_mrr_cents", "sum"),
+        discounted_mrr_cents=("discounted_mrr_cents", "sum"),
+        item_discount_long_term_count=("item_discount_long_term_count", "sum"),
+        item_discount_total_count=("item_discount_total_count", "sum"),
+        prompt_capacity=("total_prompt_limit", "sum"),
+        # We only care about the interval of the highest MRR item per customer
+        main_item=("base_mrr_cents", "idxmax"),
+    )
+
+    # Subscription-level amount_off applies once to the subscription total
+    discounted_mrr_cents = (
+        customers["discounted_mrr_cents"].to_numpy() - sub_discount_amount_off
+    ).clip(min=0)
+    base_mrr_cents = customers["base_mrr_cents"].to_numpy()
+
+    # Calculate total discount counts (item + subscription level), formatted as "applied (total)"
+    applied_discounts = (
+        customers["item_discount_long_term_count"].to_numpy()
+        + sub_discounts["long_term_count"].to_numpy()
+    ).astype(int)
+    total_discounts = (
+        customers["item_discount_total_count"].to_numpy()
+        + sub_discounts["total_count"].to_numpy()
+    ).astype(int)
+
+    main_items = subs_df.iloc[customers["main_item"].to_numpy()]
+    interval = main_items["interval"].to_numpy(dtype=object)
+    interval_count = main_items["interval_count"].to_numpy()
+
+    current_mrr = discounted_mrr_cents / 100
+    with np.errstate(divide="ignore", invalid="ignore"):
+        discount_pct = (1 - discounted_mrr_cents / base_mrr_cents) * 100
+    return pd.DataFrame(
+        {
+            "customer_id": np.asarray(customer_ids, dtype=object),
+            "current_mrr": current_mrr,
+            "current_arr": current_mrr * 12,
+            # Discount percentage: (1 - discounted/base) * 100
+            "discount_pct": pd.Series(discount_pct)
+            .fillna(0)
+            .round(0)
+            .astype(int)
+            .to_numpy(),
+            "discounts_formatted": [
+                f"{applied} ({total})" for applied, total in zip(applied_discounts, total_discounts)
+            ],
+            "interval": np.where(
+                interval_count != 1,
+                [f"{name} ({count})" for name, count in zip(interval, interval_count)],
+                interval,
+            ),
+            "prompt_capacity": customers["prompt_capacity"].to_numpy(),
+        }
+    )
+
+
+def join_companies(
+    companies_df: pd.DataFrame,
+    org_aggregates: dict[str, pd.DataFrame],
+    customers: pd.DataFrame,
+) -> pd.DataFrame:
+    """
+    Merges the per-company and per-customer aggregates into one row per company.
+    """
+    company_credits = org_aggregates["company_credits"]
+    orgs_count_df = org_aggregates["orgs_count"]
+    high_freq_orgs_df = org_aggregates["high_freq_orgs"]
+
+    # Merge all data into a single DataFrame
+    merged_df = pd.merge(
+        companies_df, company_credits, left_on="id", right_on="company_id", how="inner"
+    )
+    merged_df = pd.merge(
+        merged_df,
+        orgs_count_df,
+        on="company_id",
+        how="inner",
+    )
+    merged_df = pd.merge(
+        merged_df,
+        high_freq_orgs_df,
+        on="company_id",
+        how="left",  # Use left merge to keep all companies
+    )
+    merged_df = pd.merge(
+        merged_df,
+        customers,
+        left_on="stripe_customer_id",
+        right_on="customer_id",
+        how="inner",
+    )
+
+    # Fill missing values for companies with no subs or orgs
+    merged_df["credits_capacity"] = merged_df["credits_capacity"].fillna(0)
+    merged_df["credits_usage"] = merged_df["credits_usage"].fillna(0)
+    merged_df["current_mrr"] = merged_df["current_mrr"].fillna(0)
+    merged_df["current_arr"] = merged_df["current_arr"].fillna(0)
+    merged_df["discount"] = merged_df["discount_pct"].fillna(0)
+    merged_df["discounts"] = merged_df["discounts_formatted"].fillna("0 (0)")
+    merged_df["prompt_usage"] = merged_df["prompt_usage"].fillna(0)
+    merged_df["prompt_capacity"] = merged_df["prompt_capacity"].fillna(0)
+    merged_df["orgs_count"] = merged_df["orgs_count"].fillna(0)
+    merged_df["orgs_count_hf"] = merged_df["orgs_count_hf"].fillna(0)
+
+    # Cast to int
+    merged_df["credits_capacity"] = merged_df["credits_capacity"].astype(int)
+    merged_df["credits_usage"] = merged_df["credits_usage"].astype(int)
+    merged_df["current_mrr"] = merged_df["current_mrr"].astype(int)
+    merged_df["current_arr"] = merged_df["current_arr"].astype(int)
+    merged_df["discount"] = merged_df["discount_pct"].astype(int)
+    # discounts is already a string, no conversion needed
+    merged_df["prompt_usage"] = merged_df["prompt_usage"].astype(int)
+    merged_df["prompt_capacity"] = merged_df["prompt_capacity"].astype(int)
+    merged_df["orgs_count"] = merged_df["orgs_count"].astype(int)
+    merged_df["orgs_count_hf"] = merged_df["orgs_count_hf"].astype(int)
+
+    return merged_df
@@ -0,0 +1,178 @@
+import copy
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from .calculations import (
+    AGENCY_PLANS,
+    BRAND_PLANS,
+    GUARDRAIL_ORG_COUNT,
+    ScenarioMemo,
+    compile_plans,
+)
+
+# --- Price Book Sweeps ---
+#
+# A price book is a dictionary with the same shape as the constants in calculations.py:
+#   {"brand_plans": {...}, "agency_plans": {...}, "guardrail_org_count": bool}
+# All books in a sweep must define the same plan names (in the same order) per segment,
+# so that they can be stacked into (books x plans) arrays and evaluated in one broadcast.
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+
+def current_price_book() -> dict:
+    """
+    Returns the price book currently configured in calculations.py.
+    """
+    return {
+        "brand_plans": copy.deepcopy(BRAND_PLANS),
+        "agency_plans": copy.deepcopy(AGENCY_PLANS),
+        "guardrail_org_count": GUARDRAIL_ORG_COUNT,
+    }
+
+
+def expand_price_book_grid(variations: dict, base_book: dict | None = None) -> list[dict]:
+    """
+    Builds the cartesian product of price book variations on top of a base book.
+    Keys are dotted paths into the book, e.g. {"brand_plans.pro.price": [199, 219],
+    "guardrail_org_count": [False, True]}. When a plan's price or credits change,
+    its price_per_credit is recomputed unless it is varied explicitly.
+    """
+    base_book = base_book or current_price_book()
+    paths = list(variations)
+
+    books = []
+    for values in itertools.product(*(variations[path] for path in paths)):
+        book = copy.deepcopy(base_book)
+        for path, value in zip(paths, values):
+            *parents, key = path.split(".")
+            target = book
+            for parent in parents:
+                target = target[parent]
+            target[key] = value
+            if key in ("price", "credits") and f"{'.'.join(parents)}.price_per_credit" not in variations:
+                target["price_per_credit"] = target["price"] / target["credits"]
+        books.append(book)
+    return books
+
+
+def compile_price_books(books: list[dict]) -> dict:
+    """
+    Stacks a list of price books into (books x plans) arrays per segment.
+    """
+    compiled = {}
+    for segment in ("brand_plans", "agency_plans"):
+        plan_keys = list(books[0][segment])
+        for book in books:
+            if list(book[segment]) != plan_keys:
+                raise ValueError(
+                    f"All price books must define the same {segment}: expected {plan_keys}, got {list(book[segment])}"
+                )
+
+        tables = [compile_plans(book[segment]) for book in books]
+        compiled[segment] = {
+            field: np.stack([table[field] for table in tables]) for field in tables[0]
+        }
+        compiled[segment]["plan_key"] = plan_keys
+
+    compiled["guardrail_org_count"] = np.array(
+        [book.get("guardrail_org_count", GUARDRAIL_ORG_COUNT) for book in books], dtype=bool
+    )
+    return compiled
+
+
+def sweep_price_books(
+    merged_df: pd.DataFrame,
+    books: list[dict],
+    chunk_size: int | None = DEFAULT_CHUNK_SIZE,
+    company_deltas: bool = True,
+    memo: ScenarioMemo | None = None,
+) -> dict:
+    """
+    Evaluates every price book against every company in one broadcast
+    (companies x books x plans), processing companies in chunks of chunk_size rows
+    so that memory stays bounded. Pass chunk_size=None to evaluate all companies at once.
+    Companies with the same credits_capacity and orgs_count are evaluated once through
+    memo (a new ScenarioMemo if None); keep a memo across sweeps to reuse evaluated books.
+
+    Returns a dictionary with:
+    - summary: one row per book with the total new MRR and ARR change
+    - plan_counts: number of companies assigned to each plan, one row per book
+    - arr_change: per-company ARR change (companies x books), or None if company_deltas is False
+    """
+    compiled = compile_price_books(books)
+    if memo is None:
+        memo = ScenarioMemo()
+    n_books = len(books)
+
+    is_brand = (merged_df["type"] == "IN_HOUSE").to_numpy()
+    credits_capacity = merged_df["credits_capacity"].to_numpy(dtype=float)
+    orgs_count = merged_df["orgs_count"].to_numpy(dtype=float)
+    current_mrr = merged_df["current_mrr"].to_numpy(dtype=float)
+
+    total_mrr = np.zeros(n_books, dtype=np.int64)
+    total_arr_change = np.zeros(n_books, dtype=np.int64)
+    arr_change = np.zeros((len(merged_df), n_books), dtype=np.int64) if company_deltas else None
+    plan_counts = {}
+
+    chunk_size = chunk_size or max(len(merged_df), 1)
+
+    for segment, mask in (("brand_plans", is_brand), ("agency_plans", ~is_brand)):
+        plan_table = compiled[segment]
+        n_plans = len(plan_table["plan_key"])
+        counts = np.zeros(n_books * n_plans, dtype=np.int64)
+        book_offsets = np.arange(n_books) * n_plans
+
+        rows = np.flatnonzero(mask)
+        results, positions = memo.lookup(
+            credits_capacity[rows],
+            orgs_count[rows],
+            plan_table,
+            compiled["guardrail_org_count"],
+            chunk_size,
+        )
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start : start + chunk_size]
+            chunk_positions = positions[start : start + chunk_size]
+            selected = {
+                field: results[field][chunk_positions] for field in ("cost", "plan_index")
+            }
+
+            mrr = np.trunc(selected["cost"]).astype(np.int64)
+            chunk_arr_change = np.trunc(
+                (selected["cost"] - current_mrr[chunk, None]) * 12
+            ).astype(np.int64)
+
+            total_mrr += mrr.sum(axis=0)
+            total_arr_change += chunk_arr_change.sum(axis=0)
+            counts += np.bincount(
+                (selected["plan_index"] + book_offsets).ravel(), minlength=n_books * n_plans
+            )
+            if arr_change is not None:
+                arr_change[chunk] = chunk_arr_change
+
+        for i, plan_key in enumerate(plan_table["plan_key"]):
+            plan_counts[plan_key] = counts[i::n_plans]
+
+    summary = pd.DataFrame(
+        {
+            "mrr": total_mrr,
+            "current_mrr": int(np.trunc(current_mrr).sum()),
+            "arr_change": total_arr_change,
+            "guardrail_org_count": compiled["guardrail_org_count"],
+        }
+    )
+    summary.index.name = "book"
+
+    plan_counts_df = pd.DataFrame(plan_counts)
+    plan_counts_df.index.name = "book"
+
+    return {
+        "summary": summary,
+        "plan_counts": plan_counts_df,
+        "arr_change": (
+            pd.DataFrame(arr_change, index=merged_df.index) if arr_change is not None else None
+        ),
+    }
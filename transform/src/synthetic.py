@@ -0,0 +1,265 @@
+import argparse
+import json
+import shutil
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+# --- Synthetic Data Generator ---
+#
+# Produces a data/ directory in the same format as the extract step (processed_companies,
+# processed_organizations, stripe_subscription_items, stripe_coupons, stripe_prices and
+# stripe_products) at a configurable number of organizations. Companies and organizations
+# are bootstrapped from the real files in data/: every synthetic record copies the
+# distribution-relevant fields (type, subscription status, prompt limits and usage,
+# chat interval, model mix, organizations per company) of a randomly drawn real record
+# and gets fresh ids. Stripe items, prices and coupons follow fixed distributions.
+# Records are generated and written in chunks, so memory stays bounded at any scale.
+
+DATA_PATH = Path(__file__).parent.parent.parent / "data"
+DEFAULT_CHUNK_SIZE = 100_000
+
+INTERVALS = ["month", "year"]
+INTERVAL_WEIGHTS = [0.9, 0.1]
+ITEMS_PER_CUSTOMER = [1, 2, 3]
+ITEMS_PER_CUSTOMER_WEIGHTS = [0.75, 0.18, 0.07]
+QUANTITIES = [1, 2, 3, 5]
+QUANTITY_WEIGHTS = [0.8, 0.1, 0.05, 0.05]
+UNIT_AMOUNTS = [8900, 19900, 49900, 1000, 0]
+ITEM_DISCOUNT_RATE = 0.05
+SUBSCRIPTION_DISCOUNT_RATE = 0.15
+
+
+def _write_json_array(path: Path, records: Iterable[dict]) -> int:
+    # Streams records into a JSON array, one record per line; returns the record count
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for record in records:
+            f.write("\n  " if count == 0 else ",\n  ")
+            f.write(json.dumps(record))
+            count += 1
+        f.write("\n]\n" if count else "]\n")
+    return count
+
+
+def _load_json(path: Path) -> list:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _company_records(templates: list[dict], picks: np.ndarray, chunk_size: int):
+    for start in range(0, len(picks), chunk_size):
+        for offset, pick in enumerate(picks[start : start + chunk_size]):
+            i = start + offset
+            template = templates[pick]
+            record = {
+                "id": f"co_syn_{i:09d}",
+                "name": f"{template['name']} {i}",
+                "domain": f"company{i}.example.com",
+                "type": template["type"],
+                "leadType": template.get("leadType", "SELF_SERVICE"),
+            }
+            if template.get("stripeCustomerId"):
+                record["stripeCustomerId"] = f"cus_syn_{i:09d}"
+            if template.get("stripeSubscriptionId"):
+                record["stripeSubscriptionId"] = f"sub_syn_{i:09d}"
+            if template.get("stripeSubscriptionStatus"):
+                record["stripeSubscriptionStatus"] = template["stripeSubscriptionStatus"]
+            yield record
+
+
+def _org_owners(
+    is_active: np.ndarray,
+    group_sizes: np.ndarray,
+    active_share: float,
+    n_orgs: int,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """
+    Company index of every synthetic organization. Organizations come in groups whose sizes
+    follow the real orgs-per-company distribution, and the share of groups owned by active
+    Stripe customers matches the real data.
+    """
+    sizes = rng.choice(group_sizes, size=n_orgs)
+    sizes = sizes[: np.searchsorted(np.cumsum(sizes), n_orgs) + 1]
+    wants_active = rng.random(len(sizes)) < active_share
+
+    owners = np.empty(len(sizes), dtype=np.int64)
+    for want, pool in ((True, np.flatnonzero(is_active)), (False, np.flatnonzero(~is_active))):
+        groups = np.flatnonzero(wants_active == want)
+        pool = rng.permutation(pool)
+        # Once every company in the pool owns a group, further groups go to random companies
+        taken = min(len(groups), len(pool))
+        owners[groups[:taken]] = pool[:taken]
+        owners[groups[taken:]] = rng.integers(0, len(is_active), len(groups) - taken)
+
+    return np.repeat(owners, sizes)[:n_orgs]
+
+
+def _org_records(templates: list[dict], owners: np.ndarray, rng: np.random.Generator, chunk_size: int):
+    for start in range(0, len(owners), chunk_size):
+        chunk = owners[start : start + chunk_size]
+        picks = rng.integers(0, len(templates), len(chunk))
+        for offset, (owner, pick) in enumerate(zip(chunk, picks)):
+            i = start + offset
+            template = templates[pick]
+            yield {
+                "id": f"org_syn_{i:09d}",
+                "promptLimit": template["promptLimit"],
+                "chatIntervalInHours": template["chatIntervalInHours"],
+                "domain": f"org{i}.example.com",
+                "name": f"Org {i}",
+                "status": template.get("status", "CUSTOMER"),
+                "modelIds": template["modelIds"],
+                "companyName": f"Company {owner}",
+                "promptsCount": template["promptsCount"],
+                "companyId": f"co_syn_{owner:09d}",
+            }
+
+
+def _price_records(products: list[dict], rng: np.random.Generator) -> list[dict]:
+    prices = []
+    for i, product in enumerate(products):
+        for j in range(int(rng.integers(1, 3))):
+            prices.append(
+                {
+                    "id": f"price_syn_{i:04d}_{j}",
+                    "object": "price",
+                    "product": product["id"],
+                    "currency": str(rng.choice(["eur", "usd"])),
+                    "unit_amount": int(rng.choice(UNIT_AMOUNTS)),
+                }
+            )
+    return prices
+
+
+def _coupon_records(n_coupons: int, rng: np.random.Generator) -> list[dict]:
+    coupons = []
+    for i in range(n_coupons):
+        duration = str(rng.choice(["forever", "once", "repeating"], p=[0.4, 0.3, 0.3]))
+        percent = rng.random() < 0.8
+        coupons.append(
+            {
+                "id": f"coupon_syn_{i:05d}",
+                "name": f"Coupon {i}",
+                "percent_off": float(rng.choice([10, 15, 20, 25, 50, 100])) if percent else None,
+                "amount_off": None if percent else int(rng.choice([1000, 2000, 5000])),
+                "duration": duration,
+                "duration_in_months": int(rng.choice([3, 6, 12, 24])) if duration == "repeating" else None,
+            }
+        )
+    return coupons
+
+
+def _subscription_item_records(
+    has_customer: np.ndarray,
+    prices: list[dict],
+    coupon_ids: list[str],
+    rng: np.random.Generator,
+    chunk_size: int,
+):
+    for start in range(0, len(has_customer), chunk_size):
+        chunk = np.flatnonzero(has_customer[start : start + chunk_size]) + start
+        n_items = rng.choice(ITEMS_PER_CUSTOMER, size=len(chunk), p=ITEMS_PER_CUSTOMER_WEIGHTS)
+        for i, items in zip(chunk, n_items):
+            interval = str(rng.choice(INTERVALS, p=INTERVAL_WEIGHTS))
+            subscription_discounts = (
+                [str(rng.choice(coupon_ids))] if rng.random() < SUBSCRIPTION_DISCOUNT_RATE else []
+            )
+            for k in range(items):
+                price = prices[int(rng.integers(0, len(prices)))]
+                unit_amount = price["unit_amount"]
+                yield {
+                    "customerId": f"cus_syn_{i:09d}",
+                    "subscriptionId": f"sub_syn_{i:09d}",
+                    "subscriptionItemId": f"si_syn_{i:09d}_{k}",
+                    "planId": price["id"],
+                    "interval": interval,
+                    "intervalCount": 1,
+                    "mrrCents": float(unit_amount / 12 if interval == "year" else unit_amount),
+                    "unitAmount": unit_amount,
+                    "quantity": int(rng.choice(QUANTITIES, p=QUANTITY_WEIGHTS)),
+                    "discounts": (
+                        [str(rng.choice(coupon_ids))] if rng.random() < ITEM_DISCOUNT_RATE else []
+                    ),
+                    "subscriptionDiscounts": subscription_discounts,
+                }
+
+
+def generate_dataset(
+    output_dir: Path,
+    n_orgs: int,
+    seed: int = 0,
+    source_dir: Path = DATA_PATH,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> dict[str, int]:
+    """
+    Writes a synthetic data/ directory with n_orgs organizations to output_dir,
+    bootstrapped from the real files in source_dir. Returns the record count per file.
+    """
+    rng = np.random.default_rng(seed)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    company_templates = _load_json(source_dir / "processed_companies.json")
+    org_templates = _load_json(source_dir / "processed_organizations.json")
+
+    # Scale companies with organizations, keeping the real companies-per-org ratio
+    n_companies = max(1, round(n_orgs * len(company_templates) / len(org_templates)))
+    picks = rng.integers(0, len(company_templates), n_companies, dtype=np.int32)
+
+    template_active = np.array(
+        [c.get("stripeSubscriptionStatus") == "active" for c in company_templates]
+    )
+    template_customer = np.array([bool(c.get("stripeCustomerId")) for c in company_templates])
+    _, group_sizes = np.unique([o["companyId"] for o in org_templates], return_counts=True)
+    active_ids = {c["id"] for c, active in zip(company_templates, template_active) if active}
+    owning_ids = {o["companyId"] for o in org_templates}
+    active_share = len(owning_ids & active_ids) / len(owning_ids)
+    owners = _org_owners(template_active[picks], group_sizes, active_share, n_orgs, rng)
+
+    counts = {}
+    counts["processed_companies.json"] = _write_json_array(
+        output_dir / "processed_companies.json",
+        _company_records(company_templates, picks, chunk_size),
+    )
+    counts["processed_organizations.json"] = _write_json_array(
+        output_dir / "processed_organizations.json",
+        _org_records(org_templates, owners, rng, chunk_size),
+    )
+    del owners
+
+    products = _load_json(source_dir / "stripe_products.json")
+    shutil.copyfile(source_dir / "stripe_products.json", output_dir / "stripe_products.json")
+    prices = _price_records(products, rng)
+    coupons = _coupon_records(max(20, n_orgs // 1000), rng)
+
+    counts["stripe_subscription_items.json"] = _write_json_array(
+        output_dir / "stripe_subscription_items.json",
+        _subscription_item_records(
+            template_customer[picks], prices, [c["id"] for c in coupons], rng, chunk_size
+        ),
+    )
+    counts["stripe_coupons.json"] = _write_json_array(output_dir / "stripe_coupons.json", coupons)
+    counts["stripe_prices.json"] = _write_json_array(output_dir / "stripe_prices.json", prices)
+    counts["stripe_products.json"] = len(products)
+    return counts
+
+
+def main():
+    """Main"""
+    parser = argparse.ArgumentParser(description="Generate a synthetic data/ directory.")
+    parser.add_argument("output_dir", type=Path)
+    parser.add_argument("--orgs", type=int, default=10_000, help="number of organizations")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--source-dir", type=Path, default=DATA_PATH)
+    args = parser.parse_args()
+
+    counts = generate_dataset(args.output_dir, args.orgs, args.seed, args.source_dir)
+    for file_name, count in counts.items():
+        print(f"{file_name}: {count}")
+
+
+if __name__ == "__main__":
+    main()
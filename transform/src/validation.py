@@ -0,0 +1,149 @@
+import functools
+import hashlib
+import json
+from pathlib import Path
+from typing import Type
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+# --- Batch Validation ---
+#
+# Records are validated in batches with TypeAdapter(list[Model]) instead of one
+# model_validate call per record. In "strict" mode the first invalid batch aborts the
+# run (as before); in "lenient" mode invalid rows are dropped and reported as rejects
+# (one entry per error: row, id, field, error) while the rest of the batch is kept.
+#
+# Files that validated cleanly are recorded in a manifest with their content hash and
+# the model's schema fingerprint, so unchanged inputs can skip validation entirely.
+
+VALIDATION_MODES = ("strict", "lenient")
+MANIFEST_NAME = ".validation_manifest.json"
+REJECT_COLUMNS = ["file", "row", "id", "field", "error"]
+
+
+@functools.cache
+def list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    """
+    Returns a cached TypeAdapter validating a list of model instances.
+    """
+    return TypeAdapter(list[model])
+
+
+@functools.cache
+def schema_fingerprint(model: Type[BaseModel]) -> str:
+    """
+    Short hash of the model's JSON schema; changes whenever fields or types change.
+    """
+    schema = json.dumps(model.model_json_schema(by_alias=True), sort_keys=True)
+    return hashlib.sha256(schema.encode()).hexdigest()[:16]
+
+
+def file_hash(file_path: Path, chunk_size: int = 1 << 20) -> str:
+    """
+    SHA-256 of a file's contents, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _rejects_from_error(
+    error: ValidationError, records: list, row_ids: list[int] | None
+) -> list[dict]:
+    rejects = []
+    for e in error.errors():
+        loc = e["loc"]
+        if not loc or not isinstance(loc[0], int):
+            # Not a per-row error (e.g. the input is not a list): nothing to salvage
+            raise error
+        record = records[loc[0]] if records is not None else None
+        rejects.append(
+            {
+                "row": row_ids[loc[0]] if row_ids is not None else loc[0],
+                "id": record.get("id") if isinstance(record, dict) else None,
+                "field": ".".join(str(part) for part in loc[1:]),
+                "error": e["msg"],
+                "index": loc[0],
+            }
+        )
+    return rejects
+
+
+def validate_records(
+    records: list,
+    model: Type[BaseModel],
+    mode: str = "strict",
+    row_ids: list[int] | None = None,
+) -> tuple[list[BaseModel], list[dict]]:
+    """
+    Validates a batch of raw records against model.
+    row_ids are the records' positions in the source file, used in the rejects report.
+    Returns the valid model instances and the rejects (empty in strict mode).
+    """
+    adapter = list_adapter(model)
+    try:
+        return adapter.validate_python(records), []
+    except ValidationError as error:
+        if mode == "strict":
+            raise
+        rejects = _rejects_from_error(error, records, row_ids)
+
+    invalid = {reject.pop("index") for reject in rejects}
+    valid = [record for i, record in enumerate(records) if i not in invalid]
+    return adapter.validate_python(valid), rejects
+
+
+def validate_json(
+    raw: bytes, model: Type[BaseModel], mode: str = "strict"
+) -> tuple[list[BaseModel], list[dict]]:
+    """
+    Validates a raw JSON array against model in a single pass over the bytes.
+    Only when that fails in lenient mode is the input parsed again to drop the invalid rows.
+    """
+    try:
+        return list_adapter(model).validate_json(raw), []
+    except ValidationError:
+        if mode == "strict":
+            raise
+    return validate_records(json.loads(raw), model, mode)
+
+
+# --- Validation Manifest ---
+
+
+def load_manifest(data_path: Path) -> dict:
+    """
+    Loads the manifest of inputs that previously validated cleanly.
+    """
+    manifest_path = data_path / MANIFEST_NAME
+    if not manifest_path.exists():
+        return {}
+    return json.loads(manifest_path.read_text())
+
+
+def save_manifest(data_path: Path, manifest: dict):
+    """
+    Writes the validation manifest next to the inputs.
+    """
+    (data_path / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+
+
+def is_unchanged(manifest: dict, file_path: Path, model: Type[BaseModel], digest: str) -> bool:
+    """
+    True if the file validated cleanly against the same schema with the same content.
+    """
+    entry = manifest.get(Path(file_path).name)
+    return entry == {"sha256": digest, "model": model.__name__, "schema": schema_fingerprint(model)}
+
+
+def record_validated(manifest: dict, file_path: Path, model: Type[BaseModel], digest: str):
+    """
+    Marks a file as validated cleanly in the manifest.
+    """
+    manifest[Path(file_path).name] = {
+        "sha256": digest,
+        "model": model.__name__,
+        "schema": schema_fingerprint(model),
+    }
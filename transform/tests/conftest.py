@@ -0,0 +1,37 @@
+import contextlib
+import io
+import shutil
+from pathlib import Path
+
+import pytest
+
+from src.synthetic import generate_dataset
+
+SYNTHETIC_ORGS = 2_000
+
+
+@pytest.fixture(scope="session")
+def synthetic_data(tmp_path_factory) -> Path:
+    """A small synthetic data/ directory, generated once per test session."""
+    data_path = tmp_path_factory.mktemp("synthetic")
+    generate_dataset(data_path, SYNTHETIC_ORGS, seed=0)
+    return data_path
+
+
+@pytest.fixture
+def data_copy(synthetic_data, tmp_path):
+    """Copies of the synthetic data/ directory that a test may write into."""
+
+    def copy(name: str = "data") -> Path:
+        return Path(shutil.copytree(synthetic_data, tmp_path / name))
+
+    return copy
+
+
+@pytest.fixture(scope="session")
+def inputs(synthetic_data) -> dict:
+    """The loaded synthetic inputs."""
+    from src.main import load_inputs
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return load_inputs(synthetic_data, skip_unchanged=False)
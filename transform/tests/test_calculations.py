@@ -0,0 +1,160 @@
+import contextlib
+import io
+
+import pandas as pd
+import pytest
+
+from src import calculations
+from src.main import merge_inputs
+from src.solver import DEFAULT_CONSTRAINTS, solve
+from src.sweep import current_price_book, expand_price_book_grid, sweep_price_books
+
+
+@pytest.fixture(scope="module")
+def merged_df(inputs) -> pd.DataFrame:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return merge_inputs(inputs)
+
+
+def _plan_boundaries() -> pd.DataFrame:
+    # Capacities just around every plan's credits and minimum top-up, for both segments
+    rows = []
+    for company_type, plans in (("IN_HOUSE", calculations.BRAND_PLANS), ("AGENCY", calculations.AGENCY_PLANS)):
+        for plan in plans.values():
+            for credits_capacity in (
+                plan["credits"] - 1,
+                plan["credits"],
+                plan["credits"] + 1,
+                plan["credits"] + plan["min_amount"] - 1,
+                plan["credits"] + plan["min_amount"],
+            ):
+                for orgs_count in (1, plan["max_org_count"], plan["max_org_count"] + 1):
+                    rows.append((company_type, credits_capacity, orgs_count, 150))
+    return pd.DataFrame(rows, columns=["type", "credits_capacity", "orgs_count", "current_mrr"])
+
+
+@pytest.mark.parametrize("guardrail_org_count", [False, True])
+def test_calculate_scenarios_matches_row_wise_plans(merged_df, monkeypatch, guardrail_org_count):
+    monkeypatch.setattr(calculations, "GUARDRAIL_ORG_COUNT", guardrail_org_count)
+    companies = pd.concat(
+        [merged_df[["type", "credits_capacity", "orgs_count", "current_mrr"]], _plan_boundaries()],
+        ignore_index=True,
+    )
+
+    expected = companies.apply(calculations.calculate_scenarios_for_company, axis=1)
+    actual = calculations.calculate_scenarios(companies)
+
+    pd.testing.assert_frame_equal(actual, expected[actual.columns], check_dtype=False)
+
+
+def test_sweep_of_the_shipped_price_book_equals_calculate_scenarios(merged_df, monkeypatch):
+    companies = pd.concat(
+        [merged_df[["type", "credits_capacity", "orgs_count", "current_mrr"]], _plan_boundaries()],
+        ignore_index=True,
+    )
+    guardrails = [calculations.GUARDRAIL_ORG_COUNT, not calculations.GUARDRAIL_ORG_COUNT]
+    books = expand_price_book_grid({"guardrail_org_count": guardrails})
+    assert books[0] == current_price_book()
+
+    sweep = sweep_price_books(companies, books, chunk_size=97)
+
+    plan_keys = {
+        f"{name} ({plan['credits']})": name
+        for plans in (calculations.BRAND_PLANS, calculations.AGENCY_PLANS)
+        for name, plan in plans.items()
+    }
+    for book, guardrail in enumerate(guardrails):
+        monkeypatch.setattr(calculations, "GUARDRAIL_ORG_COUNT", guardrail)
+        expected = calculations.calculate_scenarios(companies)
+
+        assert sweep["arr_change"][book].tolist() == expected["arr_change"].tolist()
+        assert sweep["summary"].loc[book, "mrr"] == expected["mrr"].sum()
+        assert sweep["summary"].loc[book, "arr_change"] == expected["arr_change"].sum()
+        counts = expected["plan_name"].map(plan_keys).value_counts().reindex(sweep["plan_counts"].columns, fill_value=0)
+        assert sweep["plan_counts"].loc[book].to_dict() == counts.to_dict()
+
+
+@pytest.mark.parametrize("guardrail_org_count", [False, True])
+def test_solver_default_constraints_reproduce_calculate_scenarios(merged_df, monkeypatch, guardrail_org_count):
+    monkeypatch.setattr(calculations, "GUARDRAIL_ORG_COUNT", guardrail_org_count)
+    companies = pd.concat(
+        [merged_df[["type", "credits_capacity", "orgs_count", "current_mrr"]], _plan_boundaries()],
+        ignore_index=True,
+    )
+    constraints = {**DEFAULT_CONSTRAINTS, "guardrail_org_count": guardrail_org_count}
+
+    solution = solve(companies, {"default": constraints}, chunk_size=97)["default"]
+    expected = calculations.calculate_scenarios(companies)
+
+    pd.testing.assert_frame_equal(solution[expected.columns], expected)
+    assert solution["required_credits"].tolist() == companies["credits_capacity"].tolist()
+
+
+def test_calculate_credits_matches_row_wise_credits(inputs):
+    unpriced = pd.DataFrame(
+        {
+            "model_ids": [["not-a-model"], [], [next(iter(calculations.MODEL_ID_PRICE_MAP)), "not-a-model"]],
+            "prompts_count": [3, 5, 7],
+            "prompt_limit": [10, 10, 10],
+        }
+    )
+    orgs = pd.concat(
+        [inputs["orgs"][["model_ids", "prompts_count", "prompt_limit"]].astype({"model_ids": object}), unpriced],
+        ignore_index=True,
+    )
+
+    credits = calculations.calculate_credits(orgs)
+
+    assert credits["credits_usage"].tolist() == orgs.apply(calculations.calculate_credits_usage, axis=1).tolist()
+    assert credits["credits_capacity"].tolist() == orgs.apply(calculations.calculate_credits_capacity, axis=1).tolist()
+    assert credits["unknown_model_count"].tail(3).tolist() == [1, 0, 1]
+    # The compact (Arrow list) model_ids column gives the same credits
+    pd.testing.assert_frame_equal(
+        calculations.calculate_credits(inputs["orgs"]), credits.head(len(inputs["orgs"])), check_index_type=False
+    )
+
+
+def test_resolve_coupons_matches_row_wise_coupons(inputs):
+    coupons = pd.concat(
+        [
+            inputs["coupons"],
+            pd.DataFrame(
+                {
+                    "id": ["half_forever", "half_forever_too", "year", "eleven_months"],
+                    "percent_off": [60.0, 60.0, 10.0, 10.0],
+                    "amount_off": [None, None, 500.0, None],
+                    "duration": ["forever", "forever", "repeating", "repeating"],
+                    "duration_in_months": [None, None, 12.0, 11.0],
+                }
+            ),
+        ],
+        ignore_index=True,
+    )
+    coupons_map = {
+        coupon["id"]: coupon for coupon in coupons.astype(object).where(coupons.notna(), None).to_dict("records")
+    }
+    coupon_ids = pd.concat(
+        [
+            inputs["subs"]["discounts"].astype(object),
+            inputs["subs"]["subscription_discounts"].astype(object),
+            pd.Series(
+                [
+                    ["half_forever", "half_forever_too"],
+                    ["year", "eleven_months", "not-a-coupon"],
+                    ["year", "year"],
+                    [],
+                ]
+            ),
+        ],
+        ignore_index=True,
+    ).map(list)
+
+    resolved = calculations.resolve_coupons(coupon_ids, calculations.build_coupon_table(coupons))
+    expected = pd.DataFrame(
+        [calculations.calculate_coupon_multiplier(ids, coupons_map) for ids in coupon_ids],
+        columns=["multiplier", "long_term_count", "total_count"],
+    )
+
+    pd.testing.assert_frame_equal(resolved[expected.columns], expected, check_dtype=False, check_exact=True)
+    assert resolved["multiplier"].tail(4).tolist() == [0.0, 0.9, 0.8, 1.0]
+    assert resolved["amount_off"].tail(4).tolist() == [0.0, 500.0, 1000.0, 0.0]
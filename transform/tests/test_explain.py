@@ -0,0 +1,56 @@
+import contextlib
+import io
+import json
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from src.explain import build_index
+from src.main import etl_pipeline
+
+TRANSFORM_PATH = Path(__file__).parent.parent
+
+# Runs the CLI in a fresh interpreter and reports which heavy modules it imported
+EXPLAIN_SCRIPT = """
+import runpy, sys
+sys.argv = ["main", "explain", *sys.argv[1:]]
+try:
+    runpy.run_module("src.main", run_name="__main__")
+except SystemExit:
+    pass
+print(sorted(name for name in ("numpy", "pandas", "src.stages") if name in sys.modules))
+"""
+
+
+def test_explain_answers_from_the_index_without_the_pipeline(data_copy):
+    data_path = data_copy("explain")
+    with contextlib.redirect_stdout(io.StringIO()):
+        index_path = build_index(data_path)
+        etl_pipeline(data_path, skip_unchanged=False)
+    output = pd.read_csv(data_path / "migrate.csv")
+
+    conn = sqlite3.connect(index_path)
+    explanations = {company_id: json.loads(e) for company_id, e in conn.execute("SELECT id, explanation FROM companies")}
+    conn.close()
+    company_id, explanation = next((c, e) for c, e in explanations.items() if e["result"] is not None)
+    results = pd.DataFrame([e["result"] for e in explanations.values() if e["result"] is not None])
+
+    assert len(results) == len(output)
+    assert sorted(results["plan_name"]) == sorted(output["plan_name"])
+
+    domain = explanation["company"]["domain"].upper()
+    run = subprocess.run(
+        [sys.executable, "-c", EXPLAIN_SCRIPT, domain, "--data-path", str(data_path), "--no-cache"],
+        cwd=TRANSFORM_PATH,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    lines = run.stdout.splitlines()
+
+    assert lines[-1] == "[]"
+    assert f"({company_id})" in lines[0]
+    assert f"Chosen: {explanation['result']['plan_name']}," in run.stdout
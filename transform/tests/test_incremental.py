@@ -0,0 +1,95 @@
+import contextlib
+import io
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from src.calculations import MODEL_ID_PRICE_MAP
+from src.main import build_output, etl_pipeline, merge_inputs
+
+
+def _pick_companies(inputs) -> dict[str, str]:
+    # Three companies in the output, with distinct Stripe customers: one with an organization
+    # using a priced model, one whose items have no coupons, and one more
+    with contextlib.redirect_stdout(io.StringIO()):
+        output_ids = set(build_output(merge_inputs(inputs)).index)
+    companies = inputs["companies"][inputs["companies"]["id"].isin(output_ids)].astype({"id": object})
+    customers = companies.set_index("id")["stripe_customer_id"].astype(object)
+
+    orgs = inputs["orgs"].astype({"company_id": object})
+    priced = orgs[[any(m in MODEL_ID_PRICE_MAP for m in model_ids) for model_ids in orgs["model_ids"]]]
+    org = priced[priced["company_id"].isin(output_ids)].iloc[0]
+
+    subs = inputs["subs"].astype({"customer_id": object})
+    coupons = subs["discounts"].map(len) + subs["subscription_discounts"].map(len)
+    uncouponed = set(subs["customer_id"]) - set(subs.loc[coupons > 0, "customer_id"])
+    taken = {org["company_id"]}
+    mrr_company = next(c for c in customers.index if c not in taken and customers[c] in uncouponed)
+    taken.add(mrr_company)
+    moved_company = next(
+        c for c in customers.index if c not in taken and customers[c] not in {customers[t] for t in taken}
+    )
+    return {
+        "org_id": org["id"],
+        "org_company": org["company_id"],
+        "mrr_company": mrr_company,
+        "mrr_customer": customers[mrr_company],
+        "moved_company": moved_company,
+    }
+
+
+def _edit(path: Path, edit):
+    records = json.loads(path.read_text())
+    for record in records:
+        edit(record)
+    path.write_text(json.dumps(records))
+
+
+def _mutate(data_path: Path, picked: dict):
+    def org(record):
+        if record["id"] == picked["org_id"]:
+            record["promptLimit"] = 1_000_000
+
+    first_item = []
+
+    def item(record):
+        if record["customerId"] == picked["mrr_customer"] and not first_item:
+            first_item.append(record)
+            record["mrrCents"] += 100_000
+
+    def company(record):
+        if record["id"] == picked["moved_company"]:
+            record["stripeCustomerId"] = "cus_moved_away"
+
+    _edit(data_path / "processed_organizations.json", org)
+    _edit(data_path / "stripe_subscription_items.json", item)
+    _edit(data_path / "processed_companies.json", company)
+
+
+def _run(data_path: Path, **kwargs) -> str:
+    with contextlib.redirect_stdout(io.StringIO()) as stdout:
+        etl_pipeline(data_path, skip_unchanged=False, **kwargs)
+    return stdout.getvalue()
+
+
+def test_incremental_run_equals_full_run_and_logs_the_changed_companies(data_copy, inputs):
+    picked = _pick_companies(inputs)
+
+    incremental_path = data_copy("incremental")
+    _run(incremental_path, incremental=True)
+    _mutate(incremental_path, picked)
+    log = _run(incremental_path, incremental=True)
+
+    full_path = data_copy("full")
+    _mutate(full_path, picked)
+    _run(full_path)
+
+    assert "Incremental run: recomputing 3 of " in log
+    assert (incremental_path / "migrate.csv").read_bytes() == (full_path / "migrate.csv").read_bytes()
+    changelog = pd.read_csv(incremental_path / "migrate_changelog.csv")
+    assert dict(zip(changelog["company_id"], changelog["change"])) == {
+        picked["org_company"]: "changed",
+        picked["mrr_company"]: "changed",
+        picked["moved_company"]: "removed",
+    }
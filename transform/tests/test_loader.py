@@ -0,0 +1,128 @@
+import json
+
+import pandas as pd
+import pytest
+
+from src.loader import DEFAULT_CHUNK_SIZE, iter_json_array, iter_model_batches, load_columns
+from src.models import StripeCoupon
+
+RECORDS = [
+    {"id": "plain", "name": "Plain", "percentOff": 10, "duration": "forever"},
+    {"id": "quotes", "name": 'He said "50% off", then \\"more\\"', "amountOff": 500, "duration": "once"},
+    {
+        "id": "brackets",
+        "name": "] }, { [ ] \"]\" ,",
+        "percentOff": 12.5,
+        "duration": "repeating",
+        "durationInMonths": 12,
+    },
+    {"id": "unicode", "name": "Café – ünïcödé ✓   line", "percentOff": 1e1, "duration": "forever"},
+    {"id": "control", "name": "tab\tnew\nline\\", "amountOff": 0, "duration": "repeating", "durationInMonths": 3},
+    {
+        "id": "nulls",
+        "name": None,
+        "percentOff": None,
+        "amountOff": None,
+        "duration": "forever",
+        "extra": [1, {"a": []}],
+    },
+    {
+        "id": "numbers",
+        "name": "",
+        "percentOff": 33.333333333333336,
+        "amountOff": -1,
+        "duration": "once",
+        "durationInMonths": 0,
+        "extra": [-0.5e-3, 1e300],
+    },
+]
+
+
+def _layouts(records: list) -> dict[str, str]:
+    # The same array with different whitespace between and inside the elements
+    return {
+        "compact": json.dumps(records, separators=(",", ":")),
+        "indented": json.dumps(records, indent=2, ensure_ascii=False),
+        "spaced": " \n[\n\n" + "\n ,\t\r\n".join(json.dumps(r) for r in records) + "  \n]\n",
+    }
+
+
+@pytest.fixture(params=list(_layouts(RECORDS)))
+def array_file(request, tmp_path):
+    path = tmp_path / f"{request.param}.json"
+    path.write_text(_layouts(RECORDS)[request.param], encoding="utf-8")
+    return path
+
+
+def _json_load(path) -> list:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, DEFAULT_CHUNK_SIZE])
+def test_iter_json_array_matches_json_load(array_file, chunk_size):
+    assert list(iter_json_array(array_file, chunk_size)) == _json_load(array_file)
+
+
+@pytest.mark.parametrize("text", ["[]", " \n[ \n\t]\n"])
+def test_empty_arrays(tmp_path, text):
+    path = tmp_path / "empty.json"
+    path.write_text(text)
+
+    assert list(iter_json_array(path, chunk_size=1)) == []
+    assert load_columns(path, ["id", "name"]).columns.tolist() == ["id", "name"]
+    assert len(load_columns(path, ["id", "name"])) == 0
+    batches = list(iter_model_batches(path, StripeCoupon))
+    assert len(batches) == 1
+    assert batches[0][0].columns.tolist() == list(StripeCoupon.model_fields)
+    assert len(batches[0][0]) == 0
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, DEFAULT_CHUNK_SIZE])
+def test_truncated_files_raise(tmp_path, chunk_size):
+    text = json.dumps(RECORDS[:3])
+    path = tmp_path / "truncated.json"
+    for end in range(len(text)):
+        path.write_text(text[:end])
+        with pytest.raises(ValueError):
+            list(iter_json_array(path, chunk_size))
+
+
+def test_load_columns_matches_json_load(tmp_path):
+    # Large enough to span several default-sized buffers
+    records = [dict(record, id=f"{record['id']}_{i}") for i in range(3000) for record in RECORDS]
+    path = tmp_path / "coupons.json"
+    path.write_text(json.dumps(records, indent=1, ensure_ascii=False), encoding="utf-8")
+    assert path.stat().st_size > 2 * DEFAULT_CHUNK_SIZE
+
+    df = load_columns(
+        path,
+        ["id", "percent_off", "duration_in_months"],
+        predicate=lambda record: record["duration"] != "once",
+        keys={"percent_off": "percentOff", "duration_in_months": "durationInMonths"},
+        defaults={"duration_in_months": 0},
+    )
+
+    kept = [record for record in _json_load(path) if record["duration"] != "once"]
+    assert df["id"].tolist() == [record["id"] for record in kept]
+    pd.testing.assert_series_equal(
+        df["percent_off"], pd.Series([record.get("percentOff") for record in kept], dtype=float, name="percent_off")
+    )
+    assert df["duration_in_months"].tolist() == [record.get("durationInMonths", 0) for record in kept]
+
+
+@pytest.mark.parametrize("validate", [True, False])
+def test_iter_model_batches_matches_json_load(array_file, validate):
+    batches = list(iter_model_batches(array_file, StripeCoupon, batch_size=3, validate=validate))
+    actual = pd.concat([frame for frame, _ in batches], ignore_index=True)
+
+    fields = StripeCoupon.model_fields
+    records = _json_load(array_file)
+    expected = pd.DataFrame(
+        {name: [record.get(field.alias, field.default) for record in records] for name, field in fields.items()},
+        columns=list(fields),
+    ).astype({"percent_off": float})
+
+    assert [len(frame) for frame, _ in batches] == [3, 3, 1]
+    assert all(rejects == [] for _, rejects in batches)
+    pd.testing.assert_frame_equal(actual, expected)
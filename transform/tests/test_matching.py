@@ -0,0 +1,107 @@
+import pandas as pd
+
+from src.calculations import build_coupon_table
+from src.matching import COMPANY_COLUMNS, build_company_index, match_customers, name_ngrams, orphan_customers
+
+
+def _companies(rows: list[tuple]) -> pd.DataFrame:
+    # (id, name, domain, stripe_customer_id, stripe_subscription_status) per company
+    return pd.DataFrame(
+        [
+            {
+                "id": company_id,
+                "name": name,
+                "domain": domain,
+                "type": "IN_HOUSE",
+                "stripe_customer_id": customer_id,
+                "stripe_subscription_id": f"sub_{company_id}" if customer_id else None,
+                "stripe_subscription_status": status,
+            }
+            for company_id, name, domain, customer_id, status in rows
+        ],
+        columns=COMPANY_COLUMNS,
+    )
+
+
+def _customers(rows: list[tuple]) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=["customer_id", "name", "email", "domain"])
+
+
+def test_exact_domain_outranks_a_name_only_match():
+    companies = _companies(
+        [
+            ("co_name", "Acme Analytics Ltd", "acmeanalytics.com", None, None),
+            ("co_domain", "Acme Labs", "acme.io", None, None),
+            ("co_other", "Globex", "globex.com", None, None),
+        ]
+    )
+    customers = _customers([("cus_1", "Acme Analytics", "billing@gmail.com", "https://www.Acme.io/pricing")])
+
+    matches = match_customers(customers, companies)
+
+    assert matches["company_id"].tolist() == ["co_domain", "co_name"]
+    assert matches["rank"].tolist() == [1, 2]
+    best, name_only = matches.iloc[0], matches.iloc[1]
+    assert best["domain_match"] and not best["email_domain_match"]
+    assert not name_only["domain_match"] and name_only["name_similarity"] == 1.0
+    assert best["score"] > name_only["score"]
+
+
+def test_name_ngrams_shared_by_more_than_max_block_size_companies_are_not_blocked_on():
+    companies = _companies(
+        [
+            ("co_1", "Alpha One", None, None, None),
+            ("co_2", "Alpha Two", None, None, None),
+            ("co_3", "Alpha Three", None, None, None),
+        ]
+    )
+    customers = _customers([("cus_1", "Alpha", None, None)])
+
+    small_index = build_company_index(companies, max_block_size=2)
+    alpha_grams = name_ngrams("Alpha")
+    assert not set(small_index["postings"]["gram"]) & alpha_grams
+    assert match_customers(customers, companies, small_index, min_score=0).empty
+
+    index = build_company_index(companies, max_block_size=3)
+    matches = match_customers(customers, companies, index, min_score=0)
+    assert sorted(matches["company_id"]) == ["co_1", "co_2", "co_3"]
+
+
+def test_orphan_customers_are_classified_by_reason():
+    companies = _companies(
+        [
+            ("co_out", "In Output", None, "cus_out", "active"),
+            ("co_no_orgs", "No Orgs", None, "cus_no_orgs", "active"),
+            ("co_canceled", "Canceled", None, "cus_canceled", "canceled"),
+        ]
+    )
+    active = companies[companies["stripe_subscription_status"] == "active"]
+    customer_ids = ["cus_out", "cus_no_orgs", "cus_canceled", "cus_unknown"]
+    subs = pd.DataFrame(
+        {
+            "customer_id": customer_ids,
+            "plan_id": "price_1",
+            "mrr_cents": [10000.0, 20000.0, 30000.0, 40000.0],
+            "quantity": 1,
+            "interval": "month",
+            "interval_count": 1,
+            "discounts": [[] for _ in customer_ids],
+            "subscription_discounts": [[] for _ in customer_ids],
+        }
+    )
+    inputs = {
+        "companies": active,
+        "subs": subs,
+        "coupons": build_coupon_table([]).reset_index(),
+        "plans": pd.DataFrame({"id": ["price_1"], "prompt_limit": [100]}),
+    }
+    output_df = pd.DataFrame(index=pd.Index(["co_out"], name="company_id"))
+
+    orphans = orphan_customers(inputs, output_df, companies)
+
+    assert orphans[["customer_id", "reason", "current_mrr"]].values.tolist() == [
+        ["cus_unknown", "no_company", 400],
+        ["cus_canceled", "inactive_company", 300],
+        ["cus_no_orgs", "no_organizations", 200],
+    ]
+    assert orphans["known_company_id"].fillna("").tolist() == ["", "co_canceled", "co_no_orgs"]
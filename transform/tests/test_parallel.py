@@ -0,0 +1,24 @@
+import contextlib
+import io
+
+import pandas as pd
+
+from src.main import build_output, merge_inputs
+from src.parallel import partition_companies, run_partitioned
+
+
+def test_partitions_cover_every_company_once(inputs):
+    partitions = partition_companies(inputs["companies"], 3)
+
+    assert len(partitions) == 3
+    assert all(len(partition) for partition in partitions)
+    assert pd.Index(inputs["companies"]["id"]).equals(partitions[0].append(partitions[1:]))
+
+
+def test_partitioned_output_equals_serial_output(inputs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        serial = build_output(merge_inputs(inputs))
+        parallel = run_partitioned(inputs, workers=2)
+
+    assert len(serial) > 0
+    pd.testing.assert_frame_equal(parallel, serial)
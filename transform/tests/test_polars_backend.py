@@ -0,0 +1,45 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.main import etl_pipeline
+
+pl = pytest.importorskip("polars")
+
+from src.polars_backend import _kahan_sum  # noqa: E402
+
+
+def _run(data_path, **kwargs) -> bytes:
+    with contextlib.redirect_stdout(io.StringIO()):
+        etl_pipeline(data_path, skip_unchanged=False, **kwargs)
+    return (data_path / "migrate.csv").read_bytes()
+
+
+def test_backends_write_the_same_migrate_csv(data_copy):
+    expected = _run(data_copy("pandas"), backend="pandas")
+    actual = _run(data_copy("polars"), backend="polars")
+
+    assert expected.count(b"\n") > 1
+    assert actual == expected
+
+
+def test_kahan_sum_matches_pandas_group_sums():
+    rng = np.random.default_rng(0)
+    groups = rng.integers(0, 50, 2000)
+    # Magnitudes far apart, where the summation order and compensation show in the last bit
+    values = rng.random(2000) * 10.0 ** rng.integers(-3, 12, 2000) * rng.choice([-1, 1], 2000)
+    expected = pd.DataFrame({"group": groups, "value": values}).groupby("group")["value"].sum()
+
+    grouped = (
+        pl.LazyFrame({"group": groups, "value": values})
+        .with_row_index("row")
+        .group_by("group")
+        .agg(pl.col("value").sort_by("row"))
+    )
+    actual = _kahan_sum(grouped, ["value"], int(np.bincount(groups).max())).collect().sort("group")
+
+    assert actual["group"].to_list() == expected.index.tolist()
+    assert actual["value"].to_numpy().tobytes() == expected.to_numpy().tobytes()
@@ -0,0 +1,26 @@
+import re
+
+import pytest
+
+from src.service import resolve_price_book
+
+
+def test_resolve_price_book_applies_overrides():
+    book = resolve_price_book({"brand_plans": {"pro": {"price": 219}}})
+
+    assert book["brand_plans"]["pro"]["price"] == 219
+
+
+@pytest.mark.parametrize(
+    "overrides, error",
+    [
+        ({"brand_plans": {"pro": {"pricing": 219}}}, "Unknown price book entries: brand_plans.pro.pricing"),
+        ({"brand_plans": {"pro": {"price": "219"}}}, "brand_plans.pro.price (expected number, got str)"),
+        ({"brand_plans": {"pro": {"credits": 0}}}, "brand_plans.pro.credits (must be positive, got 0)"),
+        ({"brand_plans": {"pro": {"price": -5}}}, "brand_plans.pro.price (must be positive, got -5)"),
+        ({"agency_plans": {"intro": {"max_org_count": 2.5}}}, "max_org_count (must be a positive integer, got 2.5)"),
+    ],
+)
+def test_resolve_price_book_rejects_invalid_overrides(overrides, error):
+    with pytest.raises(ValueError, match=re.escape(error)):
+        resolve_price_book(overrides)
@@ -0,0 +1,38 @@
+import contextlib
+import io
+
+import pandas as pd
+
+from src.main import etl_pipeline
+from src.stages import aggregate_orgs, aggregate_orgs_chunked, compute_org_credits
+
+
+def _sorted(aggregates: dict[str, pd.DataFrame]) -> dict[str, pd.DataFrame]:
+    return {
+        name: df.astype({"company_id": object}).sort_values("company_id").reset_index(drop=True)
+        for name, df in aggregates.items()
+    }
+
+
+def test_chunked_org_aggregates_equal_in_memory_aggregates(inputs):
+    orgs_df = inputs["orgs"]
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = aggregate_orgs(compute_org_credits(orgs_df.copy()))
+        chunks = (orgs_df.iloc[start : start + 300].copy() for start in range(0, len(orgs_df), 300))
+        actual, org_count = aggregate_orgs_chunked(chunks)
+
+    assert org_count == len(orgs_df)
+    expected, actual = _sorted(expected), _sorted(actual)
+    for name in expected:
+        pd.testing.assert_frame_equal(actual[name], expected[name], check_dtype=False)
+
+
+def test_out_of_core_run_writes_the_same_migrate_csv(data_copy):
+    outputs = []
+    for name, orgs_chunk_size in (("in_memory", None), ("out_of_core", 250)):
+        data_path = data_copy(name)
+        with contextlib.redirect_stdout(io.StringIO()):
+            etl_pipeline(data_path, skip_unchanged=False, orgs_chunk_size=orgs_chunk_size)
+        outputs.append((data_path / "migrate.csv").read_bytes())
+
+    assert outputs[0] == outputs[1]
@@ -0,0 +1,99 @@
+import json
+from typing import Optional
+
+import pandas as pd
+import pytest
+from pydantic import ValidationError, create_model
+
+from src import loader
+from src.loader import load_model
+from src.models import Organization
+from src.validation import schema_fingerprint
+
+ORGS = [
+    {
+        "id": f"org_{i}",
+        "companyId": f"co_{i % 3}",
+        "modelIds": ["chatgpt"],
+        "promptLimit": 10 * i,
+        "promptsCount": i,
+        "chatIntervalInHours": 24,
+    }
+    for i in range(6)
+]
+
+
+def _write(path, records):
+    path.write_text(json.dumps(records))
+    return path
+
+
+def _counted(name: str, validate, calls: list):
+    def counted(*args, **kwargs):
+        calls.append(name)
+        return validate(*args, **kwargs)
+
+    return counted
+
+
+@pytest.fixture
+def validations(monkeypatch) -> list:
+    # Every validation pass the loader makes, by name
+    calls = []
+    for name in ("validate_json", "validate_records"):
+        monkeypatch.setattr(loader, name, _counted(name, getattr(loader, name), calls))
+    return calls
+
+
+@pytest.mark.parametrize("predicate", [None, lambda record: True], ids=["whole_file", "streamed"])
+def test_lenient_mode_drops_and_reports_invalid_records(tmp_path, predicate):
+    records = [dict(record) for record in ORGS]
+    records[1]["promptLimit"] = "many"
+    del records[4]["companyId"]
+    path = _write(tmp_path / "processed_organizations.json", records)
+
+    with pytest.raises(ValidationError):
+        load_model(path, Organization, predicate)
+    manifest = {}
+    df, rejects = load_model(path, Organization, predicate, mode="lenient", manifest=manifest, batch_size=4)
+
+    assert df["id"].tolist() == ["org_0", "org_2", "org_3", "org_5"]
+    assert df["prompt_limit"].tolist() == [0, 20, 30, 50]
+    assert [(r["file"], r["row"], r["id"], r["field"]) for r in rejects] == [
+        ("processed_organizations.json", 1, "org_1", "promptLimit"),
+        ("processed_organizations.json", 4, "org_4", "companyId"),
+    ]
+    # Files with rejects are not recorded as validated
+    assert manifest == {}
+
+
+def test_manifest_skips_validation_only_for_the_same_content_and_schema(tmp_path, validations):
+    path = _write(tmp_path / "processed_organizations.json", ORGS)
+    manifest = {}
+
+    validated, _ = load_model(path, Organization, manifest=manifest)
+    assert len(validations) == 1
+    assert manifest[path.name]["schema"] == schema_fingerprint(Organization)
+
+    # Same content and schema: read without validating, with the same result
+    skipped, _ = load_model(path, Organization, manifest=manifest)
+    assert len(validations) == 1
+    pd.testing.assert_frame_equal(skipped, validated)
+
+    # Changed content: validated again
+    _write(path, [dict(ORGS[0], promptsCount=99), *ORGS[1:]])
+    changed, _ = load_model(path, Organization, manifest=manifest)
+    assert len(validations) == 2
+    assert changed["prompts_count"].iloc[0] == 99
+    load_model(path, Organization, manifest=manifest)
+    assert len(validations) == 2
+
+    # Changed schema (a model of the same name with another field): validated again
+    extended = create_model("Organization", __base__=Organization, note=(Optional[str], None))
+    assert schema_fingerprint(extended) != schema_fingerprint(Organization)
+    load_model(path, extended, manifest=manifest)
+    assert len(validations) == 3
+    load_model(path, extended, manifest=manifest)
+    assert len(validations) == 3
+    load_model(path, Organization, manifest=manifest)
+    assert len(validations) == 4